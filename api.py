@@ -0,0 +1,221 @@
+from flask import Blueprint, jsonify, request, session, current_app
+from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime, timezone
+from functools import wraps
+import hashlib
+from models import db
+from pagination import paginate, prefix_filter, get_page_size
+
+api_routes = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Campos que se pueden pedir con fields=, orden permitido y filtros por
+# parámetro de cada recurso. `version` es el campo que cambia con cada edición
+# y `depends` las colecciones cuyo cambio (notify_change) también lo afecta:
+# cupos, créditos y borrados no tocan updated_at.
+RESOURCES = {
+    'students': {
+        'fields': ('name', 'student_code', 'email', 'photo', 'enrolled_credits',
+                   'created_at', 'updated_at'),
+        'sort': ('name', 'student_code', '_id'),
+        'filters': {'name': ('name', 'prefix'), 'code': ('student_code', 'prefix')},
+        'version': 'updated_at',
+        'depends': ('students', 'enrollments')
+    },
+    'teachers': {
+        'fields': ('name', 'age', 'email', 'subject_ids', 'titles', 'photo',
+                   'created_at', 'updated_at'),
+        'sort': ('name', '_id'),
+        'filters': {'name': ('name', 'prefix'), 'email': ('email', 'exact')},
+        'version': 'updated_at',
+        'depends': ('teachers',)
+    },
+    'subjects': {
+        'fields': ('name', 'schedule', 'credits', 'group', 'career', 'total_slots',
+                   'available_slots', 'teacher_id', 'created_at', 'updated_at'),
+        'sort': ('name', 'career', '_id'),
+        'filters': {'name': ('name', 'prefix'), 'career': ('career', 'exact'),
+                    'group': ('group', 'exact'), 'teacher_id': ('teacher_id', 'id')},
+        'version': 'updated_at',
+        'depends': ('subjects',)
+    },
+    'enrollments': {
+        'fields': ('student_id', 'subject_id', 'credits', 'enrollment_date'),
+        'sort': ('_id',),
+        'filters': {'student_id': ('student_id', 'id'), 'subject_id': ('subject_id', 'id')},
+        'version': 'enrollment_date',
+        'depends': ('enrollments',)
+    }
+}
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+@api_routes.errorhandler(ApiError)
+def handle_api_error(e):
+    return jsonify({'error': str(e)}), e.status
+
+
+def api_login_required(f):
+    # Igual que login_required pero responde 401 en vez de redirigir al login
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return jsonify({'error': 'Authentication required'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def to_json(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {('id' if key == '_id' else key): to_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [to_json(item) for item in value]
+    return value
+
+
+def parse_id(value):
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        raise ApiError(f'Invalid id: {value}')
+
+
+def get_resource(name):
+    if name not in RESOURCES:
+        raise ApiError(f'Unknown resource: {name}', 404)
+    return RESOURCES[name]
+
+
+def get_projection(resource, sort_field=None):
+    """Proyección de Mongo a partir de ?fields=; None devuelve todos los campos permitidos."""
+    requested = request.args.get('fields')
+    if requested:
+        fields = [field.strip() for field in requested.split(',') if field.strip()]
+        unknown = [field for field in fields if field not in resource['fields']]
+        if unknown:
+            raise ApiError(f"Unknown fields: {', '.join(unknown)}")
+    else:
+        fields = list(resource['fields'])
+
+    # El campo de versión y el de orden se leen siempre (ETag y cursor) y se
+    # quitan después si no se pidieron
+    projection = dict.fromkeys(fields, 1)
+    projection[resource['version']] = 1
+    if sort_field and sort_field != '_id':
+        projection[sort_field] = 1
+    return projection, set(fields)
+
+
+def get_query(resource):
+    query = {}
+    for param, (field, kind) in resource['filters'].items():
+        value = request.args.get(param)
+        if not value:
+            continue
+        if kind == 'prefix':
+            query[field] = prefix_filter(value)
+        elif kind == 'id':
+            query[field] = parse_id(value)
+        else:
+            query[field] = value
+    return query
+
+
+def to_utc(value):
+    # Las fechas se guardan con datetime.now() (hora local, sin zona); HTTP
+    # usa GMT, así que se convierten antes de enviarlas o compararlas
+    return value.astimezone(timezone.utc)
+
+
+def conditional_response(documents, resource, fields, build):
+    """Responde 304 si el cliente ya tiene esta versión; si no, serializa con `build`.
+
+    El ETag sale de los _id y del campo de versión de los documentos leídos,
+    de las versiones de las colecciones de `depends` y de los parámetros del
+    request, así que se calcula sin serializar nada.
+    """
+    versions, changed_at = current_app.extensions['collection_versions'].state(resource['depends'])
+    version_field = resource['version']
+    digest = hashlib.sha1(request.full_path.encode('utf-8'))
+    digest.update(repr(versions).encode('utf-8'))
+    last_modified = changed_at
+    for doc in documents:
+        version = doc.get(version_field)
+        digest.update(f"{doc['_id']}:{version}".encode('utf-8'))
+        if isinstance(version, datetime) and (last_modified is None or version > last_modified):
+            last_modified = version
+    etag = digest.hexdigest()
+    if last_modified:
+        last_modified = to_utc(last_modified).replace(microsecond=0)
+
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        since = request.if_modified_since
+        not_modified = bool(since and last_modified and
+                            last_modified <= since.replace(tzinfo=since.tzinfo or timezone.utc))
+
+    if not_modified:
+        response = current_app.response_class(status=304)
+    else:
+        for doc in documents:
+            for field in set(doc) - fields - {'_id'}:
+                del doc[field]
+        response = jsonify(build(documents))
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@api_routes.route('/<name>')
+@api_login_required
+def list_resource(name):
+    resource = get_resource(name)
+    sort_field = request.args.get('sort', resource['sort'][0])
+    if sort_field not in resource['sort']:
+        raise ApiError(f"sort must be one of: {', '.join(resource['sort'])}")
+    projection, fields = get_projection(resource, sort_field)
+
+    page = paginate(
+        db.db[name],
+        get_query(resource),
+        sort_field=sort_field,
+        direction=-1 if request.args.get('order') == 'desc' else 1,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        page_size=get_page_size(request.args,
+                                default=current_app.config['PAGE_SIZE'],
+                                maximum=current_app.config['MAX_PAGE_SIZE']),
+        projection=projection
+    )
+    # Los cursores se calculan antes de quitar los campos que no se pidieron
+    next_cursor, prev_cursor = page.next_cursor, page.prev_cursor
+
+    return conditional_response(page.items, resource, fields, lambda items: {
+        'data': to_json(items),
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor
+    })
+
+
+@api_routes.route('/<name>/<item_id>')
+@api_login_required
+def get_item(name, item_id):
+    resource = get_resource(name)
+    projection, fields = get_projection(resource)
+    document = db.db[name].find_one({'_id': parse_id(item_id)}, projection)
+    if document is None:
+        raise ApiError('Not found', 404)
+    return conditional_response([document], resource, fields,
+                                lambda items: {'data': to_json(items[0])})
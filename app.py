@@ -1,71 +1,353 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, DuplicateKeyError
+from flask import (Flask, Request, render_template, request, redirect, url_for, flash, jsonify,
+                   session, current_app)
+from pymongo.errors import DuplicateKeyError, PyMongoError
 from bson import ObjectId
 from dotenv import load_dotenv
 import os
+import threading
 from datetime import datetime
 from jinja2 import Environment
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from werkzeug.middleware.proxy_fix import ProxyFix
 import json
 from auth import login_required, admin_required
 from forms import RegistrationForm, LoginForm
-from utils import allowed_file, save_uploaded_file, generate_avatar
+from utils import (allowed_file, save_uploaded_file, generate_avatar, generate_avatars,
+                   generate_photo_variants, photo_variant_name, delete_photo, PHOTO_SIZES)
+from pagination import paginate, prefix_filter, get_page_size
+from loaders import get_loaders
+from importer import iter_json_array, run_import, require_text, require_int
+from jobs import ImportJobs, job_to_json
+from cache import notify_change, CollectionVersions
+from page_cache import PageCache
+from fanout import fan_out
+from search import Search, with_search_keys, backfill_search_keys, search_filter
+from telemetry import DatabaseSampler, growth_series, operation_rates
+from eventlog import EventLog
+import metrics
+from snapshots import DashboardSnapshot
+from rollups import ReportRollups
+from assets import Assets, build_assets, ONE_YEAR
+from indexes import INDEXES, IndexBuildError, audit_queries, index_name, missing_indexes
+from enrollment import EnrollmentEngine, EnrollmentError, AlreadyEnrolled
+from seed import seed_database
+from models import db as database
+import click
 
 load_dotenv()
 
+# Endpoints que reciben los archivos JSON de importación
+IMPORT_ENDPOINTS = {'import_teachers', 'import_subjects', 'import_students'}
+
+class UploadRequest(Request):
+    # Las importaciones tienen su propio límite, mayor que el de las fotos
+    @property
+    def max_content_length(self):
+        if self.endpoint in IMPORT_ENDPOINTS:
+            return current_app.config['IMPORT_MAX_CONTENT_LENGTH']
+        return current_app.config['MAX_CONTENT_LENGTH']
+
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.secret_key = os.getenv("SECRET_KEY", "secret-key-for-flash-messages")
 app.config['UPLOAD_FOLDER'] = os.path.join('static', 'uploads')
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif'}
 app.config['MAX_CONTENT_LENGTH'] = 2 * 1024 * 1024  # 2MB max
+app.config['PAGE_SIZE'] = int(os.getenv('PAGE_SIZE', 25))
+app.config['MAX_PAGE_SIZE'] = int(os.getenv('MAX_PAGE_SIZE', 100))
+app.config['IMPORT_BATCH_SIZE'] = int(os.getenv('IMPORT_BATCH_SIZE', 1000))
+app.config['IMPORT_FOLDER'] = os.getenv('IMPORT_FOLDER', 'imports')
+app.config['IMPORT_MAX_CONTENT_LENGTH'] = int(os.getenv('IMPORT_MAX_MB', 512)) * 1024 * 1024
+app.config['IMPORT_WORKERS'] = int(os.getenv('IMPORT_WORKERS', 2))
+app.config['JOB_STALE_SECONDS'] = int(os.getenv('JOB_STALE_SECONDS', 120))
+app.config['DASHBOARD_TTL'] = int(os.getenv('DASHBOARD_TTL', 30))
+app.config['DASHBOARD_EXACT_COUNTS'] = os.getenv('DASHBOARD_EXACT_COUNTS', 'true').lower() == 'true'
+app.config['PAGE_CACHE_ENABLED'] = os.getenv('PAGE_CACHE_ENABLED', 'true').lower() == 'true'
+app.config['PAGE_CACHE_MAX_BYTES'] = int(os.getenv('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+app.config['DB_SAMPLE_INTERVAL'] = int(os.getenv('DB_SAMPLE_INTERVAL', 60))
+app.config['DB_SAMPLES_MAX'] = int(os.getenv('DB_SAMPLES_MAX', 2880))
+app.config['EVENT_LOG_MAX_QUEUE'] = int(os.getenv('EVENT_LOG_MAX_QUEUE', 10000))
+app.config['EVENT_LOG_BATCH_SIZE'] = int(os.getenv('EVENT_LOG_BATCH_SIZE', 500))
+app.config['EVENT_LOG_FLUSH_SECONDS'] = float(os.getenv('EVENT_LOG_FLUSH_SECONDS', 2))
 app.jinja_env.globals.update(now=datetime.now)
 
-# Database connection setup
-uri = os.getenv("MONGO_URI")
-db_name = os.getenv("DB_NAME", "school_management")
-
-try:
-    client = MongoClient(uri)
-    db = client[db_name]
-    # Collections
-    users_col = db['users']
-    teachers_col = db['teachers']
-    subjects_col = db['subjects']
-    students_col = db['students']
-    enrollments_col = db['enrollments']
-    
-    # Create indexes
-    users_col.create_index('username', unique=True)
-    teachers_col.create_index('email', unique=True)
-    students_col.create_index('student_code', unique=True)
-    subjects_col.create_index([('name', 1), ('group', 1), ('career', 1)], unique=True)
-    
-    # Test the connection
-    client.admin.command('ping')
-    db_status = {
-        'connected': True,
-        'last_check': datetime.now(),
-        'server_info': client.server_info()
-    }
-    print("Successfully connected to MongoDB Atlas")
-except ConnectionFailure as e:
-    db_status = {
-        'connected': False,
-        'error': str(e),
-        'last_check': datetime.now()
-    }
-    print("Error connecting to MongoDB Atlas")
+# Cantidad de proxies de confianza delante de la app (nginx, balanceador):
+# con 1 o más, request.remote_addr sale de X-Forwarded-For
+app.config['TRUSTED_PROXIES'] = int(os.getenv('TRUSTED_PROXIES', 0))
+if app.config['TRUSTED_PROXIES']:
+    proxies = app.config['TRUSTED_PROXIES']
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies, x_host=proxies)
+
+# Latencia por ruta y comandos de Mongo atribuidos a cada endpoint (ver /metrics)
+metrics.init_app(app)
+
+# Assets con hash en el nombre (ver `flask build-assets`)
+assets = Assets(app)
+
+@app.after_request
+def cache_content_addressed_files(response):
+    # Las fotos subidas y los avatares se nombran por el hash de su
+    # contenido, así que su URL nunca cambia de contenido
+    if response.status_code == 200 and (
+            request.path.startswith('/static/uploads/') or
+            request.path.startswith('/static/avatars/avatar_')):
+        response.headers['Cache-Control'] = f'public, max-age={ONE_YEAR}, immutable'
+    return response
+
+# Database connection setup: un solo cliente (y un solo pool) compartido
+# con auth.py a través de models.db
+client = database.client
+db = database.db
+# Collections
+users_col = db['users']
+teachers_col = db['teachers']
+subjects_col = db['subjects']
+students_col = db['students']
+enrollments_col = db['enrollments']
+
+# Estado de la conexión: se llena por proceso en init_process() (nunca al
+# importar, para no conectarse antes de un fork) y lo refresca db_sampler
+db_status = {'connected': False, 'last_check': datetime.now()}
+
+def check_database():
+    # Actualiza db_status en el lugar: db_sampler guarda el mismo dict
+    try:
+        client.admin.command('ping')
+        db_status.pop('error', None)
+        db_status.update(connected=True, server_info=client.server_info())
+        print("Successfully connected to MongoDB Atlas")
+    except PyMongoError as e:
+        db_status.update(connected=False, error=str(e))
+        app.logger.error(f"Error connecting to MongoDB: {e}")
+    db_status['last_check'] = datetime.now()
+
+def create_missing_indexes(required_only=False):
+    """Crea los índices que faltan y anota en db_status los obligatorios ausentes.
+
+    Los obligatorios (los únicos, ver indexes.is_required) sostienen reglas de
+    los datos: si no se pueden crear (p. ej. matrículas repetidas) se registra
+    el error, el indicador de la barra lo muestra y las inscripciones quedan
+    bloqueadas hasta correr `flask dedupe-enrollments` y `flask create-indexes`.
+    """
+    try:
+        try:
+            created = database.create_indexes(required_only)
+        except IndexBuildError as e:
+            created = e.created
+            app.logger.error(f"Could not create indexes: {e}")
+        if created:
+            print(f"Created missing indexes: {', '.join(created)}")
+        missing = [index_name(collection, keys)
+                   for collection, keys, _ in missing_indexes(db, required_only=True)]
+    except PyMongoError as e:
+        app.logger.error(f"Could not check indexes: {e}")
+        return
+    if missing:
+        db_status['missing_indexes'] = missing
+        app.logger.error(f"Required indexes are missing: {', '.join(missing)}")
+    else:
+        db_status.pop('missing_indexes', None)
+
+# Estadísticas de la base tomadas en segundo plano; también refresca db_status
+db_sampler = DatabaseSampler(
+    client, db,
+    interval=app.config['DB_SAMPLE_INTERVAL'],
+    max_samples=app.config['DB_SAMPLES_MAX'],
+    status=db_status
+)
+
+_process_pid = None
+_process_lock = threading.Lock()
+
+def init_process():
+    """Arranque de cada proceso: carpeta de fotos, ping, índices obligatorios y muestreo.
+
+    Corre una vez por proceso (se repite en un hijo después de un fork) y no
+    falla si Mongo no responde: el muestreo vuelve a probar la conexión.
+    """
+    global _process_pid
+    if _process_pid == os.getpid():
+        return
+    with _process_lock:
+        if _process_pid == os.getpid():
+            return
+        _process_pid = os.getpid()
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+        check_database()
+        # Los índices obligatorios se revisan en todo arranque (flask run,
+        # gunicorn app:app, serve.py), no sólo desde create_app
+        if db_status['connected']:
+            create_missing_indexes(required_only=True)
+        db_sampler.ensure_started()
+
+@app.before_request
+def start_process():
+    init_process()
+
+def create_app():
+    """Devuelve la app lista para servir.
+
+    Los servidores que hacen fork (serve.py, gunicorn 'app:create_app()')
+    la llaman en cada worker después del fork, así cada proceso tiene su
+    propio pool de conexiones a Mongo y sus propios hilos. Los índices de
+    rendimiento que falten se crean aquí, nunca desde un request.
+    """
+    init_process()
+    create_missing_indexes()
+    return app
 
 # Context processor para inyectar db_status en todas las plantillas
 @app.context_processor
 def inject_db_status():
     return dict(db_status=db_status)
 
+dashboard_snapshot = DashboardSnapshot(
+    db,
+    ttl=app.config['DASHBOARD_TTL'],
+    exact_counts=app.config['DASHBOARD_EXACT_COUNTS']
+)
+
+report_rollups = ReportRollups(db)
+
+# Páginas renderizadas, válidas mientras no cambien las colecciones que muestran
+collection_versions = CollectionVersions(db['collection_versions'])
+# La API arma sus ETag con las mismas versiones
+app.extensions['collection_versions'] = collection_versions
+page_cache = PageCache(
+    collection_versions,
+    max_bytes=app.config['PAGE_CACHE_MAX_BYTES'],
+    enabled=app.config['PAGE_CACHE_ENABLED']
+)
+enrollment_engine = EnrollmentEngine(db)
+search_index = Search(db)
+
+# Errores y auditoría se encolan y un hilo los escribe por lotes (colecciones errors y audit_log)
+event_log = EventLog(
+    db,
+    max_queue=app.config['EVENT_LOG_MAX_QUEUE'],
+    batch_size=app.config['EVENT_LOG_BATCH_SIZE'],
+    flush_interval=app.config['EVENT_LOG_FLUSH_SECONDS']
+)
+
+def audit(action, collection, document_id=None, **details):
+    # Quién hizo el cambio sale de la sesión del request actual
+    event_log.audit(action, collection, document_id,
+                    user=session.get('username'), user_id=session.get('user_id'), **details)
+
+def changed_fields(before, after):
+    return sorted(key for key, value in after.items()
+                  if key not in ('updated_at', 'search_keys') and before.get(key) != value)
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recalcula desde cero los reportes pre-agregados."""
+    report_rollups.rebuild()
+    notify_change('report_rollups')
+    click.echo('Report rollups rebuilt.')
+
+@app.cli.command('create-indexes')
+def create_indexes_command():
+    """Crea los índices del registro que todavía no existen."""
+    try:
+        created = database.create_indexes()
+        failures = []
+    except IndexBuildError as e:
+        created, failures = e.created, e.failures
+    for name in created:
+        click.echo(f'Created {name}')
+    for name, error in failures:
+        click.echo(f'Failed {name}: {error}', err=True)
+    click.echo(f'{len(created)} indexes created, {len(failures)} failed, '
+               f'{len(INDEXES) - len(created) - len(failures)} already present.')
+    if failures:
+        click.echo('Duplicate enrollments can be removed with flask dedupe-enrollments.', err=True)
+        raise SystemExit(1)
+
+@app.cli.command('audit-indexes')
+def audit_indexes_command():
+    """Corre explain() sobre las consultas de las rutas y reporta las que necesitan un índice."""
+    results = audit_queries(db)
+    for row in results:
+        plan = ', '.join(row['indexes']) or '-'
+        click.echo(f"{row['collection']:<12} {row['name']:<26} {plan:<40} "
+                   f"{row['examined']}/{row['returned']} {' '.join(row['problems'])}")
+    failing = [f"{row['name']} ({', '.join(row['problems'])})" for row in results if row['problems']]
+    if failing:
+        click.echo(f"{len(failing)} queries need an index: {'; '.join(failing)}", err=True)
+        raise SystemExit(1)
+    click.echo('All audited queries use an index for their filter and sort.')
+
+@app.cli.command('generate-photo-variants')
+def generate_photo_variants_command():
+    """Genera las miniaturas que faltan de las fotos subidas antes del pipeline."""
+    folder = app.config['UPLOAD_FOLDER']
+    photos = set(teachers_col.distinct('photo')) | set(students_col.distinct('photo'))
+    generated = 0
+    for photo in photos:
+        if not photo or photo.startswith('avatar_'):
+            continue
+        if not os.path.exists(os.path.join(folder, photo)):
+            continue
+        if os.path.exists(os.path.join(folder, photo_variant_name(photo, 'profile', 'jpg'))):
+            continue
+        generate_photo_variants(photo, folder)
+        generated += 1
+    click.echo(f'Generated variants for {generated} photos.')
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Genera static/dist con los assets versionados y comprimidos."""
+    manifest = build_assets(app.static_folder)
+    assets.load()
+    click.echo(f'Built {len(manifest)} assets into static/dist.')
+
+@app.cli.command('backfill-credits')
+def backfill_credits_command():
+    """Recalcula los créditos matriculados (enrolled_credits) de cada estudiante."""
+    updated = enrollment_engine.backfill_credits()
+    click.echo(f'Updated enrolled_credits for {updated} students.')
+
+@app.cli.command('dedupe-enrollments')
+def dedupe_enrollments_command():
+    """Borra las matrículas repetidas para poder crear el índice único."""
+    removed = enrollment_engine.remove_duplicates()
+    if removed:
+        report_rollups.rebuild()
+        notify_change('enrollments', delta=-removed)
+        notify_change('subjects', 'students', 'report_rollups')
+    click.echo(f'Removed {removed} duplicate enrollments.')
+
+@app.cli.command('backfill-search-keys')
+def backfill_search_keys_command():
+    """Calcula search_keys en los documentos creados antes de la búsqueda."""
+    updated = backfill_search_keys(db)
+    click.echo(f'Updated search keys for {updated} documents.')
+
+@app.cli.command('seed')
+@click.option('--teachers', default=100, show_default=True)
+@click.option('--subjects', default=200, show_default=True)
+@click.option('--students', default=2000, show_default=True)
+@click.option('--enrollments', default=8000, show_default=True)
+@click.option('--batch-size', default=5000, show_default=True)
+@click.option('--seed', 'seed_value', default=42, show_default=True, help='Semilla del generador.')
+@click.option('--drop', is_flag=True, help='Borra profesores, materias, estudiantes y matrículas antes.')
+def seed_command(teachers, subjects, students, enrollments, batch_size, seed_value, drop):
+    """Inserta datos sintéticos para pruebas de carga."""
+    counts = seed_database(db, CAREERS, teachers=teachers, subjects=subjects,
+                          students=students, enrollments=enrollments,
+                          batch_size=batch_size, seed=seed_value, drop=drop,
+                          progress=click.echo)
+    create_missing_indexes()
+    report_rollups.rebuild()
+    notify_change('teachers', 'subjects', 'students', 'enrollments', 'report_rollups')
+    click.echo(', '.join(f'{count} {name}' for name, count in counts.items()) + ' seeded.')
+
 # Auth routes
 from auth import auth_routes
 app.register_blueprint(auth_routes)
+from api import api_routes
+app.register_blueprint(api_routes)
 
 @app.context_processor
 def inject_collections():
@@ -76,62 +358,161 @@ def inject_collections():
         enrollments_col=enrollments_col
     )
 
+@app.template_global()
+def photo_variant(photo, size, fmt):
+    # URL de una miniatura ya generada, o None si todavía no existe
+    if photo.startswith('avatar_') or size not in PHOTO_SIZES:
+        return None
+    variant = photo_variant_name(photo, size, fmt)
+    if not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], variant)):
+        return None
+    return url_for('static', filename='uploads/' + variant)
+
+@app.template_global()
+def photo_url(photo, size=None):
+    # Los avatares generados se comparten entre registros y viven aparte
+    # de las fotos subidas
+    if photo.startswith('avatar_'):
+        return url_for('static', filename='avatars/' + photo)
+    # Mientras se generan las miniaturas se usa el original
+    if size:
+        variant = photo_variant(photo, size, 'jpg')
+        if variant:
+            return variant
+    return url_for('static', filename='uploads/' + photo)
+
+def release_photo(photo):
+    # Las fotos se deduplican por contenido: sólo se borran si ya nadie las usa
+    if not photo or photo.startswith('avatar_'):
+        return
+    if teachers_col.count_documents({'photo': photo}, limit=1):
+        return
+    if students_col.count_documents({'photo': photo}, limit=1):
+        return
+    delete_photo(photo, app.config['UPLOAD_FOLDER'])
+
+@app.template_global()
+def modify_query(**changes):
+    # Construye la URL actual cambiando sólo algunos parámetros del query string
+    args = request.args.to_dict()
+    for key, value in changes.items():
+        if value is None:
+            args.pop(key, None)
+        else:
+            args[key] = value
+    return url_for(request.endpoint, **dict(request.view_args or {}, **args))
+
+def list_page(collection, query, sort_fields, pipeline=None, projection=None):
+    # Lee una sola página según los parámetros de orden y cursor del request
+    sort_field = request.args.get('sort', sort_fields[0])
+    if sort_field not in sort_fields:
+        sort_field = sort_fields[0]
+    direction = -1 if request.args.get('order') == 'desc' else 1
+    return paginate(
+        collection,
+        query,
+        sort_field=sort_field,
+        direction=direction,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        page_size=get_page_size(request.args,
+                                default=app.config['PAGE_SIZE'],
+                                maximum=app.config['MAX_PAGE_SIZE']),
+        projection=projection,
+        pipeline=pipeline
+    )
+
 @app.route('/')
 @login_required
 def dashboard():
-    # Get stats for dashboard
-    stats = {
-        'teachers': teachers_col.count_documents({}),
-        'students': students_col.count_documents({}),
-        'subjects': subjects_col.count_documents({}),
-        'enrollments': enrollments_col.count_documents({})
-    }
-    
-    # Get recent activities con el conteo de materias
-    recent_teachers = list(teachers_col.aggregate([
-        {
-            '$lookup': {
-                'from': 'subjects',
-                'localField': 'subject_ids',
-                'foreignField': '_id',
-                'as': 'subjects'
-            }
-        },
-        {
-            '$addFields': {
-                'subject_count': {'$size': '$subjects'}
-            }
-        },
-        {
-            '$sort': {'_id': -1}
-        },
-        {
-            '$limit': 5
-        },
-        {
-            '$project': {
-                'name': 1,
-                'email': 1,
-                'created_at': 1,
-                'subject_count': 1
-            }
-        }
-    ]))
-    
-    recent_students = list(students_col.find().sort('_id', -1).limit(5))
-    recent_subjects = list(subjects_col.find().sort('_id', -1).limit(5))
+    # Stats y actividades recientes desde el snapshot en memoria
+    snapshot = dashboard_snapshot.get()
     
     return render_template('dashboard.html', 
-                         stats=stats,
-                         recent_teachers=recent_teachers,
-                         recent_students=recent_students,
-                         recent_subjects=recent_subjects)
+                         stats=snapshot['stats'],
+                         recent_teachers=snapshot['recent_teachers'],
+                         recent_students=snapshot['recent_students'],
+                         recent_subjects=snapshot['recent_subjects'])
+
+# Search routes
+SEARCH_LABELS = {
+    'students': lambda doc: doc.get('student_code', ''),
+    'teachers': lambda doc: doc.get('email', ''),
+    'subjects': lambda doc: f"{doc.get('career', '')} - Grupo {doc.get('group', '')}"
+}
+
+@app.route('/search')
+@login_required
+def search():
+    # Búsqueda para el autocompletado de la barra de navegación
+    query = request.args.get('q', '').strip()
+    kinds = [kind for kind in request.args.get('type', '').split(',') if kind] or None
+    try:
+        limit = max(1, min(int(request.args.get('limit', 8)), 25))
+    except ValueError:
+        limit = 8
+
+    results = {}
+    for kind, docs in search_index.search(query, kinds, limit).items():
+        results[kind] = []
+        for doc in docs:
+            # Los no administradores van al listado filtrado en lugar de la edición
+            if session.get('is_admin'):
+                url = url_for(f'edit_{kind[:-1]}', **{f'{kind[:-1]}_id': str(doc['_id'])})
+            else:
+                url = url_for(f'show_{kind}', name=doc.get('name', ''))
+            results[kind].append({
+                'id': str(doc['_id']),
+                'name': doc.get('name', ''),
+                'detail': SEARCH_LABELS[kind](doc),
+                'url': url,
+                'fuzzy': doc.get('fuzzy', False)
+            })
+    return jsonify({'query': query, 'results': results})
+
+# Lookup para los selectores de materias y profesores de los formularios
+LOOKUP_FIELDS = {
+    'subjects': {'name': 1, 'career': 1, 'group': 1},
+    'teachers': {'name': 1, 'email': 1}
+}
+
+def lookup_item(kind, doc):
+    if kind == 'subjects':
+        label = f"{doc['name']} ({doc.get('career', '')} - {doc.get('group', '')})"
+    else:
+        label = f"{doc['name']} ({doc.get('email', '')})"
+    return {'id': str(doc['_id']), 'label': label}
+
+@app.route('/lookup/<kind>')
+@login_required
+@page_cache.cached('subjects', 'teachers')
+def lookup(kind):
+    if kind not in LOOKUP_FIELDS:
+        return jsonify({'error': 'Unknown lookup'}), 404
+    page = paginate(
+        db[kind],
+        search_filter(request.args.get('q', '')),
+        sort_field='name',
+        after=request.args.get('after'),
+        page_size=get_page_size(request.args, default=20, maximum=50),
+        projection=LOOKUP_FIELDS[kind]
+    )
+    return jsonify({
+        'items': [lookup_item(kind, doc) for doc in page],
+        'next_cursor': page.next_cursor
+    })
 
 # Teachers routes
 @app.route('/teachers')
 @login_required
+@page_cache.cached('teachers', 'subjects', 'photos')
 def show_teachers():
-    teachers = list(teachers_col.aggregate([
+    query = {}
+    if request.args.get('name'):
+        query['name'] = prefix_filter(request.args['name'])
+    
+    # El $lookup se ejecuta sólo sobre los profesores de la página
+    teachers = list_page(teachers_col, query, ['name', '_id'], pipeline=[
         {
             '$lookup': {
                 'from': 'subjects',
@@ -140,7 +521,7 @@ def show_teachers():
                 'as': 'subjects'
             }
         }
-    ]))
+    ])
     return render_template('teachers/list.html', teachers=teachers)
 
 @app.route('/teachers/add', methods=['GET', 'POST'])
@@ -158,9 +539,10 @@ def add_teacher():
                     flash(f'ID de materia no válido: {subject_id}', 'danger')
                     return redirect(url_for('add_teacher'))
             
-            # Validar que las materias existan
-            for subject_id in subject_ids:
-                if not subjects_col.find_one({'_id': subject_id}):
+            # Validar que las materias existan (una sola consulta para todas)
+            found = get_loaders(db).subjects.load_many(subject_ids)
+            for subject_id, subject in zip(subject_ids, found):
+                if not subject:
                     flash(f'Materia con ID {subject_id} no existe', 'danger')
                     return redirect(url_for('add_teacher'))
             
@@ -183,18 +565,20 @@ def add_teacher():
                 'updated_at': datetime.now()
             }
             
-            teachers_col.insert_one(new_teacher)
+            teachers_col.insert_one(with_search_keys('teachers', new_teacher))
+            notify_change('teachers', delta=1)
+            audit('create', 'teachers', new_teacher['_id'])
             flash('Profesor agregado exitosamente!', 'success')
             return redirect(url_for('show_teachers'))
         except Exception as e:
             flash(f'Error agregando profesor: {str(e)}', 'danger')
     
-    subjects = list(subjects_col.find({}, {'name': 1}))
-    return render_template('teachers/add.html', subjects=subjects)
+    return render_template('teachers/add.html')
 
 @app.route('/teachers/edit/<teacher_id>', methods=['GET', 'POST'])
 @login_required
 @admin_required
+@page_cache.cached('teachers', 'subjects', 'photos')
 def edit_teacher(teacher_id):
     teacher = teachers_col.find_one({'_id': ObjectId(teacher_id)})
     if not teacher:
@@ -222,12 +606,6 @@ def edit_teacher(teacher_id):
             
             # Manejar la carga de archivos
             if 'photo' in request.files and request.files['photo'].filename != '':
-                # Eliminar foto anterior si existe
-                if teacher.get('photo'):
-                    old_photo = os.path.join(app.config['UPLOAD_FOLDER'], teacher['photo'])
-                    if os.path.exists(old_photo):
-                        os.remove(old_photo)
-                
                 # Guardar nueva foto
                 update_data['photo'] = save_uploaded_file(
                     request.files['photo'], 
@@ -236,17 +614,23 @@ def edit_teacher(teacher_id):
             
             teachers_col.update_one(
                 {'_id': ObjectId(teacher_id)},
-                {'$set': update_data}
+                {'$set': with_search_keys('teachers', update_data)}
             )
+            # Eliminar foto anterior si ya no se usa
+            if 'photo' in update_data and teacher.get('photo') != update_data['photo']:
+                release_photo(teacher.get('photo'))
+            notify_change('teachers')
+            audit('update', 'teachers', teacher['_id'], fields=changed_fields(teacher, update_data))
             flash('Profesor actualizado exitosamente!', 'success')
             return redirect(url_for('show_teachers'))
         except Exception as e:
             flash(f'Error actualizando profesor: {str(e)}', 'danger')
     
-    subjects = list(subjects_col.find({}, {'name': 1}))
+    # Sólo las materias asignadas; las demás se buscan con /lookup/subjects
+    subjects = get_loaders(db).subjects.load_many(teacher.get('subject_ids', []))
     return render_template('teachers/edit.html',
                          teacher=teacher,
-                         subjects=subjects)
+                         selected_subjects=[lookup_item('subjects', s) for s in subjects if s])
 
 @app.route('/teachers/delete/<teacher_id>')
 @login_required
@@ -255,12 +639,6 @@ def delete_teacher(teacher_id):
     try:
         teacher = teachers_col.find_one({'_id': ObjectId(teacher_id)})
         if teacher:
-            # Delete photo if exists
-            if teacher.get('photo'):
-                photo_path = os.path.join(app.config['UPLOAD_FOLDER'], teacher['photo'])
-                if os.path.exists(photo_path):
-                    os.remove(photo_path)
-            
             # Remove teacher from subjects
             subjects_col.update_many(
                 {'teacher_id': ObjectId(teacher_id)},
@@ -269,7 +647,12 @@ def delete_teacher(teacher_id):
             
             # Delete teacher
             result = teachers_col.delete_one({'_id': ObjectId(teacher_id)})
+            # Delete photo if no one else uses it
+            release_photo(teacher.get('photo'))
+            notify_change('subjects')
             if result.deleted_count > 0:
+                notify_change('teachers', delta=-1)
+                audit('delete', 'teachers', teacher['_id'], name=teacher.get('name'))
                 flash('Teacher deleted successfully!', 'success')
             else:
                 flash('Teacher not found!', 'warning')
@@ -282,8 +665,17 @@ def delete_teacher(teacher_id):
 # Subjects routes
 @app.route('/subjects')
 @login_required
+@page_cache.cached('subjects', 'teachers')
 def show_subjects():
-    subjects = list(subjects_col.aggregate([
+    query = {}
+    if request.args.get('name'):
+        query['name'] = prefix_filter(request.args['name'])
+    if request.args.get('career'):
+        query['career'] = request.args['career']
+    if request.args.get('group'):
+        query['group'] = request.args['group']
+    
+    subjects = list_page(subjects_col, query, ['name', 'career', '_id'], pipeline=[
         {
             '$lookup': {
                 'from': 'teachers',
@@ -311,8 +703,8 @@ def show_subjects():
                 '_id': 1
             }
         }
-    ]))
-    return render_template('subjects/list.html', subjects=subjects)
+    ])
+    return render_template('subjects/list.html', subjects=subjects, careers=CAREERS)
 
 # Lista de carreras disponibles (puedes mover esto a la base de datos si lo prefieres)
 CAREERS = [
@@ -344,20 +736,21 @@ def add_subject():
                 'updated_at': datetime.now()
             }
             
-            result = subjects_col.insert_one(new_subject)
+            result = subjects_col.insert_one(with_search_keys('subjects', new_subject))
+            notify_change('subjects', delta=1)
+            report_rollups.on_subject_added(new_subject)
+            audit('create', 'subjects', result.inserted_id)
             flash('Materia agregada exitosamente!', 'success')
             return redirect(url_for('show_subjects'))
         except Exception as e:
             flash(f'Error agregando materia: {str(e)}', 'danger')
     
-    teachers = list(teachers_col.find({}, {'name': 1, '_id': 1}))
-    return render_template('subjects/add.html', 
-                         teachers=teachers,
-                         careers=CAREERS)
+    return render_template('subjects/add.html', careers=CAREERS)
 
 @app.route('/subjects/edit/<subject_id>', methods=['GET', 'POST'])
 @login_required
 @admin_required
+@page_cache.cached('subjects', 'teachers')
 def edit_subject(subject_id):
     subject = subjects_col.find_one({'_id': ObjectId(subject_id)})
     if not subject:
@@ -379,17 +772,20 @@ def edit_subject(subject_id):
             
             subjects_col.update_one(
                 {'_id': ObjectId(subject_id)},
-                {'$set': update_data}
+                {'$set': with_search_keys('subjects', update_data)}
             )
+            notify_change('subjects')
+            report_rollups.on_subject_changed(subject, dict(subject, **update_data))
+            audit('update', 'subjects', subject['_id'], fields=changed_fields(subject, update_data))
             flash('Materia actualizada exitosamente!', 'success')
             return redirect(url_for('show_subjects'))
         except Exception as e:
             flash(f'Error actualizando materia: {str(e)}', 'danger')
     
-    teachers = list(teachers_col.find({}, {'name': 1, '_id': 1}))
+    teacher = get_loaders(db).teachers.load(subject['teacher_id']) if subject.get('teacher_id') else None
     return render_template('subjects/edit.html', 
                          subject=subject, 
-                         teachers=teachers,
+                         selected_teachers=[lookup_item('teachers', teacher)] if teacher else [],
                          careers=CAREERS)
 
 @app.route('/subjects/delete/<subject_id>')
@@ -403,8 +799,11 @@ def delete_subject(subject_id):
             flash('Cannot delete subject with active enrollments!', 'danger')
             return redirect(url_for('show_subjects'))
         
-        result = subjects_col.delete_one({'_id': ObjectId(subject_id)})
-        if result.deleted_count > 0:
+        subject = subjects_col.find_one_and_delete({'_id': ObjectId(subject_id)})
+        if subject:
+            notify_change('subjects', delta=-1)
+            report_rollups.on_subject_removed(subject)
+            audit('delete', 'subjects', subject['_id'], name=subject.get('name'))
             flash('Subject deleted successfully!', 'success')
         else:
             flash('Subject not found!', 'warning')
@@ -415,13 +814,21 @@ def delete_subject(subject_id):
 # Students routes
 @app.route('/students')
 @login_required
+@page_cache.cached('students', 'enrollments', 'photos')
 def show_students():
-    # Obtener estudiantes y contar sus matrículas
-    students = list(students_col.find())
+    query = {}
+    if request.args.get('name'):
+        query['name'] = prefix_filter(request.args['name'])
+    if request.args.get('code'):
+        query['student_code'] = prefix_filter(request.args['code'])
+    
+    # Obtener una página de estudiantes y contar sus matrículas
+    students = list_page(students_col, query, ['name', 'student_code', '_id'])
     
-    # Agregar conteo de matrículas a cada estudiante
-    for student in students:
-        student['enrollments_count'] = enrollments_col.count_documents({'student_id': student['_id']})
+    # Agregar conteo de matrículas a cada estudiante con un solo $group
+    counts = get_loaders(db).enrollment_counts.load_many(s['_id'] for s in students)
+    for student, count in zip(students, counts):
+        student['enrollments_count'] = count
     
     return render_template('students/list.html', students=students)
 
@@ -442,11 +849,14 @@ def add_student():
                 'student_code': request.form['student_code'],
                 'email': request.form['email'],
                 'photo': photo_filename,
+                'enrolled_credits': 0,
                 'created_at': datetime.now(),
                 'updated_at': datetime.now()
             }
             
-            result = students_col.insert_one(new_student)
+            result = students_col.insert_one(with_search_keys('students', new_student))
+            notify_change('students', delta=1)
+            audit('create', 'students', result.inserted_id)
             flash('Student added successfully!', 'success')
             return redirect(url_for('show_students'))
         except DuplicateKeyError:
@@ -459,6 +869,7 @@ def add_student():
 @app.route('/students/edit/<student_id>', methods=['GET', 'POST'])
 @login_required
 @admin_required
+@page_cache.cached('students', 'enrollments', 'subjects', 'teachers', 'photos')
 def edit_student(student_id):
     student = students_col.find_one({'_id': ObjectId(student_id)})
     if not student:
@@ -477,58 +888,60 @@ def edit_student(student_id):
             if 'photo' in request.files:
                 file = request.files['photo']
                 if file and allowed_file(file.filename):
-                    # Delete old photo if exists
-                    if student.get('photo'):
-                        old_photo_path = os.path.join(app.config['UPLOAD_FOLDER'], student['photo'])
-                        if os.path.exists(old_photo_path):
-                            os.remove(old_photo_path)
                     # Save new photo
                     update_data['photo'] = save_uploaded_file(file, app.config['UPLOAD_FOLDER'])
             
             students_col.update_one(
                 {'_id': ObjectId(student_id)},
-                {'$set': update_data}
+                {'$set': with_search_keys('students', update_data)}
             )
+            # Delete old photo if no one else uses it
+            if 'photo' in update_data and student.get('photo') != update_data['photo']:
+                release_photo(student.get('photo'))
+            notify_change('students')
+            audit('update', 'students', student['_id'], fields=changed_fields(student, update_data))
             flash('Student updated successfully!', 'success')
             return redirect(url_for('show_students'))
         except Exception as e:
             flash(f'Error updating student: {str(e)}', 'danger')
     
-    # Get student's enrollments with subject details
-    enrollments = list(enrollments_col.aggregate([
-        {'$match': {'student_id': ObjectId(student_id)}},
-        {
-            '$lookup': {
-                'from': 'subjects',
-                'localField': 'subject_id',
-                'foreignField': '_id',
-                'as': 'subject'
-            }
-        },
-        {'$unwind': '$subject'}
-    ]))
+    # Matrículas y materias con cupo se consultan en paralelo; las materias
+    # ya matriculadas se descartan después
+    results = fan_out({
+        # Get student's enrollments with subject details
+        'enrollments': lambda: list(enrollments_col.aggregate([
+            {'$match': {'student_id': ObjectId(student_id)}},
+            {
+                '$lookup': {
+                    'from': 'subjects',
+                    'localField': 'subject_id',
+                    'foreignField': '_id',
+                    'as': 'subject'
+                }
+            },
+            {'$unwind': '$subject'}
+        ])),
+        # Get available subjects for enrollment
+        'available_subjects': lambda: list(subjects_col.aggregate([
+            {'$match': {'available_slots': {'$gt': 0}}},
+            {
+                '$lookup': {
+                    'from': 'teachers',
+                    'localField': 'teacher_id',
+                    'foreignField': '_id',
+                    'as': 'teacher'
+                }
+            },
+            {'$unwind': {'path': '$teacher', 'preserveNullAndEmptyArrays': True}}
+        ]))
+    })
+    enrollments = results['enrollments']
+    enrolled_ids = {e['subject_id'] for e in enrollments}
+    available_subjects = [s for s in results['available_subjects'] if s['_id'] not in enrolled_ids]
     
     # Calculate total credits
-    total_credits = sum(enrollment['subject']['credits'] for enrollment in enrollments)
-    
-    # Get available subjects for enrollment
-    available_subjects = list(subjects_col.aggregate([
-        {
-            '$match': {
-                '_id': {'$nin': [e['subject_id'] for e in enrollments]},
-                'available_slots': {'$gt': 0}
-            }
-        },
-        {
-            '$lookup': {
-                'from': 'teachers',
-                'localField': 'teacher_id',
-                'foreignField': '_id',
-                'as': 'teacher'
-            }
-        },
-        {'$unwind': {'path': '$teacher', 'preserveNullAndEmptyArrays': True}}
-    ]))
+    total_credits = sum(enrollment.get('credits', enrollment['subject']['credits'])
+                        for enrollment in enrollments)
     
     return render_template('students/edit.html', 
                          student=student, 
@@ -543,18 +956,20 @@ def delete_student(student_id):
     try:
         student = students_col.find_one({'_id': ObjectId(student_id)})
         if student:
-            # Delete photo if exists
-            if student.get('photo'):
-                photo_path = os.path.join(app.config['UPLOAD_FOLDER'], student['photo'])
-                if os.path.exists(photo_path):
-                    os.remove(photo_path)
-            
             # Delete enrollments
-            enrollments_col.delete_many({'student_id': ObjectId(student_id)})
+            credits_before = enrollment_engine.student_credits(ObjectId(student_id))
+            removed = enrollments_col.delete_many({'student_id': ObjectId(student_id)})
+            notify_change('enrollments', delta=-removed.deleted_count)
             
             # Delete student
             result = students_col.delete_one({'_id': ObjectId(student_id)})
+            # Delete photo if no one else uses it
+            release_photo(student.get('photo'))
             if result.deleted_count > 0:
+                notify_change('students', delta=-1)
+                report_rollups.on_student_removed(credits_before)
+                audit('delete', 'students', student['_id'], name=student.get('name'),
+                      enrollments_removed=removed.deleted_count)
                 flash('Student deleted successfully!', 'success')
             else:
                 flash('Student not found!', 'warning')
@@ -570,59 +985,20 @@ def delete_student(student_id):
 @admin_required
 def enroll_student(student_id, subject_id):
     try:
-        # Check if student is already enrolled
-        existing_enrollment = enrollments_col.find_one({
-            'student_id': ObjectId(student_id),
-            'subject_id': ObjectId(subject_id)
-        })
-        
-        if existing_enrollment:
-            flash('Student is already enrolled in this subject!', 'warning')
-            return redirect(url_for('edit_student', student_id=student_id))
-        
-        # Get subject to check credits and available slots
-        subject = subjects_col.find_one({'_id': ObjectId(subject_id)})
-        if not subject:
-            flash('Subject not found!', 'danger')
-            return redirect(url_for('edit_student', student_id=student_id))
-        
-        # Check available slots
-        if subject['available_slots'] <= 0:
-            flash('No available slots in this subject!', 'danger')
-            return redirect(url_for('edit_student', student_id=student_id))
-        
-        # Check student's total credits
-        student_enrollments = list(enrollments_col.find({'student_id': ObjectId(student_id)}))
-        enrolled_subjects = list(subjects_col.find({
-            '_id': {'$in': [e['subject_id'] for e in student_enrollments]}
-        }))
-        
-        total_credits = sum(subj['credits'] for subj in enrolled_subjects)
-        if total_credits + subject['credits'] > 20:
-            flash('Student cannot exceed 20 credits!', 'danger')
-            return redirect(url_for('edit_student', student_id=student_id))
-        
-        # Create enrollment
-        enrollment = {
-            'student_id': ObjectId(student_id),
-            'subject_id': ObjectId(subject_id),
-            'enrollment_date': datetime.now()
-        }
-        
-        # Start transaction
-        with client.start_session() as session:
-            with session.start_transaction():
-                # Add enrollment
-                enrollments_col.insert_one(enrollment, session=session)
-                
-                # Update available slots
-                subjects_col.update_one(
-                    {'_id': ObjectId(subject_id)},
-                    {'$inc': {'available_slots': -1}},
-                    session=session
-                )
+        # Cupo, créditos y duplicado se validan con escrituras condicionales
+        result = enrollment_engine.enroll(ObjectId(student_id), ObjectId(subject_id))
         
+        notify_change('enrollments', delta=1)
+        notify_change('subjects')
+        report_rollups.on_enrollment_changed(result.subject, -1, result.credits_before,
+                                             result.credits_after)
+        audit('enroll', 'enrollments', student_id=ObjectId(student_id),
+              subject_id=ObjectId(subject_id))
         flash('Student enrolled successfully!', 'success')
+    except AlreadyEnrolled as e:
+        flash(str(e), 'warning')
+    except EnrollmentError as e:
+        flash(str(e), 'danger')
     except Exception as e:
         flash(f'Error enrolling student: {str(e)}', 'danger')
     
@@ -633,295 +1009,367 @@ def enroll_student(student_id, subject_id):
 @admin_required
 def unenroll_student(student_id, subject_id):
     try:
-        # Start transaction
-        with client.start_session() as session:
-            with session.start_transaction():
-                # Remove enrollment
-                result = enrollments_col.delete_one({
-                    'student_id': ObjectId(student_id),
-                    'subject_id': ObjectId(subject_id)
-                }, session=session)
-                
-                if result.deleted_count > 0:
-                    # Update available slots
-                    subjects_col.update_one(
-                        {'_id': ObjectId(subject_id)},
-                        {'$inc': {'available_slots': 1}},
-                        session=session
-                    )
-                    flash('Student unenrolled successfully!', 'success')
-                else:
-                    flash('Enrollment not found!', 'warning')
+        result = enrollment_engine.unenroll(ObjectId(student_id), ObjectId(subject_id))
+        if result:
+            notify_change('enrollments', delta=-1)
+            notify_change('subjects')
+            if result.subject:
+                report_rollups.on_enrollment_changed(result.subject, 1, result.credits_before,
+                                                     result.credits_after)
+            audit('unenroll', 'enrollments', student_id=ObjectId(student_id),
+                  subject_id=ObjectId(subject_id))
+            flash('Student unenrolled successfully!', 'success')
+        else:
+            flash('Enrollment not found!', 'warning')
     except Exception as e:
         flash(f'Error unenrolling student: {str(e)}', 'danger')
     
     return redirect(url_for('edit_student', student_id=student_id))
 
+def parse_object_ids(values):
+    if isinstance(values, str):
+        values = [values]
+    return [ObjectId(value) for value in values or []]
+
+@app.route('/enroll/bulk', methods=['POST'])
+@login_required
+@admin_required
+def bulk_enroll():
+    # Dos formas: un estudiante en N materias (student_id + subject_ids)
+    # o N estudiantes en una materia (subject_id + student_ids)
+    data = request.get_json(silent=True) if request.is_json else None
+    if data is None:
+        data = {
+            'student_id': request.form.get('student_id'),
+            'subject_id': request.form.get('subject_id'),
+            'student_ids': request.form.getlist('student_ids'),
+            'subject_ids': request.form.getlist('subject_ids')
+        }
+    
+    try:
+        if data.get('student_id') and data.get('subject_ids'):
+            student_id = ObjectId(data['student_id'])
+            pairs = [(student_id, sid) for sid in parse_object_ids(data['subject_ids'])]
+        elif data.get('subject_id') and data.get('student_ids'):
+            subject_id = ObjectId(data['subject_id'])
+            pairs = [(sid, subject_id) for sid in parse_object_ids(data['student_ids'])]
+        else:
+            raise ValueError('Send student_id with subject_ids, or subject_id with student_ids')
+    except Exception as e:
+        if request.is_json:
+            return jsonify({'error': str(e)}), 400
+        flash(f'Invalid bulk enrollment: {str(e)}', 'danger')
+        return redirect(request.referrer or url_for('show_students'))
+    
+    try:
+        result = enrollment_engine.enroll_many(pairs)
+    except EnrollmentError as e:
+        if request.is_json:
+            return jsonify({'error': str(e)}), 409
+        flash(str(e), 'danger')
+        return redirect(request.referrer or url_for('show_students'))
+    
+    if result.enrolled:
+        notify_change('enrollments', delta=result.enrolled)
+        notify_change('subjects')
+        report_rollups.on_bulk_enrollment(result)
+        audit('bulk_enroll', 'enrollments',
+              pairs=[[doc['student_id'], doc['subject_id']] for doc in result.inserts])
+    
+    if request.is_json:
+        return jsonify({
+            'enrolled': result.enrolled,
+            'failed': len(result.results) - result.enrolled,
+            'results': [
+                dict(row, student_id=str(row['student_id']), subject_id=str(row['subject_id']))
+                for row in result.results
+            ]
+        })
+    
+    failed = [row for row in result.results if row['error']][:10]
+    flash(f'{result.enrolled} enrollments created.', 'success' if not failed else 'warning')
+    # Cada fila fallida se nombra por el lado que varía: la materia o el estudiante
+    if data.get('subject_ids'):
+        key, collection, label = 'subject_id', subjects_col, lambda d: f"{d['name']} ({d.get('group', '')})"
+    else:
+        key, collection, label = 'student_id', students_col, lambda d: f"{d['name']} ({d.get('student_code', '')})"
+    names = {doc['_id']: label(doc) for doc in collection.find(
+        {'_id': {'$in': [row[key] for row in failed]}},
+        {'name': 1, 'group': 1, 'student_code': 1}
+    )} if failed else {}
+    for row in failed:
+        flash(f"{names.get(row[key], row[key])}: {row['error']}", 'danger')
+    return redirect(request.referrer or url_for('show_students'))
+
 # Bulk import routes
+def prepare_teacher(record):
+    teacher = dict(record)
+    teacher['name'] = require_text(record, 'name')
+    teacher['email'] = require_text(record, 'email')
+    if 'age' in record:
+        teacher['age'] = require_int(record, 'age', minimum=18)
+    
+    # Generate avatar if no photo provided
+    if not teacher.get('photo'):
+        teacher['photo'] = generate_avatar(teacher['name'])
+    
+    teacher['created_at'] = datetime.now()
+    teacher['updated_at'] = datetime.now()
+    return with_search_keys('teachers', teacher)
+
+def prepare_subject(record):
+    subject = dict(record)
+    subject['name'] = require_text(record, 'name')
+    subject['group'] = require_text(record, 'group')
+    subject['career'] = require_text(record, 'career')
+    subject['credits'] = require_int(record, 'credits', minimum=1)
+    subject['total_slots'] = require_int(record, 'total_slots', minimum=0)
+    
+    # Set teacher_id if provided (ya resuelto por lote en before_batch)
+    if subject.get('teacher_email'):
+        teacher = get_loaders(db).teachers_by_email.load(subject['teacher_email'])
+        if teacher:
+            subject['teacher_id'] = teacher['_id']
+    subject.pop('teacher_email', None)
+    
+    subject['available_slots'] = subject['total_slots']
+    subject['created_at'] = datetime.now()
+    subject['updated_at'] = datetime.now()
+    return with_search_keys('subjects', subject)
+
+def prime_subject_teachers(records):
+    # Resolver los profesores de todo el lote en una sola consulta
+    teacher_loader = get_loaders(db).teachers_by_email
+    teacher_loader.want(*[r.get('teacher_email') for r in records])
+    teacher_loader.dispatch()
+
+def prime_avatars(records):
+    # Generar en paralelo los avatares de todo el lote que no trae foto
+    pending = [
+        r for r in records
+        if not r.get('photo') and isinstance(r.get('name'), str) and r['name'].strip()
+    ]
+    for record, filename in zip(pending, generate_avatars([r['name'] for r in pending])):
+        record['photo'] = filename
+
+def prepare_student(record):
+    student = dict(record)
+    student['name'] = require_text(record, 'name')
+    student['student_code'] = require_text(record, 'student_code')
+    student['email'] = require_text(record, 'email')
+    student['enrolled_credits'] = 0
+    
+    # Generate avatar if no photo provided
+    if not student.get('photo'):
+        student['photo'] = generate_avatar(student['name'])
+    
+    student['created_at'] = datetime.now()
+    student['updated_at'] = datetime.now()
+    return with_search_keys('students', student)
+
+def import_handler(collection, prepare, before_batch=None, after_import=None):
+    # Procesa el archivo guardado de un trabajo de importación
+    def handler(path, skip, report, on_progress, job_id=None):
+        inserted_before = report.inserted
+        try:
+            with open(path, 'rb') as file:
+                report = run_import(
+                    collection,
+                    iter_json_array(file),
+                    prepare,
+                    batch_size=app.config['IMPORT_BATCH_SIZE'],
+                    before_batch=before_batch,
+                    skip=skip,
+                    report=report,
+                    on_progress=on_progress,
+                    job_id=job_id
+                )
+        finally:
+            # También si falla a mitad: los lotes ya escritos cambian los datos.
+            # Primero los reportes derivados, luego el aviso que invalida los caches
+            if report.inserted > inserted_before:
+                if after_import:
+                    after_import()
+                notify_change(collection.name, delta=report.inserted - inserted_before)
+        return report
+    return handler
+
+import_jobs = ImportJobs(
+    db['jobs'],
+    app.config['IMPORT_FOLDER'],
+    max_workers=app.config['IMPORT_WORKERS'],
+    stale_after=app.config['JOB_STALE_SECONDS'],
+    context=app.app_context
+)
+import_jobs.register('teachers', import_handler(teachers_col, prepare_teacher,
+                                                before_batch=prime_avatars))
+import_jobs.register('subjects', import_handler(subjects_col, prepare_subject,
+                                                before_batch=prime_subject_teachers,
+                                                after_import=report_rollups.rebuild))
+import_jobs.register('students', import_handler(students_col, prepare_student,
+                                                before_batch=prime_avatars))
+
+def wants_json():
+    return request.accept_mimetypes.best == 'application/json'
+
+def handle_import(kind, template):
+    # Guarda el archivo y encola la importación; el progreso se consulta
+    # luego por JSON desde la misma página
+    try:
+        if 'file' not in request.files:
+            flash('No file selected!', 'danger')
+            return redirect(request.url)
+        
+        file = request.files['file']
+        if file.filename == '':
+            flash('No file selected!', 'danger')
+            return redirect(request.url)
+        
+        if not allowed_file(file.filename, extensions={'json'}):
+            flash('Invalid file type! Only JSON files are allowed.', 'danger')
+            return render_template(template)
+        
+        job_id = import_jobs.submit(kind, file, user_id=session.get('user_id'))
+        audit('import', kind, job_id=job_id, filename=file.filename)
+    except Exception as e:
+        app.logger.error(f"Error importing {kind}: {str(e)}")
+        flash(f'Error importing {kind}: {str(e)}', 'danger')
+        return render_template(template)
+    
+    if wants_json():
+        return jsonify({'job_id': str(job_id)}), 202
+    return redirect(url_for(request.endpoint, job=str(job_id)))
+
 @app.route('/import/teachers', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def import_teachers():
     if request.method == 'POST':
-        try:
-            if 'file' not in request.files:
-                flash('No file selected!', 'danger')
-                return redirect(request.url)
-            
-            file = request.files['file']
-            if file.filename == '':
-                flash('No file selected!', 'danger')
-                return redirect(request.url)
-            
-            if file and allowed_file(file.filename, extensions={'json'}):
-                data = json.load(file)
-                
-                if not isinstance(data, list):
-                    flash('JSON file should contain an array of teachers!', 'danger')
-                    return redirect(request.url)
-                
-                # Process each teacher
-                inserted_count = 0
-                for teacher_data in data:
-                    try:
-                        # Generate avatar if no photo provided
-                        if not teacher_data.get('photo'):
-                            teacher_data['photo'] = generate_avatar(teacher_data['name'])
-                        
-                        teacher_data['created_at'] = datetime.now()
-                        teacher_data['updated_at'] = datetime.now()
-                        
-                        teachers_col.insert_one(teacher_data)
-                        inserted_count += 1
-                    except DuplicateKeyError:
-                        continue
-                    except Exception as e:
-                        app.logger.error(f"Error importing teacher: {str(e)}")
-                        continue
-                
-                flash(f'Successfully imported {inserted_count} teachers!', 'success')
-                return redirect(url_for('show_teachers'))
-            else:
-                flash('Invalid file type! Only JSON files are allowed.', 'danger')
-        except Exception as e:
-            flash(f'Error importing teachers: {str(e)}', 'danger')
+        return handle_import('teachers', 'import/teachers.html')
     
-    return render_template('import/teachers.html')
+    return render_template('import/teachers.html', job_id=request.args.get('job'))
 
 @app.route('/import/subjects', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def import_subjects():
     if request.method == 'POST':
-        try:
-            if 'file' not in request.files:
-                flash('No file selected!', 'danger')
-                return redirect(request.url)
-            
-            file = request.files['file']
-            if file.filename == '':
-                flash('No file selected!', 'danger')
-                return redirect(request.url)
-            
-            if file and allowed_file(file.filename, extensions={'json'}):
-                data = json.load(file)
-                
-                if not isinstance(data, list):
-                    flash('JSON file should contain an array of subjects!', 'danger')
-                    return redirect(request.url)
-                
-                # Process each subject
-                inserted_count = 0
-                for subject_data in data:
-                    try:
-                        # Set teacher_id if provided
-                        if subject_data.get('teacher_email'):
-                            teacher = teachers_col.find_one({'email': subject_data['teacher_email']})
-                            if teacher:
-                                subject_data['teacher_id'] = teacher['_id']
-                            del subject_data['teacher_email']
-                        
-                        subject_data['available_slots'] = subject_data['total_slots']
-                        subject_data['created_at'] = datetime.now()
-                        subject_data['updated_at'] = datetime.now()
-                        
-                        subjects_col.insert_one(subject_data)
-                        inserted_count += 1
-                    except Exception as e:
-                        app.logger.error(f"Error importing subject: {str(e)}")
-                        continue
-                
-                flash(f'Successfully imported {inserted_count} subjects!', 'success')
-                return redirect(url_for('show_subjects'))
-            else:
-                flash('Invalid file type! Only JSON files are allowed.', 'danger')
-        except Exception as e:
-            flash(f'Error importing subjects: {str(e)}', 'danger')
+        return handle_import('subjects', 'import/subjects.html')
     
-    return render_template('import/subjects.html')
+    return render_template('import/subjects.html', job_id=request.args.get('job'))
 
 @app.route('/import/students', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def import_students():
     if request.method == 'POST':
-        try:
-            if 'file' not in request.files:
-                flash('No file selected!', 'danger')
-                return redirect(request.url)
-            
-            file = request.files['file']
-            if file.filename == '':
-                flash('No file selected!', 'danger')
-                return redirect(request.url)
-            
-            if file and allowed_file(file.filename, extensions={'json'}):
-                data = json.load(file)
-                
-                if not isinstance(data, list):
-                    flash('JSON file should contain an array of students!', 'danger')
-                    return redirect(request.url)
-                
-                # Process each student
-                inserted_count = 0
-                for student_data in data:
-                    try:
-                        # Generate avatar if no photo provided
-                        if not student_data.get('photo'):
-                            student_data['photo'] = generate_avatar(student_data['name'])
-                        
-                        student_data['created_at'] = datetime.now()
-                        student_data['updated_at'] = datetime.now()
-                        
-                        students_col.insert_one(student_data)
-                        inserted_count += 1
-                    except DuplicateKeyError:
-                        continue
-                    except Exception as e:
-                        app.logger.error(f"Error importing student: {str(e)}")
-                        continue
-                
-                flash(f'Successfully imported {inserted_count} students!', 'success')
-                return redirect(url_for('show_students'))
-            else:
-                flash('Invalid file type! Only JSON files are allowed.', 'danger')
-        except Exception as e:
-            flash(f'Error importing students: {str(e)}', 'danger')
+        return handle_import('students', 'import/students.html')
     
-    return render_template('import/students.html')
+    return render_template('import/students.html', job_id=request.args.get('job'))
+
+@app.route('/import/jobs/<job_id>')
+@login_required
+@admin_required
+def import_job_status(job_id):
+    try:
+        job = import_jobs.get(job_id)
+    except Exception:
+        job = None
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_to_json(job))
+
+@app.route('/import/jobs/<job_id>/cancel', methods=['POST'])
+@login_required
+@admin_required
+def cancel_import_job(job_id):
+    if not import_jobs.cancel(job_id):
+        return jsonify({'error': 'Job is not running'}), 409
+    return jsonify(job_to_json(import_jobs.get(job_id)))
+
+@app.route('/import/jobs/<job_id>/resume', methods=['POST'])
+@login_required
+@admin_required
+def resume_import_job(job_id):
+    if not import_jobs.resume(job_id):
+        return jsonify({'error': 'Job cannot be resumed'}), 409
+    return jsonify(job_to_json(import_jobs.get(job_id)))
 
 # Reports and charts
 @app.route('/reports')
 @login_required
 @admin_required
+@page_cache.cached('subjects', 'students', 'enrollments', 'report_rollups')
 def reports():
-    # Asegúrate que estas consultas devuelven datos
-    subjects_by_career = list(subjects_col.aggregate([
-        {'$group': {'_id': '$career', 'count': {'$sum': 1}}},
-        {'$sort': {'count': -1}}
-    ]))
-    
-    students_by_credits = list(enrollments_col.aggregate([
-        {
-            '$lookup': {
-                'from': 'subjects',
-                'localField': 'subject_id',
-                'foreignField': '_id',
-                'as': 'subject'
-            }
-        },
-        {'$unwind': '$subject'},
-        {
-            '$group': {
-                '_id': '$student_id',
-                'total_credits': {'$sum': '$subject.credits'}
-            }
-        },
-        {
-            '$group': {
-                '_id': {
-                    '$switch': {
-                        'branches': [
-                            {'case': {'$lte': ['$total_credits', 10]}, 'then': '0-10'},
-                            {'case': {'$lte': ['$total_credits', 15]}, 'then': '11-15'},
-                            {'case': {'$lte': ['$total_credits', 20]}, 'then': '16-20'}
-                        ],
-                        'default': '20+'
-                    }
-                },
-                'count': {'$sum': 1}
-            }
-        }
-    ]))
-    
-    subjects_by_slots = list(subjects_col.aggregate([
-        {
-            '$group': {
-                '_id': {
-                    '$switch': {
-                        'branches': [
-                            {'case': {'$eq': ['$available_slots', 0]}, 'then': 'Full'},
-                            {'case': {'$lte': ['$available_slots', 5]}, 'then': '1-5'},
-                            {'case': {'$lte': ['$available_slots', 10]}, 'then': '6-10'},
-                            {'case': {'$gt': ['$available_slots', 10]}, 'then': '10+'}
-                        ],
-                        'default': 'Unknown'
-                    }
-                },
-                'count': {'$sum': 1}
-            }
-        }
-    ]))
+    # Los reportes se leen pre-agregados desde report_rollups
+    rollups = report_rollups.get()
     
     return render_template('reports/index.html',
-                         subjects_by_career=subjects_by_career,
-                         students_by_credits=students_by_credits,
-                         subjects_by_slots=subjects_by_slots)
+                         subjects_by_career=rollups['subjects_by_career'],
+                         students_by_credits=rollups['students_by_credits'],
+                         subjects_by_slots=rollups['subjects_by_slots'])
 
 @app.route('/database-info')
 @login_required
 @admin_required
 def database_info():
     try:
-        # Get active sessions
-        sessions = list(client.admin.command('currentOp')['inprog'])
-        # Get collection stats for each collection
-        collections_stats = {
-            'teachers': db.command('collstats', 'teachers'),
-            'students': db.command('collstats', 'students'),
-            'subjects': db.command('collstats', 'subjects'),
-            'enrollments': db.command('collstats', 'enrollments')
-        }
-        # Get database stats
-        db_stats = db.command('dbstats')
+        # La última muestra del sampler; sólo se consulta aquí si no hay una reciente
+        sample = db_sampler.latest() or db_sampler.sample()
+        history = db_sampler.history()
         
         return render_template('database_info.html',
-                            sessions=sessions,
-                            stats=collections_stats,
-                            db_stats=db_stats,
-                            db_status=db_status)
+                            sample=sample,
+                            stats=sample['collections'],
+                            db_stats=sample['db_stats'],
+                            db_status=db_status,
+                            growth=growth_series(history),
+                            operations=operation_rates(history),
+                            pool_stats=database.get_pool_stats(),
+                            cache_stats=page_cache.stats())
     except Exception as e:
         flash(f"Error obteniendo información de la base de datos: {str(e)}", "danger")
         return redirect(url_for('dashboard'))
     
+@app.route('/database-info/pool')
+@login_required
+@admin_required
+def pool_info():
+    # Uso del pool de conexiones de este proceso
+    return jsonify(database.get_pool_stats())
+
+@app.route('/database-info/cache')
+@login_required
+@admin_required
+def page_cache_info():
+    # Aciertos y fallos del cache de páginas de este proceso
+    return jsonify(page_cache.stats())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    # Formato de texto de Prometheus; con METRICS_TOKEN se exige como Bearer token
+    token = os.getenv('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return 'Unauthorized\n', 401, {'Content-Type': 'text/plain'}
+    body = metrics.render(
+        metrics.gauges('mongodb_pool', 'Pool de conexiones de MongoDB', database.get_pool_stats()) +
+        metrics.gauges('page_cache', 'Cache de páginas', page_cache.stats()) +
+        metrics.gauges('event_log', 'Registro de errores y auditoría', event_log.stats())
+    )
+    return body, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 @app.errorhandler(404)
 def page_not_found(e):
     return render_template('errors/404.html'), 404
 
 @app.errorhandler(500)
 def internal_server_error(e):
-    # Registrar el error en la base de datos si está conectada
-    if db_status.get('connected'):
-        db.errors.insert_one({
-            'error': str(e),
-            'timestamp': datetime.now(),
-            'type': '500'
-        })
+    # Se encola: el request no espera a Mongo (que puede ser la causa del error)
+    event_log.error(getattr(e, 'original_exception', None) or e, type='500',
+                    method=request.method, path=request.path, endpoint=request.endpoint,
+                    user=session.get('username'))
     return render_template('errors/500.html'), 500
 
 if __name__ == '__main__':
-    # Create upload folder if it doesn't exist
-    if not os.path.exists(app.config['UPLOAD_FOLDER']):
-        os.makedirs(app.config['UPLOAD_FOLDER'])
-    
-    app.run(debug=True)
\ No newline at end of file
+    # Servidor de desarrollo; en producción: python serve.py
+    create_app().run(debug=True)
\ No newline at end of file
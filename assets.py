@@ -0,0 +1,156 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+from flask import abort, request, send_file, url_for
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él sólo se generan los .gz
+    brotli = None
+
+# Archivos de static/ que pasan por el pipeline (rutas relativas a static/)
+ASSET_DIRS = ('css', 'js', 'vendor')
+ASSET_FILES = ('avatars/default.png',)
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json')
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+ONE_YEAR = 365 * 24 * 3600
+
+_CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+def _fingerprint(path, data):
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    stem, ext = posixpath.splitext(path)
+    return f'{stem}.{digest}{ext}'
+
+
+def _rewrite_css(path, data, manifest):
+    # Cambia las referencias url(...) del CSS por sus nombres con hash
+    base = posixpath.dirname(path)
+
+    def replace(match):
+        quote, url = match.groups()
+        if url.startswith(('data:', 'http:', 'https:', '/', '#')):
+            return match.group(0)
+        target = re.split(r'[?#]', url, maxsplit=1)[0]
+        resolved = posixpath.normpath(posixpath.join(base, target))
+        if resolved not in manifest:
+            return match.group(0)
+        return f'url({quote}{posixpath.relpath(manifest[resolved], base)}{quote})'
+
+    return _CSS_URL.sub(replace, data.decode('utf-8')).encode('utf-8')
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(data)
+
+
+def _write_compressed(path, data):
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data):
+        _write(path + '.gz', gz)
+    if brotli is not None:
+        br = brotli.compress(data, quality=11)
+        if len(br) < len(data):
+            _write(path + '.br', br)
+
+
+def build_assets(static_folder):
+    """Copia los assets a static/dist con el hash del contenido en el nombre.
+
+    Escribe al lado de cada archivo de texto sus versiones .gz y .br y un
+    manifest.json con `ruta original -> ruta con hash`. Devuelve el manifest.
+    """
+    sources = list(ASSET_FILES)
+    for folder in ASSET_DIRS:
+        for root, _, files in os.walk(os.path.join(static_folder, folder)):
+            for name in files:
+                if name in ('README.md', 'LICENSE'):
+                    continue
+                full = os.path.join(root, name)
+                sources.append(os.path.relpath(full, static_folder).replace(os.sep, '/'))
+
+    dist = os.path.join(static_folder, DIST_DIR)
+    if os.path.exists(dist):
+        shutil.rmtree(dist)
+
+    # Los CSS van al final para poder reescribir sus url() con los nombres finales
+    sources.sort(key=lambda path: (path.endswith('.css'), path))
+    manifest = {}
+    for path in sources:
+        with open(os.path.join(static_folder, path), 'rb') as file:
+            data = file.read()
+        if path.endswith('.css'):
+            data = _rewrite_css(path, data, manifest)
+        manifest[path] = _fingerprint(path, data)
+
+        target = os.path.join(dist, manifest[path])
+        _write(target, data)
+        if path.endswith(COMPRESSIBLE):
+            _write_compressed(target, data)
+
+    _write(os.path.join(dist, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+class Assets:
+    """Resuelve las URLs de los assets y los sirve con caché inmutable.
+
+    Si existe static/dist/manifest.json (generado con `flask build-assets`)
+    `asset_url` devuelve la versión con hash; si no, la URL normal de static.
+    """
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.dist = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.dist = os.path.join(app.static_folder, DIST_DIR)
+        self.load()
+        app.add_template_global(self.url, 'asset_url')
+        app.add_url_rule('/assets/<path:filename>', 'assets', self.serve)
+
+    def load(self):
+        path = os.path.join(self.dist, MANIFEST)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as file:
+                self.manifest = json.load(file)
+        else:
+            self.manifest = {}
+
+    def url(self, filename):
+        if filename in self.manifest:
+            return url_for('assets', filename=self.manifest[filename])
+        return url_for('static', filename=filename)
+
+    def serve(self, filename):
+        path = os.path.normpath(os.path.join(self.dist, filename))
+        if not path.startswith(self.dist + os.sep) or not os.path.isfile(path):
+            abort(404)
+
+        # Se elige la variante precomprimida que acepte el navegador
+        encoding = None
+        accepted = request.accept_encodings
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if accepted[candidate] and os.path.isfile(path + suffix):
+                encoding = candidate
+                path += suffix
+                break
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_file(path, mimetype=mimetype, conditional=True, etag=True)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = f'public, max-age={ONE_YEAR}, immutable'
+        return response
@@ -1,12 +1,47 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, session
-from werkzeug.security import generate_password_hash, check_password_hash
 from bson import ObjectId
 from functools import wraps
 from datetime import datetime
+import math
+import os
 from models import db
+from cache import TTLCache
+from passwords import PasswordHasher, HasherBusy
+from throttle import TokenBucket
 
 auth_routes = Blueprint('auth', __name__)
 
+# Roles por user id. La app no tiene ninguna ruta que cambie is_admin (se
+# edita directo en Mongo), así que no hay aviso de cambio: una revocación se
+# nota como máximo a los AUTH_CACHE_TTL segundos, o en el próximo login
+role_cache = TTLCache(int(os.getenv('AUTH_CACHE_TTL', 60)))
+
+# Hashing fuera del hilo del request, con un límite de operaciones en curso
+hasher = PasswordHasher(
+    method=os.getenv('PASSWORD_HASH_METHOD', 'scrypt'),
+    workers=int(os.getenv('PASSWORD_WORKERS', 2)),
+    max_pending=int(os.getenv('PASSWORD_MAX_PENDING', 64))
+)
+
+# Intentos de login por minuto (y ráfaga) por usuario, en memoria de cada
+# proceso: con serve.py el límite real es workers × el configurado
+user_throttle = TokenBucket(float(os.getenv('LOGIN_USER_PER_MINUTE', 10)) / 60,
+                            int(os.getenv('LOGIN_USER_BURST', 5)))
+# Por IP sólo si se pide (LOGIN_IP_PER_MINUTE > 0): detrás de un NAT o de un
+# proxy sin TRUSTED_PROXIES todo el campus comparte una dirección
+_ip_per_minute = float(os.getenv('LOGIN_IP_PER_MINUTE', 0))
+ip_throttle = TokenBucket(_ip_per_minute / 60,
+                          int(os.getenv('LOGIN_IP_BURST', 1000))) if _ip_per_minute > 0 else None
+
+def invalidate_user(user_id):
+    role_cache.delete(str(user_id))
+
+def user_is_admin(user_id):
+    def load_role():
+        user = db.users.find_one({'_id': ObjectId(user_id)}, {'is_admin': 1})
+        return bool(user and user.get('is_admin'))
+    return role_cache.get_or_set(str(user_id), load_role)
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -23,8 +58,7 @@ def admin_required(f):
             flash('Please log in to access this page.', 'danger')
             return redirect(url_for('auth.login', next=request.url))
         
-        user = db.users.find_one({'_id': ObjectId(session['user_id'])})
-        if not user or not user.get('is_admin'):
+        if not user_is_admin(session['user_id']):
             flash('You do not have permission to access this page.', 'danger')
             return redirect(url_for('dashboard'))
         
@@ -56,7 +90,7 @@ def register():
                     # Create new user
                     new_user = {
                         'username': username,
-                        'password': generate_password_hash(password),
+                        'password': hasher.hash(password),
                         'is_admin': is_admin,
                         'created_at': datetime.now(),
                         'updated_at': datetime.now()
@@ -65,11 +99,25 @@ def register():
                     db.users.insert_one(new_user)
                     flash('Registration successful! Please log in.', 'success')
                     return redirect(url_for('auth.login'))
+            except HasherBusy as e:
+                flash(str(e), 'warning')
+                return render_template('auth/register.html'), 503
             except Exception as e:
                 flash(f'Error during registration: {str(e)}', 'danger')
     
     return render_template('auth/register.html')
 
+def rehash_password(user, password):
+    # Si cambió PASSWORD_HASH_METHOD se actualiza el hash con la contraseña recién verificada
+    if not hasher.needs_rehash(user['password']):
+        return
+    try:
+        new_hash = hasher.hash(password)
+    except HasherBusy:
+        return  # Se reintenta en el próximo login
+    db.users.update_one({'_id': user['_id'], 'password': user['password']},
+                        {'$set': {'password': new_hash, 'updated_at': datetime.now()}})
+
 @auth_routes.route('/login', methods=['GET', 'POST'])
 def login():
     if 'user_id' in session:
@@ -81,22 +129,43 @@ def login():
         
         if not username or not password:
             flash('Username and password are required!', 'danger')
-        else:
+            return render_template('auth/login.html')
+        
+        # Se limita antes de gastar CPU en el hash
+        wait = user_throttle.consume(username.lower())
+        if ip_throttle is not None:
+            wait = max(wait, ip_throttle.consume(request.remote_addr or ''))
+        if wait:
+            flash(f'Too many login attempts. Try again in {math.ceil(wait)} seconds.', 'danger')
+            return render_template('auth/login.html'), 429, {'Retry-After': str(math.ceil(wait))}
+        
+        try:
             user = db.users.find_one({'username': username})
-            if user and check_password_hash(user['password'], password):
-                session['user_id'] = str(user['_id'])
-                session['is_admin'] = user.get('is_admin', False)
-                flash('Login successful!', 'success')
-                
-                next_page = request.args.get('next')
-                return redirect(next_page or url_for('dashboard'))
-            else:
-                flash('Invalid username or password!', 'danger')
+            valid = hasher.verify(user['password'] if user else None, password)
+        except HasherBusy as e:
+            flash(str(e), 'warning')
+            return render_template('auth/login.html'), 503
+        
+        if valid:
+            rehash_password(user, password)
+            user_throttle.reset(username.lower())
+            session['user_id'] = str(user['_id'])
+            session['username'] = user['username']
+            session['is_admin'] = user.get('is_admin', False)
+            role_cache.set(str(user['_id']), bool(user.get('is_admin')))
+            flash('Login successful!', 'success')
+            
+            next_page = request.args.get('next')
+            return redirect(next_page or url_for('dashboard'))
+        else:
+            flash('Invalid username or password!', 'danger')
     
     return render_template('auth/login.html')
 
 @auth_routes.route('/logout')
 def logout():
+    if 'user_id' in session:
+        invalidate_user(session['user_id'])
     session.clear()
     flash('You have been logged out.', 'info')
     return redirect(url_for('auth.login'))
\ No newline at end of file
@@ -0,0 +1,295 @@
+"""Benchmark de las rutas de la aplicación.
+
+Ejemplos:
+
+    # Base en memoria (requiere mongomock), sembrada con volúmenes pequeños
+    python benchmark.py --memory --seed --students 2000 --enrollments 8000 -o bench.json
+
+    # Contra un mongod local ya sembrado con `flask --app app seed`
+    DB_NAME=school_bench python benchmark.py -n 200 -c 8 -o bench.json
+
+    # Contra un servidor corriendo (HTTP real)
+    python benchmark.py --url http://localhost:5000 -o bench.json
+
+Escribe p50/p95/p99, media, throughput y códigos de estado por ruta en un JSON
+para comparar corridas. Cualquier respuesta fuera de 2xx cuenta como error.
+Con --memory se omiten /reports y /database-info, que mongomock no puede servir.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, build_opener
+
+BENCH_USER = 'benchmark'
+BENCH_PASSWORD = 'benchmark'
+
+# (nombre, ruta); {student}, {teacher} y {subject} se llenan con ids reales
+ROUTES = [
+    ('dashboard', '/'),
+    ('teachers', '/teachers'),
+    ('teachers_filtered', '/teachers?name=A'),
+    ('subjects', '/subjects'),
+    ('subjects_by_career', '/subjects?career=Medicina'),
+    ('students', '/students'),
+    ('students_filtered', '/students?name=M'),
+    ('edit_teacher', '/teachers/edit/{teacher}'),
+    ('edit_subject', '/subjects/edit/{subject}'),
+    ('edit_student', '/students/edit/{student}'),
+    ('reports', '/reports'),
+    ('database_info', '/database-info'),
+    ('api_students', '/api/v1/students?per_page=50'),
+    ('api_student', '/api/v1/students/{student}'),
+    ('api_enrollments', '/api/v1/enrollments?student_id={student}'),
+]
+
+# Rutas que mongomock no puede servir y fallarían en cada request: /reports
+# recalcula los reportes con $merge y /database-info usa db.command (dbStats)
+MEMORY_UNSUPPORTED = {
+    'reports': 'mongomock does not implement $merge',
+    'database_info': 'mongomock does not implement db.command',
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies, statuses, elapsed):
+    # Cualquier respuesta fuera de 2xx (también redirecciones al login) es un error
+    ms = [value * 1000 for value in latencies]
+    return {
+        'requests': len(latencies),
+        'errors': sum(count for status, count in statuses.items() if not 200 <= status < 300),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'p50_ms': round(percentile(ms, 50), 2) if ms else None,
+        'p95_ms': round(percentile(ms, 95), 2) if ms else None,
+        'p99_ms': round(percentile(ms, 99), 2) if ms else None,
+        'mean_ms': round(sum(ms) / len(ms), 2) if ms else None,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None
+    }
+
+
+class TestClientDriver:
+    """Llama las rutas con el cliente de pruebas de Flask (sin red)."""
+
+    def __init__(self, app, user):
+        self.app = app
+        self.user = user
+
+    def session(self):
+        client = self.app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = str(self.user['_id'])
+            session['username'] = self.user['username']
+            session['is_admin'] = True
+
+        def get(path):
+            response = client.get(path)
+            response.close()
+            return response.status_code
+        return get
+
+
+class HttpDriver:
+    """Llama las rutas de un servidor ya corriendo, con una sesión por hilo."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def session(self):
+        opener = build_opener(HTTPCookieProcessor(CookieJar()))
+        data = urlencode({'username': BENCH_USER, 'password': BENCH_PASSWORD}).encode()
+        opener.open(self.base_url + '/login', data=data).read()
+
+        def get(path):
+            try:
+                with opener.open(self.base_url + path) as response:
+                    response.read()
+                    return response.status
+            except HTTPError as e:
+                return e.code
+        return get
+
+
+def sample_ids(db, size=50):
+    ids = {}
+    for key, collection in (('student', 'students'), ('teacher', 'teachers'),
+                            ('subject', 'subjects')):
+        ids[key] = [doc['_id'] for doc in db[collection].aggregate([
+            {'$sample': {'size': size}}, {'$project': {'_id': 1}}
+        ])]
+    return ids
+
+
+def ensure_user(db):
+    from werkzeug.security import generate_password_hash
+    db.users.update_one(
+        {'username': BENCH_USER},
+        {'$setOnInsert': {
+            'username': BENCH_USER,
+            'password': generate_password_hash(BENCH_PASSWORD),
+            'is_admin': True,
+            'created_at': datetime.now()
+        }},
+        upsert=True
+    )
+    return db.users.find_one({'username': BENCH_USER})
+
+
+def run_route(driver_sessions, path_template, ids, requests, concurrency, warmup, rng):
+    paths = []
+    for _ in range(requests + warmup):
+        values = {key: rng.choice(values) for key, values in ids.items() if values}
+        try:
+            paths.append(path_template.format(**values))
+        except KeyError:
+            return None  # No hay documentos para llenar la ruta
+
+    for path in paths[:warmup]:
+        driver_sessions[0](path)
+
+    work = paths[warmup:]
+    chunks = [work[i::concurrency] for i in range(concurrency)]
+
+    def worker(index):
+        get = driver_sessions[index]
+        latencies, statuses = [], Counter()
+        for path in chunks[index]:
+            started = time.perf_counter()
+            status = get(path)
+            latencies.append(time.perf_counter() - started)
+            statuses[status] += 1
+        return latencies, statuses
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies = [value for result in results for value in result[0]]
+    return summarize(latencies, sum((result[1] for result in results), Counter()), elapsed)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Latencia y throughput de las rutas de app.py')
+    parser.add_argument('-n', '--requests', type=int, default=100, help='requests por ruta')
+    parser.add_argument('-c', '--concurrency', type=int, default=4, help='hilos en paralelo')
+    parser.add_argument('--warmup', type=int, default=5, help='requests previos sin medir')
+    parser.add_argument('-o', '--output', help='archivo JSON con los resultados')
+    parser.add_argument('--routes', help='nombres de rutas separados por coma')
+    parser.add_argument('--url', help='URL de un servidor corriendo (modo HTTP)')
+    parser.add_argument('--memory', action='store_true',
+                        help='usar una base en memoria (mongomock) en lugar de MongoDB')
+    parser.add_argument('--db-name', help='base de datos a usar (DB_NAME)')
+    parser.add_argument('--no-page-cache', action='store_true',
+                        help='desactivar el cache de páginas para medir el render completo')
+    parser.add_argument('--seed', action='store_true', help='sembrar datos antes de medir')
+    parser.add_argument('--teachers', type=int, default=100)
+    parser.add_argument('--subjects', type=int, default=200)
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--enrollments', type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    # La configuración se lee al importar app.py, así que va antes del import
+    if args.db_name:
+        os.environ['DB_NAME'] = args.db_name
+    if args.no_page_cache:
+        os.environ['PAGE_CACHE_ENABLED'] = 'false'
+    if args.memory:
+        try:
+            import mongomock
+        except ImportError:
+            parser.error('--memory requiere instalar mongomock')
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+        os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017')
+
+    import app as application
+    from cache import notify_change
+    from seed import seed_database
+    db = application.db
+
+    if args.seed:
+        counts = seed_database(db, application.CAREERS, teachers=args.teachers,
+                               subjects=args.subjects, students=args.students,
+                               enrollments=args.enrollments, drop=True,
+                               progress=lambda message: print(message, file=sys.stderr))
+        notify_change('teachers', 'subjects', 'students', 'enrollments')
+        if not args.memory:
+            application.report_rollups.rebuild()
+        print(f'Seeded {counts}', file=sys.stderr)
+
+    user = ensure_user(db)
+    driver = HttpDriver(args.url) if args.url else TestClientDriver(application.app, user)
+    sessions = [driver.session() for _ in range(args.concurrency)]
+    ids = sample_ids(db)
+    rng = random.Random(0)
+
+    selected = set(args.routes.split(',')) if args.routes else None
+    results = {}
+    skipped = {}
+    for name, path in ROUTES:
+        if selected and name not in selected:
+            continue
+        if args.memory and name in MEMORY_UNSUPPORTED:
+            print(f'{name:<20} skipped ({MEMORY_UNSUPPORTED[name]})', file=sys.stderr)
+            skipped[name] = MEMORY_UNSUPPORTED[name]
+            continue
+        result = run_route(sessions, path, ids, args.requests, args.concurrency,
+                           args.warmup, rng)
+        if result is None:
+            print(f'{name:<20} skipped (no data)', file=sys.stderr)
+            skipped[name] = 'no data'
+            continue
+        results[name] = result
+        print(f"{name:<20} p50 {result['p50_ms']:>8} ms  p95 {result['p95_ms']:>8} ms  "
+              f"p99 {result['p99_ms']:>8} ms  {result['throughput_rps']:>8} req/s  "
+              f"errors {result['errors']}  {result['statuses']}", file=sys.stderr)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'mode': 'http' if args.url else 'test_client',
+            'backend': 'memory' if args.memory else 'mongodb',
+            'page_cache': not args.no_page_cache,
+            'requests_per_route': args.requests,
+            'concurrency': args.concurrency,
+            'volumes': {name: db[name].estimated_document_count()
+                        for name in ('teachers', 'subjects', 'students', 'enrollments')}
+        },
+        'routes': results,
+        'skipped': skipped
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+_listeners = []
+
+
+def subscribe(listener):
+    """Registra una función `listener(collection, delta)` que se llama en cada escritura."""
+    _listeners.append(listener)
+    return listener
+
+
+def notify_change(*collections, delta=None):
+    # Las rutas de escritura avisan qué colecciones cambiaron. `delta` indica
+    # cuántos documentos se agregaron (o quitaron, si es negativo) cuando se conoce
+    for collection in collections:
+        for listener in _listeners:
+            listener(collection, delta)
+
+
+class TTLCache:
+    """Diccionario en memoria cuyas entradas vencen después de `ttl` segundos."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+
+    def get_or_set(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def update(self, key, fn):
+        # Modifica una entrada vigente sin alterar su vencimiento
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] >= time.monotonic():
+                self._data[key] = (entry[0], fn(entry[1]))
+                return True
+            return False
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class LRUCache:
+    """Cache acotado por tamaño que descarta primero lo usado hace más tiempo.
+
+    `max_size` se compara con la suma de los `size` de cada entrada (por
+    ejemplo bytes); por defecto cada entrada cuenta 1.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, size=1):
+        if size > self.max_size:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= old[0]
+            self._data[key] = (size, value)
+            self.size += size
+            while self.size > self.max_size:
+                _, (evicted_size, _) = self._data.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'size': self.size,
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0
+            }
+
+
+class CollectionVersions:
+    """Contador de versión por colección guardado en Mongo.
+
+    Cada `notify_change` incrementa la versión de la colección, así que todos
+    los procesos de la aplicación ven el mismo número y un cache indexado por
+    versiones deja de servir lo viejo apenas alguien escribe.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        subscribe(self.on_change)
+
+    def on_change(self, collection, delta=None):
+        self.collection.update_one({'_id': collection},
+                                   {'$inc': {'version': 1}, '$set': {'changed_at': datetime.now()}},
+                                   upsert=True)
+
+    def get(self, names):
+        return self.state(names)[0]
+
+    def state(self, names):
+        """Devuelve las versiones de `names` y la fecha del último cambio en cualquiera de ellas."""
+        found = {doc['_id']: doc for doc in self.collection.find({'_id': {'$in': list(names)}})}
+        versions = tuple(found.get(name, {}).get('version', 0) for name in names)
+        changed = [doc['changed_at'] for doc in found.values() if doc.get('changed_at')]
+        return versions, max(changed, default=None)
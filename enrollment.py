@@ -0,0 +1,417 @@
+import time
+from datetime import datetime
+from pymongo import InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+MAX_CREDITS = 20
+# Índice único del que depende la regla "una matrícula por estudiante y materia"
+UNIQUE_KEY = (('student_id', 1), ('subject_id', 1))
+# Sin el índice se vuelve a mirar cada tantos segundos
+INDEX_RECHECK_SECONDS = 30
+
+
+class EnrollmentError(Exception):
+    pass
+
+
+class StudentNotFound(EnrollmentError):
+    def __init__(self):
+        super().__init__('Student not found!')
+
+
+class SubjectNotFound(EnrollmentError):
+    def __init__(self):
+        super().__init__('Subject not found!')
+
+
+class SubjectFull(EnrollmentError):
+    def __init__(self):
+        super().__init__('No available slots in this subject!')
+
+
+class CreditLimitExceeded(EnrollmentError):
+    def __init__(self, max_credits):
+        super().__init__(f'Student cannot exceed {max_credits} credits!')
+
+
+class AlreadyEnrolled(EnrollmentError):
+    def __init__(self):
+        super().__init__('Student is already enrolled in this subject!')
+
+
+class EnrollmentUnavailable(EnrollmentError):
+    def __init__(self):
+        super().__init__('Enrollments are disabled until the unique enrollment index is created '
+                         '(flask dedupe-enrollments, then flask create-indexes).')
+
+
+class EnrollmentResult:
+    def __init__(self, subject, credits_before, credits_after):
+        # `subject` es el documento de la materia antes del cambio
+        self.subject = subject
+        self.credits_before = credits_before
+        self.credits_after = credits_after
+
+
+class EnrollmentConflict(EnrollmentError):
+    def __init__(self):
+        super().__init__('Slots or credits changed during the bulk enrollment, please retry.')
+
+
+class BulkEnrollmentResult:
+    def __init__(self):
+        # Un resultado por par (student_id, subject_id), en el orden pedido
+        self.results = []
+        # Estado previo y posterior para ajustar los reportes
+        self.subjects_before = {}
+        self.slots_taken = {}
+        self.credits_before = {}
+        self.credits_added = {}
+        self.inserts = []
+
+    @property
+    def enrolled(self):
+        return sum(1 for row in self.results if row['status'] == 'enrolled')
+
+    def add(self, student_id, subject_id, error=None):
+        self.results.append({
+            'student_id': student_id,
+            'subject_id': subject_id,
+            'status': 'error' if error else 'enrolled',
+            'error': str(error) if error else None
+        })
+
+
+class EnrollmentEngine:
+    """Matrículas sin sobreventa de cupos ni matrículas repetidas.
+
+    Cada regla es una actualización condicional sobre un solo documento:
+    el índice único (student_id, subject_id) impide matrículas repetidas, el
+    cupo se descuenta sólo si `available_slots > 0` y los créditos del
+    estudiante (`enrolled_credits`) sólo suben si no pasan del máximo. La
+    matrícula se inserta primero, así un doble clic falla sin tomar cupo. Si
+    un paso falla se revierten los anteriores, así que no hace falta una
+    transacción que compita por el documento de la materia.
+
+    Como todo depende del índice único, si no existe no se matricula
+    (EnrollmentUnavailable) en lugar de arriesgar matrículas repetidas.
+    """
+
+    def __init__(self, db, max_credits=MAX_CREDITS):
+        self.client = db.client
+        self.students = db['students']
+        self.subjects = db['subjects']
+        self.enrollments = db['enrollments']
+        self.max_credits = max_credits
+        self._index_ok = False
+        self._index_checked = 0
+
+    def has_unique_index(self):
+        for info in self.enrollments.index_information().values():
+            key = tuple((field, int(direction)) for field, direction in info['key'])
+            if key == UNIQUE_KEY and info.get('unique'):
+                return True
+        return False
+
+    def _require_unique_index(self):
+        if self._index_ok:
+            return
+        now = time.monotonic()
+        if now - self._index_checked >= INDEX_RECHECK_SECONDS:
+            self._index_checked = now
+            self._index_ok = self.has_unique_index()
+        if not self._index_ok:
+            raise EnrollmentUnavailable()
+
+    def enroll(self, student_id, subject_id):
+        self._require_unique_index()
+        current = self.subjects.find_one({'_id': subject_id}, {'credits': 1})
+        if current is None:
+            raise SubjectNotFound()
+
+        # Primero la matrícula: el índice único descarta un doble clic antes
+        # de tocar cupos o créditos
+        try:
+            enrollment_id = self.enrollments.insert_one({
+                'student_id': student_id,
+                'subject_id': subject_id,
+                'credits': current['credits'],
+                'enrollment_date': datetime.now()
+            }).inserted_id
+        except DuplicateKeyError:
+            raise AlreadyEnrolled()
+
+        try:
+            subject = self.subjects.find_one_and_update(
+                {'_id': subject_id, 'available_slots': {'$gt': 0}},
+                {'$inc': {'available_slots': -1}}
+            )
+            if subject is None:
+                if not self.subjects.count_documents({'_id': subject_id}, limit=1):
+                    raise SubjectNotFound()
+                raise SubjectFull()
+        except Exception:
+            self.enrollments.delete_one({'_id': enrollment_id})
+            raise
+
+        credits = subject['credits']
+        try:
+            credits_before = self._add_credits(student_id, credits, exclude=enrollment_id)
+            if credits != current['credits']:
+                # Los créditos de la materia cambiaron entre la lectura y el cupo
+                self.enrollments.update_one({'_id': enrollment_id}, {'$set': {'credits': credits}})
+        except Exception:
+            self._release_slot(subject_id)
+            self.enrollments.delete_one({'_id': enrollment_id})
+            raise
+
+        return EnrollmentResult(subject, credits_before, credits_before + credits)
+
+    def enroll_many(self, pairs, attempts=3):
+        """Matricula varios pares (student_id, subject_id) en una transacción.
+
+        Valida cupos y créditos en memoria con una lectura por colección y
+        escribe todo con bulk_write. Las actualizaciones llevan las mismas
+        condiciones que `enroll`, así que si otro request cambió cupos o
+        créditos entre la lectura y la escritura se aborta y se vuelve a planear.
+        """
+        self._require_unique_index()
+        pairs = list(dict.fromkeys(pairs))
+        for _ in range(attempts):
+            plan = self._plan(pairs)
+            try:
+                with self.client.start_session() as session:
+                    session.with_transaction(lambda session: self._commit(plan, session))
+                return plan
+            except EnrollmentConflict:
+                continue
+        raise EnrollmentConflict()
+
+    def _plan(self, pairs):
+        student_ids = list({student_id for student_id, _ in pairs})
+        subject_ids = list({subject_id for _, subject_id in pairs})
+
+        subjects = {s['_id']: s for s in self.subjects.find({'_id': {'$in': subject_ids}})}
+        students = {
+            s['_id']: s for s in self.students.find({'_id': {'$in': student_ids}},
+                                                    {'enrolled_credits': 1})
+        }
+        missing = [sid for sid, s in students.items() if 'enrolled_credits' not in s]
+        if missing:
+            for row in self._credit_totals({'student_id': {'$in': missing}}):
+                students[row['_id']]['enrolled_credits'] = row['total']
+            for sid in missing:
+                students[sid].setdefault('enrolled_credits', 0)
+                self.students.update_one(
+                    {'_id': sid, 'enrolled_credits': {'$exists': False}},
+                    {'$set': {'enrolled_credits': students[sid]['enrolled_credits']}}
+                )
+        existing = {
+            (e['student_id'], e['subject_id'])
+            for e in self.enrollments.find(
+                {'student_id': {'$in': student_ids}, 'subject_id': {'$in': subject_ids}},
+                {'student_id': 1, 'subject_id': 1}
+            )
+        }
+
+        plan = BulkEnrollmentResult()
+        slots = {sid: s.get('available_slots', 0) for sid, s in subjects.items()}
+        credits = {sid: s['enrolled_credits'] for sid, s in students.items()}
+        for student_id, subject_id in pairs:
+            subject = subjects.get(subject_id)
+            error = None
+            if student_id not in students:
+                error = StudentNotFound()
+            elif subject is None:
+                error = SubjectNotFound()
+            elif (student_id, subject_id) in existing:
+                error = AlreadyEnrolled()
+            elif slots[subject_id] <= 0:
+                error = SubjectFull()
+            elif credits[student_id] + subject['credits'] > self.max_credits:
+                error = CreditLimitExceeded(self.max_credits)
+
+            plan.add(student_id, subject_id, error)
+            if error:
+                continue
+
+            slots[subject_id] -= 1
+            credits[student_id] += subject['credits']
+            plan.subjects_before[subject_id] = subject
+            plan.slots_taken[subject_id] = plan.slots_taken.get(subject_id, 0) + 1
+            plan.credits_before.setdefault(student_id, students[student_id]['enrolled_credits'])
+            plan.credits_added[student_id] = plan.credits_added.get(student_id, 0) + subject['credits']
+            plan.inserts.append({
+                'student_id': student_id,
+                'subject_id': subject_id,
+                'credits': subject['credits'],
+                'enrollment_date': datetime.now()
+            })
+        return plan
+
+    def _commit(self, plan, session):
+        if not plan.inserts:
+            return
+        subject_ops = [
+            UpdateOne({'_id': sid, 'available_slots': {'$gte': taken}},
+                      {'$inc': {'available_slots': -taken}})
+            for sid, taken in plan.slots_taken.items()
+        ]
+        student_ops = [
+            UpdateOne({'_id': sid, 'enrolled_credits': {'$lte': self.max_credits - added}},
+                      {'$inc': {'enrolled_credits': added}})
+            for sid, added in plan.credits_added.items()
+        ]
+        if self.subjects.bulk_write(subject_ops, session=session).matched_count != len(subject_ops):
+            raise EnrollmentConflict()
+        if self.students.bulk_write(student_ops, session=session).matched_count != len(student_ops):
+            raise EnrollmentConflict()
+        try:
+            self.enrollments.bulk_write([InsertOne(doc) for doc in plan.inserts], session=session)
+        except BulkWriteError:
+            # Otro request matriculó alguno de los pares en paralelo
+            raise EnrollmentConflict()
+
+    def unenroll(self, student_id, subject_id):
+        enrollment = self.enrollments.find_one_and_delete({
+            'student_id': student_id,
+            'subject_id': subject_id
+        })
+        if enrollment is None:
+            return None
+
+        subject = self.subjects.find_one_and_update(
+            {'_id': subject_id},
+            {'$inc': {'available_slots': 1}}
+        )
+        credits = enrollment.get('credits')
+        if credits is None:
+            credits = subject['credits'] if subject else 0
+
+        student = self.students.find_one_and_update(
+            {'_id': student_id, 'enrolled_credits': {'$exists': True}},
+            {'$inc': {'enrolled_credits': -credits}},
+            projection={'enrolled_credits': 1}
+        )
+        if student is not None:
+            credits_before = student['enrolled_credits']
+        else:
+            # Sin el campo todavía: se calcula ya sin esta matrícula
+            credits_before = self._init_credits(student_id) + credits
+        return EnrollmentResult(subject or {}, credits_before, credits_before - credits)
+
+    def student_credits(self, student_id):
+        student = self.students.find_one({'_id': student_id}, {'enrolled_credits': 1})
+        if student is None:
+            raise StudentNotFound()
+        if 'enrolled_credits' not in student:
+            return self._init_credits(student_id)
+        return student['enrolled_credits']
+
+    def remove_duplicates(self):
+        """Borra las matrículas repetidas (deja la más antigua) y devuelve cuántas borró.
+
+        Cada copia había tomado un cupo y sumado créditos, así que se
+        devuelven. Hace falta antes de crear el índice único sobre datos
+        viejos.
+        """
+        removed = 0
+        duplicates = self.enrollments.aggregate([
+            {'$sort': {'_id': 1}},
+            {'$group': {'_id': {'student_id': '$student_id', 'subject_id': '$subject_id'},
+                        'ids': {'$push': '$_id'}, 'credits': {'$push': '$credits'},
+                        'count': {'$sum': 1}}},
+            {'$match': {'count': {'$gt': 1}}}
+        ], allowDiskUse=True)
+        for group in duplicates:
+            extra_ids = group['ids'][1:]
+            student_id = group['_id']['student_id']
+            subject_id = group['_id']['subject_id']
+            deleted = self.enrollments.delete_many({'_id': {'$in': extra_ids}}).deleted_count
+            if not deleted:
+                continue
+            subject = self.subjects.find_one_and_update(
+                {'_id': subject_id}, {'$inc': {'available_slots': deleted}},
+                projection={'credits': 1}
+            )
+            credits = sum(c if c is not None else (subject or {}).get('credits', 0)
+                          for c in group['credits'][1:1 + deleted])
+            self.students.update_one({'_id': student_id, 'enrolled_credits': {'$exists': True}},
+                                     {'$inc': {'enrolled_credits': -credits}})
+            removed += deleted
+        self._index_checked = 0
+        return removed
+
+    def backfill_credits(self):
+        # Recalcula enrolled_credits de todos los estudiantes desde sus matrículas
+        totals = {row['_id']: row['total'] for row in self._credit_totals({})}
+        updated = 0
+        batch = []
+        for student in self.students.find({}, {'_id': 1}):
+            batch.append(UpdateOne(
+                {'_id': student['_id']},
+                {'$set': {'enrolled_credits': totals.get(student['_id'], 0)}}
+            ))
+            if len(batch) >= 1000:
+                updated += self.students.bulk_write(batch, ordered=False).matched_count
+                batch = []
+        if batch:
+            updated += self.students.bulk_write(batch, ordered=False).matched_count
+        return updated
+
+    def _add_credits(self, student_id, credits, exclude=None):
+        for _ in range(2):
+            student = self.students.find_one_and_update(
+                {'_id': student_id, 'enrolled_credits': {'$lte': self.max_credits - credits}},
+                {'$inc': {'enrolled_credits': credits}},
+                projection={'enrolled_credits': 1},
+                return_document=ReturnDocument.BEFORE
+            )
+            if student is not None:
+                return student['enrolled_credits']
+
+            # Estudiantes anteriores al campo enrolled_credits: se inicializa
+            # una vez y se reintenta
+            current = self.students.find_one({'_id': student_id}, {'enrolled_credits': 1})
+            if current is None:
+                raise StudentNotFound()
+            if 'enrolled_credits' in current:
+                break
+            # Sin contar la matrícula que se está creando
+            self._init_credits(student_id, exclude=exclude)
+        raise CreditLimitExceeded(self.max_credits)
+
+    def _init_credits(self, student_id, exclude=None):
+        match = {'student_id': student_id}
+        if exclude is not None:
+            match['_id'] = {'$ne': exclude}
+        result = list(self._credit_totals(match))
+        total = result[0]['total'] if result else 0
+        self.students.update_one(
+            {'_id': student_id, 'enrolled_credits': {'$exists': False}},
+            {'$set': {'enrolled_credits': total}}
+        )
+        return total
+
+    def _credit_totals(self, match):
+        # Usa los créditos guardados en la matrícula; las matrículas antiguas
+        # que no los tienen los toman de la materia
+        return self.enrollments.aggregate([
+            {'$match': match},
+            {
+                '$lookup': {
+                    'from': 'subjects',
+                    'localField': 'subject_id',
+                    'foreignField': '_id',
+                    'as': 'subject'
+                }
+            },
+            {'$unwind': {'path': '$subject', 'preserveNullAndEmptyArrays': True}},
+            {'$group': {
+                '_id': '$student_id',
+                'total': {'$sum': {'$ifNull': ['$credits', '$subject.credits']}}
+            }}
+        ])
+
+    def _release_slot(self, subject_id):
+        self.subjects.update_one({'_id': subject_id}, {'$inc': {'available_slots': 1}})
@@ -0,0 +1,149 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+from collections import Counter
+from datetime import datetime
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+class EventLog:
+    """Registro de errores y auditoría escrito por lotes desde un hilo aparte.
+
+    `error()` y `audit()` sólo encolan el evento, así que nunca bloquean un
+    request aunque Mongo esté caído. El hilo escribe cada `flush_interval`
+    segundos (o al juntar `batch_size` eventos) en colecciones capped. Si la
+    cola se llena los eventos nuevos se descartan y se cuentan en `dropped`;
+    los lotes que Mongo rechaza se cuentan en `failed`. Al salir del proceso
+    se escribe lo pendiente.
+    """
+
+    def __init__(self, db, collections=None, max_queue=10000, batch_size=500,
+                 flush_interval=2.0, collection_bytes=16 * 1024 * 1024):
+        self.db = db
+        # tipo de evento -> colección
+        self.collections = collections or {'error': 'errors', 'audit': 'audit_log'}
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.collection_bytes = collection_bytes
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.written = Counter()
+        self.dropped = Counter()
+        self.failed = Counter()
+        self._ready = set()
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        # Un flush a la vez: el del hilo o el de la salida del proceso
+        self._flush_lock = threading.Lock()
+        atexit.register(self.close)
+
+    def error(self, error, **fields):
+        self._enqueue('error', dict(fields, error=str(error), timestamp=datetime.now()))
+
+    def audit(self, action, collection, document_id=None, user=None, **details):
+        """Registra quién hizo qué sobre un documento (p. ej. 'update', 'teachers', id)."""
+        self._enqueue('audit', dict(details, action=action, collection=collection,
+                                    document_id=document_id, user=user,
+                                    timestamp=datetime.now()))
+
+    def _enqueue(self, kind, event):
+        self.ensure_started()
+        try:
+            self.queue.put_nowait((kind, event))
+        except queue.Full:
+            self.dropped[kind] += 1
+
+    def _ensure_collection(self, name):
+        if name in self._ready:
+            return
+        try:
+            self.db.create_collection(name, capped=True, size=self.collection_bytes)
+        except CollectionInvalid:
+            pass  # Ya existe (una colección errors anterior sigue sin ser capped)
+        self._ready.add(name)
+
+    def _drain(self, limit):
+        events = []
+        while len(events) < limit:
+            try:
+                events.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def _write(self, events):
+        by_kind = {}
+        for kind, event in events:
+            by_kind.setdefault(kind, []).append(event)
+        for kind, docs in by_kind.items():
+            name = self.collections[kind]
+            try:
+                self._ensure_collection(name)
+                self.db[name].insert_many(docs, ordered=False)
+                self.written[kind] += len(docs)
+            except PyMongoError as e:
+                # No se reintenta: con la base caída la cola crecería sin límite
+                self.failed[kind] += len(docs)
+                logger.warning('Could not write %d %s events: %s', len(docs), kind, e)
+            except Exception:
+                # Cualquier otro error tampoco puede terminar el hilo escritor
+                self.failed[kind] += len(docs)
+                logger.exception('Unexpected error writing %d %s events', len(docs), kind)
+
+    def flush(self):
+        """Escribe todo lo que está en la cola; devuelve cuántos eventos procesó."""
+        total = 0
+        with self._flush_lock:
+            while True:
+                events = self._drain(self.batch_size)
+                if not events:
+                    return total
+                self._write(events)
+                total += len(events)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            # Espera un poco para juntar un lote en lugar de escribir uno por uno
+            self._stop.wait(min(self.flush_interval, 0.5))
+            with self._flush_lock:
+                self._write([first] + self._drain(self.batch_size - 1))
+
+    def ensure_started(self):
+        # Después de un fork el hilo no existe en el proceso hijo
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                if self._pid is not None and self._pid != os.getpid():
+                    # La cola heredada del padre ya la escribe el padre
+                    self.queue = queue.Queue(maxsize=self.queue.maxsize)
+                self._stop.clear()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='event-log', daemon=True)
+                self._thread.start()
+
+    def close(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        return {
+            'queued': self.queue.qsize(),
+            'max_queue': self.queue.maxsize,
+            'written': sum(self.written.values()),
+            'dropped': sum(self.dropped.values()),
+            'failed': sum(self.failed.values()),
+            'dropped_errors': self.dropped['error'],
+            'dropped_audit': self.dropped['audit']
+        }
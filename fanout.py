@@ -0,0 +1,81 @@
+import contextvars
+import os
+import threading
+import pymongo
+from concurrent.futures import ThreadPoolExecutor, wait
+from pymongo.errors import PyMongoError
+
+QUERY_TIMEOUT = int(os.getenv('QUERY_TIMEOUT_MS', 5000)) / 1000
+QUERY_WORKERS = int(os.getenv('QUERY_WORKERS', 16))
+
+_executor = None
+_lock = threading.Lock()
+
+
+class FanOutTimeout(TimeoutError):
+    def __init__(self, names):
+        super().__init__(f"Queries timed out: {', '.join(names)}")
+        self.names = names
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=QUERY_WORKERS,
+                                               thread_name_prefix='query')
+    return _executor
+
+
+def _run(fn, timeout):
+    # pymongo.timeout limita cada operación dentro de fn (también en el servidor)
+    with pymongo.timeout(timeout):
+        return fn()
+
+
+def fan_out(queries, timeout=None, timeouts=None):
+    """Ejecuta consultas independientes en paralelo y devuelve sus resultados.
+
+    `queries` es un dict `nombre -> función sin argumentos`. Cada consulta
+    tiene `timeout` segundos (o el valor de `timeouts[nombre]`); si alguna
+    se pasa se lanza FanOutTimeout con sus nombres. Cualquier otro error se
+    propaga tal cual. Una sola consulta se ejecuta en el hilo actual.
+    """
+    timeout = QUERY_TIMEOUT if timeout is None else timeout
+    timeouts = timeouts or {}
+    limits = {name: timeouts.get(name, timeout) for name in queries}
+
+    if len(queries) == 1:
+        [(name, fn)] = queries.items()
+        try:
+            return {name: _run(fn, limits[name])}
+        except PyMongoError as e:
+            if e.timeout:
+                raise FanOutTimeout([name])
+            raise
+
+    executor = _get_executor()
+    # Cada hilo recibe una copia del contexto (p. ej. el endpoint para las métricas)
+    futures = {
+        name: executor.submit(contextvars.copy_context().run, _run, fn, limits[name])
+        for name, fn in queries.items()
+    }
+    # Margen para que pymongo corte primero y el error diga cuál consulta fue
+    wait(futures.values(), timeout=max(limits.values()) + 1)
+
+    results, timed_out = {}, []
+    for name, future in futures.items():
+        if not future.done():
+            future.cancel()
+            timed_out.append(name)
+            continue
+        try:
+            results[name] = future.result()
+        except PyMongoError as e:
+            if not e.timeout:
+                raise
+            timed_out.append(name)
+    if timed_out:
+        raise FanOutTimeout(timed_out)
+    return results
@@ -0,0 +1,232 @@
+import codecs
+import hashlib
+import itertools
+import json
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+DUPLICATE_KEY = 11000
+MAX_REPORTED_ERRORS = 500
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\r\n'
+
+
+# Un elemento pendiente más grande que esto se rechaza en lugar de seguir
+# acumulando el archivo en memoria
+MAX_ELEMENT_CHARS = 1024 * 1024
+# Literales que pueden quedar cortados al final de un bloque ('-Infinity')
+_LONGEST_LITERAL = 9
+
+
+def iter_json_array(stream, chunk_size=64 * 1024, max_element=MAX_ELEMENT_CHARS):
+    """Recorre los elementos de un arreglo JSON sin cargar todo el archivo.
+
+    Lee el stream por bloques y decodifica un elemento a la vez con
+    `raw_decode`. Lanza ValueError si el contenido no es un arreglo, si un
+    elemento es inválido (con su número de fila) o si pasa de `max_element`
+    caracteres.
+    """
+    reader = codecs.getincrementaldecoder('utf-8-sig')()
+    buf = ''
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            eof = True
+            buf = buf[pos:] + reader.decode(b'', final=True)
+        else:
+            buf = buf[pos:] + reader.decode(chunk)
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            fill()
+
+    def incomplete(error):
+        # El error está en el final del buffer: el elemento sigue en el próximo bloque
+        return (error.pos >= len(buf) - _LONGEST_LITERAL or
+                error.msg.startswith('Unterminated string'))
+
+    skip_whitespace()
+    if pos >= len(buf) or buf[pos] != '[':
+        raise ValueError('El archivo JSON debe contener un arreglo')
+    pos += 1
+
+    row = 0
+    expect_value = True
+    while True:
+        skip_whitespace()
+        if pos >= len(buf):
+            raise ValueError('El arreglo JSON está incompleto')
+        if buf[pos] == ']':
+            if expect_value and row:
+                raise ValueError(f'Coma sobrante después de la fila {row}')
+            return
+        if not expect_value:
+            if buf[pos] != ',':
+                raise ValueError(f'Se esperaba "," después de la fila {row}')
+            pos += 1
+            expect_value = True
+            continue
+
+        if len(buf) - pos > max_element:
+            raise ValueError(f'La fila {row + 1} supera el tamaño máximo de {max_element} caracteres')
+        try:
+            value, end = _decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError as e:
+            if eof or not incomplete(e):
+                raise ValueError(f'JSON inválido en la fila {row + 1}: {e.msg}')
+            fill()
+            continue
+        if end == len(buf) and not eof:
+            # Un número o literal podría continuar en el siguiente bloque
+            fill()
+            continue
+        pos = end
+        row += 1
+        expect_value = False
+        yield value
+
+
+class ImportReport:
+    def __init__(self, processed=0, inserted=0, failed=0, errors=None):
+        self.processed = processed
+        self.inserted = inserted
+        self.failed = failed
+        self.errors = list(errors or [])
+        self.cancelled = False
+
+    def add_error(self, row, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row, 'error': message})
+
+    @property
+    def truncated_errors(self):
+        return self.failed - len(self.errors)
+
+
+def row_id(job_id, row):
+    """_id determinista para la fila `row` de una importación.
+
+    Toma la fecha del trabajo, 5 bytes derivados de su id y la fila en los 3
+    bytes del contador, así que reintentar una fila ya insertada choca con su
+    propio _id en lugar de duplicarla. Más allá de 2**24 filas devuelve None.
+    """
+    if row >= 2 ** 24:
+        return None
+    job_id = ObjectId(job_id).binary
+    return ObjectId(job_id[:4] + hashlib.sha1(job_id).digest()[:5] + row.to_bytes(3, 'big'))
+
+
+def _batches(records, batch_size, start=1):
+    batch = []
+    for row, record in enumerate(records, start=start):
+        batch.append((row, record))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert_batch(collection, rows, docs, report, retrying=False):
+    if not docs:
+        return
+    try:
+        result = collection.insert_many(docs, ordered=False)
+        report.inserted += len(result.inserted_ids)
+    except BulkWriteError as e:
+        details = e.details
+        report.inserted += details.get('nInserted', 0)
+        errors = details.get('writeErrors', [])
+        # Las filas cuyo _id determinista ya existe se insertaron en un intento
+        # anterior (el proceso murió antes de guardar el progreso)
+        retried = [docs[e['index']]['_id'] for e in errors
+                   if e.get('code') == DUPLICATE_KEY and '_id' in docs[e['index']]]
+        existing = {doc['_id'] for doc in collection.find({'_id': {'$in': retried}}, {'_id': 1})
+                    } if retrying and retried else set()
+        for error in errors:
+            row = rows[error['index']]
+            if docs[error['index']].get('_id') in existing:
+                report.inserted += 1
+            elif error.get('code') == DUPLICATE_KEY:
+                duplicate = error.get('keyValue') or error.get('errmsg', '')
+                report.add_error(row, f'Registro duplicado: {duplicate}')
+            else:
+                report.add_error(row, error.get('errmsg', 'Error de escritura'))
+
+
+def run_import(collection, records, prepare, batch_size=1000, before_batch=None,
+               skip=0, report=None, on_progress=None, job_id=None):
+    """Valida e inserta los registros por lotes con insert_many(ordered=False).
+
+    `prepare(record)` devuelve el documento a insertar o lanza ValueError,
+    KeyError o TypeError si el registro no es válido. `before_batch(records)`
+    se llama con los registros crudos de cada lote antes de validarlos, por
+    ejemplo para resolver referencias con una sola consulta.
+
+    Para reanudar una importación se pasa `skip` (filas ya procesadas) y el
+    `report` acumulado. `on_progress(report)` se llama después de escribir
+    cada lote; si devuelve True la importación se detiene. Con `job_id` cada
+    documento recibe el _id de `row_id`, así que el lote que se estaba
+    escribiendo cuando el proceso murió se puede repetir sin duplicarlo.
+    """
+    report = report or ImportReport()
+    if skip:
+        records = itertools.islice(records, skip, None)
+    for batch in _batches(records, batch_size, start=skip + 1):
+        if before_batch:
+            before_batch([record for _, record in batch if isinstance(record, dict)])
+
+        rows, docs = [], []
+        for row, record in batch:
+            report.processed += 1
+            if not isinstance(record, dict):
+                report.add_error(row, 'Se esperaba un objeto JSON')
+                continue
+            try:
+                doc = prepare(record)
+                if job_id is not None and row_id(job_id, row) is not None:
+                    doc['_id'] = row_id(job_id, row)
+                docs.append(doc)
+                rows.append(row)
+            except KeyError as e:
+                report.add_error(row, f'Falta el campo requerido {e}')
+            except (ValueError, TypeError) as e:
+                report.add_error(row, str(e))
+
+        _insert_batch(collection, rows, docs, report, retrying=job_id is not None)
+        if on_progress and on_progress(report):
+            report.cancelled = True
+            break
+    return report
+
+
+def require_text(record, field):
+    value = record[field]
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError(f'El campo "{field}" debe ser un texto no vacío')
+    return value.strip()
+
+
+def require_int(record, field, minimum=None):
+    value = record[field]
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f'El campo "{field}" debe ser un número entero')
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f'El campo "{field}" debe ser un número entero')
+    if minimum is not None and value < minimum:
+        raise ValueError(f'El campo "{field}" debe ser mayor o igual a {minimum}')
+    return value
@@ -0,0 +1,189 @@
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import PyMongoError
+
+# Todos los índices de los que depende la aplicación. Cada entrada es
+# (colección, claves, opciones); el nombre lo genera Mongo a partir de las claves.
+INDEXES = [
+    ('users', [('username', ASCENDING)], {'unique': True}),
+    ('teachers', [('email', ASCENDING)], {'unique': True}),
+    ('students', [('student_code', ASCENDING)], {'unique': True}),
+    ('subjects', [('name', ASCENDING), ('group', ASCENDING), ('career', ASCENDING)],
+     {'unique': True}),
+    # Paginación por cursor en los listados
+    ('students', [('name', ASCENDING), ('_id', ASCENDING)], {}),
+    ('teachers', [('name', ASCENDING), ('_id', ASCENDING)], {}),
+    ('subjects', [('name', ASCENDING), ('_id', ASCENDING)], {}),
+    ('subjects', [('career', ASCENDING), ('name', ASCENDING), ('_id', ASCENDING)], {}),
+    # Otros órdenes del listado (?sort=student_code, ?sort=career)
+    ('students', [('student_code', ASCENDING), ('_id', ASCENDING)], {}),
+    ('subjects', [('career', ASCENDING), ('_id', ASCENDING)], {}),
+    # Materias de un profesor y materias con cupo disponible
+    ('subjects', [('teacher_id', ASCENDING)], {}),
+    ('subjects', [('available_slots', ASCENDING)], {}),
+    # Fotos compartidas: antes de borrar una se busca quién más la usa
+    ('students', [('photo', ASCENDING)], {}),
+    ('teachers', [('photo', ASCENDING)], {}),
+    # Búsqueda por prefijo sobre las claves normalizadas (search.py)
+    ('students', [('search_keys', ASCENDING)], {}),
+    ('teachers', [('search_keys', ASCENDING)], {}),
+    ('subjects', [('search_keys', ASCENDING)], {}),
+    # Una matrícula por estudiante y materia; el prefijo student_id sirve
+    # también para buscar las matrículas de un estudiante
+    ('enrollments', [('student_id', ASCENDING), ('subject_id', ASCENDING)], {'unique': True}),
+    ('enrollments', [('subject_id', ASCENDING)], {}),
+]
+
+
+class IndexBuildError(Exception):
+    """Algunos índices no se pudieron crear; `created` tiene los que sí."""
+
+    def __init__(self, created, failures):
+        self.created = created
+        self.failures = failures  # [(colección.índice, mensaje)]
+        super().__init__('; '.join(f'{name}: {error}' for name, error in failures))
+
+
+def is_required(options):
+    # Los índices únicos sostienen reglas de los datos (una matrícula por
+    # estudiante y materia, un usuario por nombre); el resto sólo acelera consultas
+    return bool(options.get('unique'))
+
+
+def _key(keys, unique=False):
+    return tuple((field, direction) for field, direction in keys), bool(unique)
+
+
+def index_name(collection, keys):
+    return f"{collection}.{'_'.join(f'{field}_{direction}' for field, direction in keys)}"
+
+
+def missing_indexes(db, required_only=False):
+    """Devuelve las entradas del registro que todavía no existen en la base.
+
+    Un índice único cuenta como faltante si sólo existe sin `unique`.
+    """
+    existing = {}
+    missing = []
+    for collection, keys, options in INDEXES:
+        if required_only and not is_required(options):
+            continue
+        if collection not in existing:
+            existing[collection] = {
+                _key(info['key'], info.get('unique'))
+                for info in db[collection].index_information().values()
+            }
+        if _key(keys, options.get('unique')) not in existing[collection]:
+            missing.append((collection, keys, options))
+    return missing
+
+
+def ensure_indexes(db, required_only=False):
+    """Crea los índices que faltan y devuelve sus nombres como `colección.índice`.
+
+    Cada índice se crea por separado para que uno que falla (p. ej. uno único
+    sobre datos duplicados) no impida crear los demás; al final se lanza
+    IndexBuildError con los que fallaron.
+    """
+    created = []
+    failures = []
+    for collection, keys, options in missing_indexes(db, required_only):
+        try:
+            name = db[collection].create_indexes([IndexModel(keys, **options)])[0]
+            created.append(f'{collection}.{name}')
+        except PyMongoError as e:
+            failures.append((index_name(collection, keys), str(e)))
+    if failures:
+        raise IndexBuildError(created, failures)
+    return created
+
+
+# Formas de las consultas que hacen las rutas; los valores son de ejemplo
+# porque el plan sólo depende de los campos y operadores
+_ID = ObjectId()
+
+QUERY_SHAPES = [
+    ('login', 'users', {'username': 'admin'}, None),
+    ('teachers list', 'teachers', {'name': {'$regex': '^A'}}, [('name', 1), ('_id', 1)]),
+    ('teachers by email', 'teachers', {'email': {'$in': ['a@example.com']}}, None),
+    ('subjects list', 'subjects', {'name': {'$regex': '^A'}}, [('name', 1), ('_id', 1)]),
+    ('subjects by career', 'subjects', {'career': 'Ingeniería de Sistemas'},
+     [('name', 1), ('_id', 1)]),
+    ('subjects sorted by career', 'subjects', {}, [('career', 1), ('_id', 1)]),
+    ('subjects by teacher', 'subjects', {'teacher_id': _ID}, None),
+    ('subjects with slots', 'subjects',
+     {'_id': {'$nin': [_ID]}, 'available_slots': {'$gt': 0}}, None),
+    ('subject duplicate check', 'subjects',
+     {'name': 'Cálculo', 'group': 'A', 'career': 'Ingeniería de Sistemas'}, None),
+    ('students list', 'students', {'name': {'$regex': '^A'}}, [('name', 1), ('_id', 1)]),
+    ('students by code', 'students', {'student_code': {'$regex': '^2'}},
+     [('student_code', 1), ('_id', 1)]),
+    ('students by photo', 'students', {'photo': 'a.png'}, None),
+    ('teachers by photo', 'teachers', {'photo': 'a.png'}, None),
+    ('search students', 'students', {'search_keys': {'$regex': '^ana'}}, None),
+    ('search teachers', 'teachers', {'search_keys': {'$regex': '^ana'}}, None),
+    ('search subjects', 'subjects', {'search_keys': {'$regex': '^calc'}}, None),
+    ('enrollments of student', 'enrollments', {'student_id': _ID}, None),
+    ('enrollments of students', 'enrollments', {'student_id': {'$in': [_ID]}}, None),
+    ('enrollments of subject', 'enrollments', {'subject_id': _ID}, None),
+    ('enrollment pair', 'enrollments', {'student_id': _ID, 'subject_id': _ID}, None),
+]
+
+
+def _stages(plan):
+    # Recorre el plan ganador (find clásico o SBE) y junta sus etapas
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan
+        for key, value in plan.items():
+            if key != 'rejectedPlans':
+                yield from _stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _stages(value)
+
+
+# Más de esta cantidad de documentos o claves leídos por resultado devuelto
+# se reporta como consulta poco selectiva (con al menos MIN_EXAMINED leídos,
+# para que una colección casi vacía no dé falsos positivos)
+MAX_EXAMINED_RATIO = 10
+MIN_EXAMINED = 100
+
+
+def audit_queries(db):
+    """Ejecuta explain() sobre cada forma de consulta y reporta su plan.
+
+    Devuelve una lista de dicts con `name`, `collection`, `indexes` usados,
+    `collscan` (alguna etapa recorre la colección completa), `sort` (el orden
+    se hace en memoria en lugar de salir del índice), `examined`, `returned`,
+    `ratio` y `problems`, la lista de lo anterior que falló.
+    """
+    results = []
+    for name, collection, query, sort in QUERY_SHAPES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = cursor.explain()
+        plan = explain.get('queryPlanner', {}).get('winningPlan', {})
+        stats = explain.get('executionStats', {})
+        stages = list(_stages(plan))
+        returned = stats.get('nReturned', 0)
+        examined = max(stats.get('totalDocsExamined', 0), stats.get('totalKeysExamined', 0))
+        ratio = examined / max(returned, 1)
+        row = {
+            'name': name,
+            'collection': collection,
+            'indexes': sorted({s['indexName'] for s in stages if s.get('indexName')}),
+            'collscan': any(s['stage'] == 'COLLSCAN' for s in stages),
+            'sort': any(s['stage'] == 'SORT' for s in stages),
+            'examined': examined,
+            'returned': returned,
+            'ratio': round(ratio, 1)
+        }
+        row['problems'] = [problem for problem, failed in (
+            ('COLLSCAN', row['collscan']),
+            ('SORT', row['sort']),
+            ('RATIO', examined >= MIN_EXAMINED and ratio > MAX_EXAMINED_RATIO)
+        ) if failed]
+        results.append(row)
+    return results
@@ -0,0 +1,262 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from bson import ObjectId
+from importer import ImportReport
+
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+INTERRUPTED = 'interrupted'
+
+RESUMABLE = (FAILED, CANCELLED, INTERRUPTED)
+
+
+class ImportJobs:
+    """Ejecuta importaciones en segundo plano y guarda su progreso en Mongo.
+
+    Cada tipo de importación se registra con `register(kind, handler)`, donde
+    `handler(path, skip, report, on_progress, job_id)` procesa el archivo y
+    devuelve el ImportReport final. El estado vive en la colección `jobs`, así que
+    cualquier proceso puede consultarlo, cancelarlo o reanudarlo.
+
+    Mientras un trabajo corre, un hilo actualiza su `heartbeat_at` cada
+    `stale_after / 4` segundos aunque el lote actual tarde; sólo un trabajo
+    RUNNING sin latido reciente se considera interrumpido.
+    """
+
+    def __init__(self, collection, upload_folder, max_workers=2, stale_after=120,
+                 context=None):
+        self.collection = collection
+        self.upload_folder = upload_folder
+        self.stale_after = stale_after
+        self.context = context
+        self.handlers = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='import-job')
+        # Trabajos encolados o en ejecución en este proceso
+        self._futures = {}
+        self._running = set()
+        self._lock = threading.Lock()
+        self._heartbeat = None
+        self._pid = None
+
+    def register(self, kind, handler):
+        self.handlers[kind] = handler
+
+    def submit(self, kind, file, user_id=None):
+        if not os.path.exists(self.upload_folder):
+            os.makedirs(self.upload_folder)
+
+        job_id = ObjectId()
+        path = os.path.join(self.upload_folder, f'{job_id}.json')
+        file.save(path)
+
+        self.collection.insert_one({
+            '_id': job_id,
+            'kind': kind,
+            'filename': file.filename,
+            'path': path,
+            'user_id': user_id,
+            'status': QUEUED,
+            'cancel_requested': False,
+            'processed': 0,
+            'inserted': 0,
+            'failed': 0,
+            'errors': [],
+            'rows_per_second': 0,
+            'created_at': datetime.now(),
+            'updated_at': datetime.now()
+        })
+        self._submit(job_id)
+        return job_id
+
+    def _submit(self, job_id):
+        with self._lock:
+            self._futures = {key: future for key, future in self._futures.items()
+                             if not future.done()}
+            self._futures[job_id] = self.executor.submit(self._run, job_id)
+
+    def _pending_here(self, job_id):
+        future = self._futures.get(job_id)
+        return future is not None and not future.done()
+
+    def get(self, job_id):
+        job = self.collection.find_one({'_id': ObjectId(job_id)})
+        if job and self._is_stale(job):
+            # El proceso que ejecutaba el trabajo murió sin terminarlo
+            job['status'] = INTERRUPTED
+        return job
+
+    def cancel(self, job_id):
+        # Un trabajo en cola se cancela de inmediato; uno en ejecución se
+        # detiene al terminar el lote actual
+        result = self.collection.update_one(
+            {'_id': ObjectId(job_id), 'status': QUEUED},
+            {'$set': {'status': CANCELLED, 'updated_at': datetime.now()}}
+        )
+        if result.modified_count:
+            return True
+        result = self.collection.update_one(
+            {'_id': ObjectId(job_id), 'status': RUNNING},
+            {'$set': {'cancel_requested': True}}
+        )
+        return result.modified_count > 0
+
+    def resume(self, job_id):
+        job_id = ObjectId(job_id)
+        if self._pending_here(job_id):
+            return False  # Sigue en cola o corriendo en este proceso
+        job = self.collection.find_one({'_id': job_id}, {'path': 1})
+        if not job or not os.path.exists(job['path']):
+            return False
+
+        # Se reclama de forma condicional: si dos procesos intentan reanudar
+        # el mismo trabajo (o su dueño sigue latiendo) sólo uno lo consigue
+        stale = datetime.now() - timedelta(seconds=self.stale_after)
+        job = self.collection.find_one_and_update(
+            {
+                '_id': job_id,
+                '$or': [
+                    {'status': {'$in': list(RESUMABLE)}},
+                    {'status': RUNNING, 'heartbeat_at': {'$lt': stale}},
+                    {'status': RUNNING, 'heartbeat_at': {'$exists': False},
+                     'updated_at': {'$lt': stale}}
+                ]
+            },
+            {'$set': {
+                'status': QUEUED,
+                'cancel_requested': False,
+                'heartbeat_at': datetime.now(),
+                'updated_at': datetime.now()
+            }}
+        )
+        if not job:
+            return False
+        self._submit(job_id)
+        return True
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _is_stale(self, job):
+        # Un trabajo en cola espera su turno detrás de otros: nunca está caído
+        if job['status'] != RUNNING or self._pending_here(job['_id']):
+            return False
+        beat = job.get('heartbeat_at', job['updated_at'])
+        return beat < datetime.now() - timedelta(seconds=self.stale_after)
+
+    def _beat(self):
+        interval = max(self.stale_after / 4, 1)
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                running = list(self._running)
+            if not running:
+                continue
+            try:
+                self.collection.update_many(
+                    {'_id': {'$in': running}, 'status': RUNNING},
+                    {'$set': {'heartbeat_at': datetime.now()}}
+                )
+            except Exception:
+                pass  # Se reintenta en el siguiente latido
+
+    def _ensure_heartbeat(self):
+        # Después de un fork el hilo no existe en el proceso hijo
+        with self._lock:
+            if self._heartbeat is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._heartbeat = threading.Thread(target=self._beat, name='import-heartbeat',
+                                                   daemon=True)
+                self._heartbeat.start()
+
+    def _run(self, job_id):
+        self._ensure_heartbeat()
+        try:
+            if self.context:
+                with self.context():
+                    self._execute(job_id)
+            else:
+                self._execute(job_id)
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+
+    def _execute(self, job_id):
+        job = self.collection.find_one_and_update(
+            {'_id': job_id, 'status': QUEUED},
+            {'$set': {'status': RUNNING, 'started_at': datetime.now(),
+                      'heartbeat_at': datetime.now(), 'updated_at': datetime.now()}}
+        )
+        if not job:
+            return
+        with self._lock:
+            self._running.add(job_id)
+
+        # Al reanudar se continúa con los contadores ya guardados
+        report = ImportReport(job['processed'], job['inserted'], job['failed'], job['errors'])
+        skip = job['processed']
+        started = time.monotonic()
+        flushed_errors = len(report.errors)
+
+        def on_progress(report):
+            nonlocal flushed_errors
+            elapsed = max(time.monotonic() - started, 1e-6)
+            update = {
+                '$set': {
+                    'processed': report.processed,
+                    'inserted': report.inserted,
+                    'failed': report.failed,
+                    'rows_per_second': round((report.processed - skip) / elapsed, 1),
+                    'updated_at': datetime.now()
+                }
+            }
+            if len(report.errors) > flushed_errors:
+                update['$push'] = {'errors': {'$each': report.errors[flushed_errors:]}}
+                flushed_errors = len(report.errors)
+            current = self.collection.find_one_and_update(
+                {'_id': job_id}, update, projection={'cancel_requested': 1}
+            )
+            return bool(current and current.get('cancel_requested'))
+
+        try:
+            handler = self.handlers[job['kind']]
+            report = handler(job['path'], skip, report, on_progress, job_id)
+        except Exception as e:
+            self.collection.update_one(
+                {'_id': job_id},
+                {'$set': {'status': FAILED, 'error': str(e), 'updated_at': datetime.now()}}
+            )
+            return
+
+        status = CANCELLED if report.cancelled else COMPLETED
+        self.collection.update_one(
+            {'_id': job_id},
+            {'$set': {'status': status, 'finished_at': datetime.now(),
+                      'updated_at': datetime.now()}}
+        )
+        if status == COMPLETED and os.path.exists(job['path']):
+            os.remove(job['path'])
+
+
+def job_to_json(job):
+    return {
+        'id': str(job['_id']),
+        'kind': job['kind'],
+        'filename': job.get('filename'),
+        'status': job['status'],
+        'processed': job['processed'],
+        'inserted': job['inserted'],
+        'failed': job['failed'],
+        'rows_per_second': job.get('rows_per_second', 0),
+        'errors': job.get('errors', [])[:100],
+        'error': job.get('error'),
+        'resumable': job['status'] in RESUMABLE,
+        'created_at': job['created_at'].isoformat(),
+        'updated_at': job['updated_at'].isoformat()
+    }
@@ -0,0 +1,89 @@
+from flask import g
+
+
+class DataLoader:
+    """Agrupa las claves pedidas y las resuelve con una sola consulta.
+
+    `batch_fn` recibe una lista de claves y devuelve un dict clave -> valor.
+    Los resultados quedan memorizados, así que pedir de nuevo una clave ya
+    resuelta no genera otra consulta.
+    """
+
+    def __init__(self, batch_fn, default=None):
+        self.batch_fn = batch_fn
+        self.default = default
+        self._memo = {}
+        self._pending = []
+
+    def want(self, *keys):
+        # Encola claves para resolverlas todas juntas en el próximo dispatch
+        for key in keys:
+            if key is not None and key not in self._memo:
+                self._pending.append(key)
+        return self
+
+    def dispatch(self):
+        pending = list(dict.fromkeys(k for k in self._pending if k not in self._memo))
+        self._pending = []
+        if not pending:
+            return
+        results = self.batch_fn(pending)
+        for key in pending:
+            self._memo[key] = results.get(key, self.default)
+
+    def load(self, key):
+        self.want(key)
+        self.dispatch()
+        return self._memo.get(key, self.default)
+
+    def load_many(self, keys):
+        keys = list(keys)
+        self.want(*keys)
+        self.dispatch()
+        return [self._memo.get(key, self.default) for key in keys]
+
+    def clear(self, key=None):
+        if key is None:
+            self._memo.clear()
+        else:
+            self._memo.pop(key, None)
+
+
+class Loaders:
+    """Loaders por colección, uno por request."""
+
+    def __init__(self, db):
+        self.db = db
+        self.subjects = DataLoader(self._by_id(db['subjects']))
+        self.teachers = DataLoader(self._by_id(db['teachers']))
+        self.students = DataLoader(self._by_id(db['students']))
+        self.teachers_by_email = DataLoader(self._by_field(db['teachers'], 'email'))
+        self.enrollment_counts = DataLoader(self._count_enrollments, default=0)
+
+    @staticmethod
+    def _by_id(collection):
+        def batch(ids):
+            return {doc['_id']: doc for doc in collection.find({'_id': {'$in': ids}})}
+        return batch
+
+    @staticmethod
+    def _by_field(collection, field):
+        def batch(values):
+            return {doc[field]: doc for doc in collection.find({field: {'$in': values}})}
+        return batch
+
+    def _count_enrollments(self, student_ids):
+        return {
+            row['_id']: row['count']
+            for row in self.db['enrollments'].aggregate([
+                {'$match': {'student_id': {'$in': student_ids}}},
+                {'$group': {'_id': '$student_id', 'count': {'$sum': 1}}}
+            ])
+        }
+
+
+def get_loaders(db):
+    # Memo con alcance de request: se crea una vez y vive en flask.g
+    if 'loaders' not in g:
+        g.loaders = Loaders(db)
+    return g.loaders
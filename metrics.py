@@ -0,0 +1,234 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from flask import g, request
+from pymongo.monitoring import CommandListener
+
+logger = logging.getLogger(__name__)
+
+SLOW_COMMAND_MS = int(os.getenv('MONGO_SLOW_MS', 100))
+
+ROUTE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COMMAND_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+# Endpoint y estadísticas de Mongo del request actual. fan_out copia el
+# contexto a sus hilos, así que sus consultas se atribuyen al mismo request
+current_endpoint = contextvars.ContextVar('current_endpoint', default='background')
+current_stats = contextvars.ContextVar('current_stats', default=None)
+
+
+class Histogram:
+    """Histograma acumulado por combinación de etiquetas, al estilo Prometheus."""
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label_values, (buckets, count, total) in sorted(self._series.items()):
+                labels = _labels(zip(self.labels, label_values))
+                for bound, value in zip(self.buckets, buckets):
+                    lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {value}')
+                lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f'{self.name}_count{{{labels}}} {count}')
+                lines.append(f'{self.name}_sum{{{labels}}} {total:.6f}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{{{_labels(zip(self.labels, label_values))}}} {value}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+
+
+def gauges(name, help, values):
+    """Líneas de un gauge sin etiquetas por cada `clave: valor` numérico."""
+    lines = []
+    for key, value in values.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        lines += [f'# HELP {name}_{key} {help} ({key})', f'# TYPE {name}_{key} gauge',
+                  f'{name}_{key} {value}']
+    return lines
+
+
+request_latency = Histogram('http_request_duration_seconds', 'Latencia de cada ruta',
+                            ('endpoint', 'method', 'status'), ROUTE_BUCKETS)
+command_latency = Histogram('mongodb_command_duration_seconds',
+                            'Duración de cada comando de MongoDB',
+                            ('endpoint', 'command', 'collection'), COMMAND_BUCKETS)
+command_documents = Counter('mongodb_documents_returned_total',
+                            'Documentos devueltos por MongoDB', ('endpoint', 'command', 'collection'))
+command_failures = Counter('mongodb_command_failures_total', 'Comandos de MongoDB fallidos',
+                           ('endpoint', 'command', 'collection'))
+
+
+class RequestStats:
+    # Mutable a propósito: los hilos de fan_out suman sobre el mismo objeto
+    def __init__(self):
+        self.round_trips = 0
+        self.duration = 0.0
+        self.documents = 0
+        self._lock = threading.Lock()
+
+    def add(self, duration, documents):
+        with self._lock:
+            self.round_trips += 1
+            self.duration += duration
+            self.documents += documents
+
+
+def _returned_documents(reply):
+    # Sólo los lotes de cursor (find, aggregate, getMore); el `n` de insert,
+    # update o delete son documentos escritos, no devueltos
+    cursor = reply.get('cursor')
+    if isinstance(cursor, dict):
+        return len(cursor.get('firstBatch', cursor.get('nextBatch', [])))
+    return 0
+
+
+class CommandMonitor(CommandListener):
+    """Atribuye cada comando de pymongo al endpoint que lo originó."""
+
+    # Comandos internos del driver que no vienen de las rutas
+    IGNORED = {'hello', 'ismaster', 'isMaster', 'ping', 'saslStart', 'saslContinue',
+               'endSessions', 'buildInfo'}
+
+    def __init__(self, slow_ms=SLOW_COMMAND_MS):
+        self.slow_ms = slow_ms
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _key(self, event):
+        return event.request_id, event.connection_id, event.operation_id
+
+    def started(self, event):
+        if event.command_name in self.IGNORED:
+            return
+        collection = event.command.get(event.command_name)
+        if event.command_name == 'getMore':
+            collection = event.command.get('collection')
+        if not isinstance(collection, str):
+            collection = ''
+        summary = None
+        if self.slow_ms is not None:
+            # Sólo las claves del filtro para no escribir datos en el log
+            query = event.command.get('filter') or event.command.get('pipeline')
+            summary = list(query) if isinstance(query, dict) else (
+                [next(iter(stage), '') for stage in query] if isinstance(query, list) else None)
+        with self._lock:
+            self._pending[self._key(event)] = (
+                current_endpoint.get(), current_stats.get(), collection, summary
+            )
+
+    def _finish(self, event):
+        with self._lock:
+            return self._pending.pop(self._key(event), None)
+
+    def succeeded(self, event):
+        info = self._finish(event)
+        if info is None:
+            return
+        endpoint, stats, collection, summary = info
+        duration = event.duration_micros / 1e6
+        documents = _returned_documents(event.reply)
+        command_latency.observe(duration, endpoint, event.command_name, collection)
+        command_documents.inc(documents, endpoint, event.command_name, collection)
+        if stats is not None:
+            stats.add(duration, documents)
+        if self.slow_ms is not None and duration * 1000 >= self.slow_ms:
+            logger.warning('Slow MongoDB %s on %s from %s: %.1f ms, %d docs, shape %s',
+                           event.command_name, collection, endpoint, duration * 1000,
+                           documents, summary)
+
+    def failed(self, event):
+        info = self._finish(event)
+        if info is None:
+            return
+        endpoint, stats, collection, _ = info
+        command_latency.observe(event.duration_micros / 1e6, endpoint, event.command_name,
+                                collection)
+        command_failures.inc(1, endpoint, event.command_name, collection)
+        if stats is not None:
+            stats.add(event.duration_micros / 1e6, 0)
+
+
+command_monitor = CommandMonitor()
+
+
+def init_app(app):
+    """Mide la latencia de cada ruta y agrega Server-Timing con el uso de Mongo."""
+
+    @app.before_request
+    def start_request_metrics():
+        current_endpoint.set(request.endpoint or 'unknown')
+        current_stats.set(RequestStats())
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            request_latency.observe(time.perf_counter() - started, request.endpoint or 'unknown',
+                                    request.method, response.status_code)
+        stats = current_stats.get()
+        if stats is not None:
+            response.headers.add('Server-Timing',
+                                 f'mongo;dur={stats.duration * 1000:.1f};'
+                                 f'desc="{stats.round_trips} round trips, {stats.documents} docs"')
+        return response
+
+    @app.teardown_request
+    def reset_request_metrics(exc=None):
+        current_endpoint.set('background')
+        current_stats.set(None)
+
+
+def render(extra=()):
+    lines = []
+    for metric in (request_latency, command_latency, command_documents, command_failures):
+        lines += metric.render()
+    lines += list(extra)
+    return '\n'.join(lines) + '\n'
+
@@ -1,32 +1,166 @@
 from pymongo import MongoClient
+from pymongo.monitoring import ConnectionPoolListener
 from dotenv import load_dotenv
+from indexes import ensure_indexes
+from metrics import command_monitor
 import os
+import threading
 
 load_dotenv()
 
+
+def _env_int(name, default=None):
+    value = os.getenv(name)
+    return int(value) if value not in (None, '') else default
+
+
+def pool_options():
+    # Opciones del pool y timeouts leídas del entorno; las que no se
+    # definen quedan con el valor por defecto de pymongo
+    options = {
+        'maxPoolSize': _env_int('MONGO_MAX_POOL_SIZE', 100),
+        'minPoolSize': _env_int('MONGO_MIN_POOL_SIZE', 0),
+        'maxIdleTimeMS': _env_int('MONGO_MAX_IDLE_TIME_MS'),
+        'waitQueueTimeoutMS': _env_int('MONGO_WAIT_QUEUE_TIMEOUT_MS'),
+        'connectTimeoutMS': _env_int('MONGO_CONNECT_TIMEOUT_MS'),
+        'socketTimeoutMS': _env_int('MONGO_SOCKET_TIMEOUT_MS'),
+        'serverSelectionTimeoutMS': _env_int('MONGO_SERVER_SELECTION_TIMEOUT_MS'),
+        'appname': os.getenv('MONGO_APP_NAME', 'school_management'),
+    }
+    compressors = os.getenv('MONGO_COMPRESSORS')  # p. ej. "zstd,snappy,zlib"
+    if compressors:
+        options['compressors'] = compressors
+    return {key: value for key, value in options.items() if value is not None}
+
+
+class PoolStats(ConnectionPoolListener):
+    """Cuenta el uso del pool de conexiones para poder dimensionarlo por worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.timeouts = 0
+        self.pool_clears = 0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'open': self.open,
+                'in_use': self.in_use,
+                'max_in_use': self.max_in_use,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'timeouts': self.timeouts,
+                'pool_clears': self.pool_clears,
+            }
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open = max(self.open - 1, 0)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+            if event.reason == 'timeout':
+                self.timeouts += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use = max(self.in_use - 1, 0)
+
+
 class Database:
+    """Conexión única a MongoDB compartida por app.py, auth.py y el resto de módulos.
+
+    El cliente se crea la primera vez que se usa, no al importar el módulo,
+    y con connect=False: no abre sockets ni hilos de monitoreo hasta la
+    primera operación, así que puede crearse antes de un fork siempre que
+    sólo los procesos hijos lo usen.
+    """
+
     def __init__(self):
         self.uri = os.getenv("MONGO_URI")
         self.db_name = os.getenv("DB_NAME", "school_management")
-        self.client = MongoClient(self.uri)
-        self.db = self.client[self.db_name]
-        
-        # Collections
-        self.users = self.db['users']
-        self.teachers = self.db['teachers']
-        self.subjects = self.db['subjects']
-        self.students = self.db['students']
-        self.enrollments = self.db['enrollments']
-        
-        # Create indexes
-        self._create_indexes()
-    
-    def _create_indexes(self):
-        self.users.create_index('username', unique=True)
-        self.teachers.create_index('email', unique=True)
-        self.students.create_index('student_code', unique=True)
-        self.subjects.create_index([('name', 1), ('group', 1), ('career', 1)], unique=True)
-    
+        self.options = pool_options()
+        self.pool_stats = PoolStats()
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = MongoClient(
+                        self.uri,
+                        connect=False,
+                        event_listeners=[self.pool_stats, command_monitor],
+                        **self.options
+                    )
+        return self._client
+
+    @property
+    def db(self):
+        return self.client[self.db_name]
+
+    # Collections
+    @property
+    def users(self):
+        return self.db['users']
+
+    @property
+    def teachers(self):
+        return self.db['teachers']
+
+    @property
+    def subjects(self):
+        return self.db['subjects']
+
+    @property
+    def students(self):
+        return self.db['students']
+
+    @property
+    def enrollments(self):
+        return self.db['enrollments']
+
+    def create_indexes(self, required_only=False):
+        # Crea sólo los índices del registro (indexes.py) que falten
+        return ensure_indexes(self.db, required_only)
+
     def get_db_status(self):
         try:
             # Test the connection
@@ -41,4 +175,17 @@ class Database:
                 'error': str(e)
             }
 
-db = Database()
\ No newline at end of file
+    def get_pool_stats(self):
+        options = self.client.options.pool_options
+        stats = self.pool_stats.snapshot()
+        stats.update({
+            'max_pool_size': options.max_pool_size,
+            'min_pool_size': options.min_pool_size,
+            'max_idle_time_seconds': options.max_idle_time_seconds,
+            'wait_queue_timeout': options.wait_queue_timeout,
+            'compressors': self.options.get('compressors', '')
+        })
+        return stats
+
+
+db = Database()
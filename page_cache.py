@@ -0,0 +1,70 @@
+import hashlib
+from functools import wraps
+from flask import current_app, get_flashed_messages, make_response, request, session
+from cache import LRUCache
+
+
+class PageCache:
+    """Cache de páginas HTML indexado por ruta, argumentos y versión de colecciones.
+
+    `@page_cache.cached('students', 'enrollments')` guarda la respuesta de un
+    GET hasta que alguna de esas colecciones cambie de versión. El ETag sale de
+    la misma clave, así que un If-None-Match válido responde 304 sin renderizar.
+    """
+
+    def __init__(self, versions, max_bytes=32 * 1024 * 1024, enabled=True):
+        self.versions = versions
+        self.enabled = enabled
+        self.cache = LRUCache(max_bytes)
+        self.not_modified = 0
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats['not_modified'] = self.not_modified
+        stats['enabled'] = self.enabled
+        return stats
+
+    def clear(self):
+        self.cache.clear()
+
+    def _key(self, collections, view_args):
+        # La página depende también del usuario (menú de admin y nombre en la barra)
+        return (
+            request.endpoint,
+            tuple(sorted(view_args.items())),
+            tuple(sorted(request.args.items(multi=True))),
+            session.get('username'),
+            bool(session.get('is_admin')),
+            self.versions.get(collections)
+        )
+
+    def cached(self, *collections):
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                # Los mensajes flash pendientes se muestran una sola vez: no se cachean
+                if not self.enabled or request.method != 'GET' or session.get('_flashes'):
+                    return view(*args, **kwargs)
+
+                key = self._key(collections, kwargs)
+                etag = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+                if request.if_none_match.contains(etag):
+                    self.not_modified += 1
+                    response = current_app.response_class(status=304)
+                else:
+                    entry = self.cache.get(key)
+                    if entry is not None:
+                        body, mimetype = entry
+                        response = current_app.response_class(body, mimetype=mimetype)
+                    else:
+                        response = make_response(view(*args, **kwargs))
+                        # No se guarda una página que mostró mensajes flash o falló
+                        if response.status_code != 200 or get_flashed_messages():
+                            return response
+                        body = response.get_data()
+                        self.cache.set(key, (body, response.mimetype), size=len(body))
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'private, no-cache'
+                return response
+            return wrapper
+        return decorator
@@ -0,0 +1,112 @@
+import base64
+import re
+from bson import json_util
+
+
+class Page:
+    """Una página acotada de resultados con cursores para navegar."""
+
+    def __init__(self, items, sort_field, has_next, has_prev):
+        self.items = items
+        self.sort_field = sort_field
+        self.has_next = has_next
+        self.has_prev = has_prev
+
+    @property
+    def next_cursor(self):
+        if self.has_next and self.items:
+            return encode_cursor(self.items[-1], self.sort_field)
+        return None
+
+    @property
+    def prev_cursor(self):
+        if self.has_prev and self.items:
+            return encode_cursor(self.items[0], self.sort_field)
+        return None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(document, sort_field):
+    # El cursor guarda el valor de la clave de orden y el _id como desempate
+    value = [document.get(sort_field), document['_id']]
+    raw = json_util.dumps(value).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        value, last_id = json_util.loads(base64.urlsafe_b64decode(padded))
+        return value, last_id
+    except Exception:
+        # Un cursor corrupto se trata como si no existiera
+        return None
+
+
+def prefix_filter(prefix):
+    # Regex anclada y sensible a mayúsculas para que Mongo use los límites del índice
+    return {'$regex': '^' + re.escape(prefix)}
+
+
+def _keyset_condition(sort_field, cursor, op):
+    value, last_id = cursor
+    if sort_field == '_id':
+        return {'_id': {op: last_id}}
+    return {'$or': [
+        {sort_field: {op: value}},
+        {sort_field: value, '_id': {op: last_id}}
+    ]}
+
+
+def get_page_size(args, default=25, maximum=100):
+    try:
+        size = int(args.get('per_page', default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, maximum))
+
+
+def paginate(collection, query=None, sort_field='_id', direction=1, after=None,
+             before=None, page_size=25, projection=None, pipeline=None):
+    """Lee una sola página usando paginación por keyset sobre (sort_field, _id).
+
+    `after` y `before` son cursores opacos generados por `encode_cursor`.
+    Si se pasa `pipeline`, sus etapas se ejecutan sólo sobre los documentos
+    de la página (p. ej. un $lookup), después del $sort y el $limit.
+    """
+    query = dict(query or {})
+    after = decode_cursor(after)
+    before = None if after else decode_cursor(before)
+
+    backwards = before is not None
+    cursor = before if backwards else after
+    sort_dir = -direction if backwards else direction
+
+    if cursor is not None:
+        op = '$gt' if sort_dir == 1 else '$lt'
+        condition = _keyset_condition(sort_field, cursor, op)
+        query = {'$and': [query, condition]} if query else condition
+
+    sort = [(sort_field, sort_dir)]
+    if sort_field != '_id':
+        sort.append(('_id', sort_dir))
+
+    stages = [{'$match': query}, {'$sort': dict(sort)}, {'$limit': page_size + 1}]
+    if projection:
+        stages.append({'$project': projection})
+    stages.extend(pipeline or [])
+    items = list(collection.aggregate(stages))
+
+    has_more = len(items) > page_size
+    items = items[:page_size]
+    if backwards:
+        items.reverse()
+        return Page(items, sort_field, has_next=True, has_prev=has_more)
+    return Page(items, sort_field, has_next=has_more, has_prev=cursor is not None)
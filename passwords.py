@@ -0,0 +1,73 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HasherBusy(Exception):
+    def __init__(self):
+        super().__init__('Too many logins in progress, please try again in a moment.')
+
+
+class PasswordHasher:
+    """Genera y verifica hashes en un pool acotado de hilos.
+
+    PBKDF2 y scrypt liberan el GIL, así que `workers` hilos usan hasta
+    `workers` núcleos y el resto de los requests sigue atendiéndose. Si ya
+    hay `max_pending` operaciones en curso o en cola (o el hash no termina en
+    `timeout` segundos) se lanza HasherBusy en lugar de seguir encolando.
+
+    `method` es el de werkzeug (p. ej. 'scrypt' o 'pbkdf2:sha256:600000');
+    un hash guardado con otros parámetros se marca para rehacer con
+    `needs_rehash`.
+    """
+
+    def __init__(self, method='scrypt', workers=2, max_pending=64, timeout=10):
+        self.method = method
+        self.timeout = timeout
+        self._executor = None
+        self._workers = workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pid = None
+        # Un hash de referencia: da el prefijo exacto que escribe werkzeug y
+        # sirve para gastar el mismo tiempo cuando el usuario no existe
+        self._dummy = generate_password_hash('dummy-password', method=method)
+        self.prefix = self._dummy.split('$', 1)[0]
+
+    def _get_executor(self):
+        # Después de un fork los hilos del pool no existen en el hijo
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self._workers,
+                                                        thread_name_prefix='password')
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        # El cupo se libera cuando el hash termina, no cuando el request deja
+        # de esperarlo: así max_pending sigue acotando el uso de CPU
+        future.add_done_callback(lambda future: self._slots.release())
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            raise HasherBusy()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored_hash, password):
+        # Sin usuario se verifica igual contra el hash de referencia
+        matches = self._run(check_password_hash, stored_hash or self._dummy, password)
+        return matches and stored_hash is not None
+
+    def needs_rehash(self, stored_hash):
+        return stored_hash.split('$', 1)[0] != self.prefix
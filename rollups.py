@@ -0,0 +1,249 @@
+from collections import Counter
+from datetime import datetime
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from fanout import fan_out
+
+ROLLUP_ID = 'reports'
+REPORTS = ('subjects_by_career', 'students_by_credits', 'subjects_by_slots')
+# Las agregaciones completas pueden tardar más que una consulta de página
+REBUILD_TIMEOUT = 120
+# Reintentos de rebuild() si llegan incrementos mientras se recalcula
+REBUILD_ATTEMPTS = 3
+
+
+def credits_bucket(total_credits):
+    # Los estudiantes sin matrículas no aparecen en el histograma
+    if not total_credits:
+        return None
+    if total_credits <= 10:
+        return '0-10'
+    if total_credits <= 15:
+        return '11-15'
+    if total_credits <= 20:
+        return '16-20'
+    return '20+'
+
+
+def slots_bucket(available_slots):
+    if available_slots == 0:
+        return 'Full'
+    if available_slots is None or available_slots <= 5:
+        return '1-5'
+    if available_slots <= 10:
+        return '6-10'
+    return '10+'
+
+
+CREDITS_SWITCH = {
+    '$switch': {
+        'branches': [
+            {'case': {'$lte': ['$total_credits', 10]}, 'then': '0-10'},
+            {'case': {'$lte': ['$total_credits', 15]}, 'then': '11-15'},
+            {'case': {'$lte': ['$total_credits', 20]}, 'then': '16-20'}
+        ],
+        'default': '20+'
+    }
+}
+
+SLOTS_SWITCH = {
+    '$switch': {
+        'branches': [
+            {'case': {'$eq': ['$available_slots', 0]}, 'then': 'Full'},
+            {'case': {'$lte': ['$available_slots', 5]}, 'then': '1-5'},
+            {'case': {'$lte': ['$available_slots', 10]}, 'then': '6-10'},
+            {'case': {'$gt': ['$available_slots', 10]}, 'then': '10+'}
+        ],
+        'default': 'Unknown'
+    }
+}
+
+
+class ReportRollups:
+    """Mantiene los datos de /reports pre-agregados en un solo documento.
+
+    Cada reporte es una lista de `{'_id': bucket, 'count': n}` dentro del
+    documento `reports` de la colección `report_rollups`. Las rutas de
+    escritura llaman a los métodos `on_*` para ajustar los contadores y
+    `rebuild()` recalcula todo desde cero con $merge.
+
+    El recálculo se arma en un documento aparte y reemplaza al vigente sólo
+    si su campo `version` (que sube con cada incremento) no cambió mientras
+    tanto; así un fallo no deja los reportes vacíos y no se pierden los
+    incrementos que llegan durante el recálculo.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.collection = db['report_rollups']
+
+    def get(self):
+        doc = self.collection.find_one({'_id': ROLLUP_ID})
+        if doc is None:
+            self.rebuild()
+            doc = self.collection.find_one({'_id': ROLLUP_ID}) or {}
+        return {
+            name: sorted(
+                (row for row in doc.get(name, []) if row['count'] > 0),
+                key=lambda row: -row['count']
+            )
+            for name in REPORTS
+        }
+
+    def rebuild(self):
+        """Recalcula los reportes; devuelve True si reemplazó el documento vigente."""
+        for _ in range(REBUILD_ATTEMPTS):
+            current = self.collection.find_one({'_id': ROLLUP_ID}, {'version': 1})
+            version = current.get('version') if current else None
+            staged = self._build()
+            staged['version'] = version or 0
+            try:
+                if current is None:
+                    self.collection.insert_one(dict(staged, _id=ROLLUP_ID))
+                    return True
+                # Reemplazo atómico, sólo si nadie incrementó mientras tanto
+                result = self.collection.replace_one(
+                    {'_id': ROLLUP_ID,
+                     'version': {'$exists': False} if version is None else version},
+                    staged
+                )
+                if result.matched_count:
+                    return True
+            except DuplicateKeyError:
+                pass  # Otro proceso creó el documento; se recalcula sobre el suyo
+        # Sigue el documento vigente, que se mantuvo con los incrementos
+        return False
+
+    def _build(self):
+        # Arma los reportes en un documento temporal y devuelve su contenido
+        staging_id = f'{ROLLUP_ID}:staging:{ObjectId()}'
+        merge = {
+            '$merge': {
+                'into': 'report_rollups',
+                'on': '_id',
+                'whenMatched': 'merge',
+                'whenNotMatched': 'insert'
+            }
+        }
+
+        def collect(name):
+            return [
+                {'$group': {'_id': staging_id, name: {'$push': {'_id': '$_id', 'count': '$count'}}}},
+                merge
+            ]
+
+        # Si una colección está vacía el $merge no escribe nada, así que se
+        # parte de un documento con los reportes vacíos
+        self.collection.insert_one({'_id': staging_id} | {name: [] for name in REPORTS})
+
+        # Cada reporte escribe un campo distinto, así que corren en paralelo
+        pipelines = {
+            'subjects_by_career': ('subjects', [
+                {'$group': {'_id': '$career', 'count': {'$sum': 1}}}
+            ]),
+            'students_by_credits': ('enrollments', [
+                {
+                    '$lookup': {
+                        'from': 'subjects',
+                        'localField': 'subject_id',
+                        'foreignField': '_id',
+                        'as': 'subject'
+                    }
+                },
+                {'$unwind': '$subject'},
+                # Los créditos guardados en la matrícula, como en los incrementos
+                {'$group': {'_id': '$student_id', 'total_credits': {
+                    '$sum': {'$ifNull': ['$credits', '$subject.credits']}
+                }}},
+                {'$group': {'_id': CREDITS_SWITCH, 'count': {'$sum': 1}}}
+            ]),
+            'subjects_by_slots': ('subjects', [
+                {'$group': {'_id': SLOTS_SWITCH, 'count': {'$sum': 1}}}
+            ])
+        }
+
+        def run(name, source, stages):
+            return lambda: self.db[source].aggregate(stages + collect(name))
+
+        try:
+            fan_out({name: run(name, *spec) for name, spec in pipelines.items()},
+                    timeout=REBUILD_TIMEOUT)
+            staged = self.collection.find_one({'_id': staging_id}, {'_id': 0})
+        finally:
+            self.collection.delete_one({'_id': staging_id})
+        staged['updated_at'] = datetime.now()
+        return staged
+
+    def _inc(self, report, bucket, amount):
+        if bucket is None or amount == 0:
+            return
+        # Incrementa el bucket si ya existe; si no, lo agrega a la lista
+        # `version` avisa a un rebuild() en curso que su resultado quedó viejo
+        result = self.collection.update_one(
+            {'_id': ROLLUP_ID, f'{report}._id': bucket},
+            {'$inc': {f'{report}.$.count': amount, 'version': 1},
+             '$set': {'updated_at': datetime.now()}}
+        )
+        if result.matched_count:
+            return
+        result = self.collection.update_one(
+            {'_id': ROLLUP_ID, f'{report}._id': {'$ne': bucket}},
+            {'$push': {report: {'_id': bucket, 'count': amount}},
+             '$inc': {'version': 1},
+             '$set': {'updated_at': datetime.now()}}
+        )
+        if result.matched_count == 0:
+            # Otro request agregó el bucket entre las dos operaciones
+            self.collection.update_one(
+                {'_id': ROLLUP_ID, f'{report}._id': bucket},
+                {'$inc': {f'{report}.$.count': amount, 'version': 1}}
+            )
+
+    def _move(self, report, old_bucket, new_bucket):
+        if old_bucket != new_bucket:
+            self._inc(report, old_bucket, -1)
+            self._inc(report, new_bucket, 1)
+
+    def on_subject_added(self, subject):
+        self._inc('subjects_by_career', subject.get('career'), 1)
+        self._inc('subjects_by_slots', slots_bucket(subject.get('available_slots')), 1)
+
+    def on_subject_removed(self, subject):
+        self._inc('subjects_by_career', subject.get('career'), -1)
+        self._inc('subjects_by_slots', slots_bucket(subject.get('available_slots')), -1)
+
+    def on_subject_changed(self, old, new):
+        self._move('subjects_by_career', old.get('career'), new.get('career'))
+        self._move('subjects_by_slots',
+                   slots_bucket(old.get('available_slots')),
+                   slots_bucket(new.get('available_slots')))
+
+    def on_enrollment_changed(self, subject, slots_delta, credits_before, credits_after):
+        # Una matrícula mueve la materia de bucket de cupos y al estudiante
+        # de bucket de créditos
+        available = subject.get('available_slots')
+        self._move('subjects_by_slots',
+                   slots_bucket(available),
+                   slots_bucket(None if available is None else available + slots_delta))
+        self._move('students_by_credits',
+                   credits_bucket(credits_before),
+                   credits_bucket(credits_after))
+
+    def on_bulk_enrollment(self, result):
+        # Se suman los movimientos de todo el lote para hacer un $inc por bucket
+        moves = {'subjects_by_slots': Counter(), 'students_by_credits': Counter()}
+        for subject_id, taken in result.slots_taken.items():
+            available = result.subjects_before[subject_id].get('available_slots')
+            after = None if available is None else available - taken
+            moves['subjects_by_slots'][slots_bucket(available)] -= 1
+            moves['subjects_by_slots'][slots_bucket(after)] += 1
+        for student_id, added in result.credits_added.items():
+            before = result.credits_before[student_id]
+            moves['students_by_credits'][credits_bucket(before)] -= 1
+            moves['students_by_credits'][credits_bucket(before + added)] += 1
+        for report, counter in moves.items():
+            for bucket, amount in counter.items():
+                self._inc(report, bucket, amount)
+
+    def on_student_removed(self, credits_before):
+        self._inc('students_by_credits', credits_bucket(credits_before), -1)
@@ -0,0 +1,144 @@
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from pymongo import UpdateOne
+from fanout import fan_out
+from pagination import prefix_filter
+
+# Campos por los que se busca en cada colección y los que se devuelven
+SEARCH_FIELDS = {
+    'students': ('name', 'student_code', 'email'),
+    'teachers': ('name', 'email'),
+    'subjects': ('name', 'career', 'group')
+}
+RESULT_FIELDS = {
+    'students': ('name', 'student_code', 'email', 'photo'),
+    'teachers': ('name', 'email', 'photo'),
+    'subjects': ('name', 'career', 'group')
+}
+MAX_TERMS = 5
+FUZZY_CANDIDATES = 500
+FUZZY_MIN_SCORE = 0.8
+
+_separators = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text):
+    """Minúsculas y sin tildes: 'Gómez' y 'gomez' dan la misma clave."""
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower().strip()
+
+
+def search_keys(kind, document):
+    """Claves normalizadas de un documento: cada palabra y cada valor completo.
+
+    Se guardan en el arreglo `search_keys` con un índice multikey, así una
+    búsqueda por prefijo es una regex anclada que recorre sólo ese rango.
+    """
+    keys = set()
+    for field in SEARCH_FIELDS[kind]:
+        value = document.get(field)
+        if not value:
+            continue
+        value = normalize(value)
+        keys.add(value)
+        keys.update(word for word in _separators.split(value) if word)
+    return sorted(keys)
+
+
+def with_search_keys(kind, document):
+    document['search_keys'] = search_keys(kind, document)
+    return document
+
+
+def _terms(query):
+    return [term for term in _separators.split(normalize(query)) if term][:MAX_TERMS]
+
+
+def _filter(terms):
+    conditions = [{'search_keys': prefix_filter(term)} for term in terms]
+    if not conditions:
+        return {}
+    return conditions[0] if len(conditions) == 1 else {'$and': conditions}
+
+
+def search_filter(query):
+    """Filtro de Mongo que exige cada palabra de `query` como prefijo de search_keys."""
+    return _filter(_terms(query))
+
+
+def _similarity(term, keys):
+    # Compara el término con el comienzo de cada clave (la búsqueda es por prefijo)
+    return max((SequenceMatcher(None, term, key[:len(term)]).ratio() for key in keys), default=0)
+
+
+class Search:
+    """Búsqueda por prefijo (y tolerante a errores de tipeo) sobre search_keys.
+
+    Cada palabra de la consulta debe ser prefijo de alguna clave del documento.
+    Si no alcanza para `limit` resultados, se buscan candidatos que comparten
+    el comienzo de la palabra más larga y se ordenan por parecido.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def search(self, query, kinds=None, limit=10):
+        terms = _terms(query)
+        kinds = [kind for kind in (kinds or SEARCH_FIELDS) if kind in SEARCH_FIELDS]
+        if not terms or not kinds:
+            return {}
+        # Las colecciones se consultan en paralelo
+        return fan_out({kind: lambda kind=kind: self._search(kind, terms, limit)
+                        for kind in kinds})
+
+    def _search(self, kind, terms, limit):
+        projection = dict.fromkeys(RESULT_FIELDS[kind], 1)
+        results = list(self.db[kind].find(_filter(terms), projection).limit(limit))
+
+        # Primero los que empiezan con la consulta completa, luego por nombre
+        phrase = ' '.join(terms)
+        results.sort(key=lambda doc: (not normalize(doc.get('name', '')).startswith(phrase),
+                                      doc.get('name', '')))
+        if len(results) < limit:
+            results += self._fuzzy(kind, terms, limit - len(results),
+                                   [doc['_id'] for doc in results], projection)
+        return results
+
+    def _fuzzy(self, kind, terms, limit, exclude, projection):
+        longest = max(terms, key=len)
+        if len(longest) < 4:
+            return []
+        # Se asume correcta la primera mitad de la palabra para acotar el rango del índice
+        prefix = longest[:max(2, len(longest) // 2)]
+        candidates = self.db[kind].find(
+            {'search_keys': prefix_filter(prefix), '_id': {'$nin': exclude}},
+            dict(projection, search_keys=1)
+        ).limit(FUZZY_CANDIDATES)
+
+        scored = []
+        for doc in candidates:
+            keys = doc.pop('search_keys', [])
+            score = sum(_similarity(term, keys) for term in terms) / len(terms)
+            if score >= FUZZY_MIN_SCORE:
+                doc['fuzzy'] = True
+                scored.append((score, doc))
+        scored.sort(key=lambda item: -item[0])
+        return [doc for _, doc in scored[:limit]]
+
+
+def backfill_search_keys(db, batch_size=1000):
+    """Calcula search_keys en todos los documentos; devuelve cuántos se actualizaron."""
+    updated = 0
+    for kind, fields in SEARCH_FIELDS.items():
+        batch = []
+        for doc in db[kind].find({}, dict.fromkeys(fields + ('search_keys',), 1)):
+            keys = search_keys(kind, doc)
+            if doc.get('search_keys') != keys:
+                batch.append(UpdateOne({'_id': doc['_id']}, {'$set': {'search_keys': keys}}))
+            if len(batch) >= batch_size:
+                updated += db[kind].bulk_write(batch, ordered=False).modified_count
+                batch = []
+        if batch:
+            updated += db[kind].bulk_write(batch, ordered=False).modified_count
+    return updated
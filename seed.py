@@ -0,0 +1,178 @@
+import random
+from array import array
+from datetime import datetime, timedelta
+from bson import ObjectId
+from enrollment import MAX_CREDITS
+from search import with_search_keys
+
+FIRST_NAMES = ['Ana', 'Carlos', 'Diana', 'Eduardo', 'Felipe', 'Gabriela', 'Hugo', 'Isabel',
+               'Julián', 'Karen', 'Luis', 'María', 'Nicolás', 'Olga', 'Pedro', 'Sofía',
+               'Tomás', 'Valentina', 'Camilo', 'Laura']
+LAST_NAMES = ['Gómez', 'Rodríguez', 'Martínez', 'López', 'García', 'Pérez', 'Sánchez',
+              'Ramírez', 'Torres', 'Díaz', 'Vargas', 'Reyes', 'Moreno', 'Jiménez', 'Rojas']
+SUBJECT_NAMES = ['Cálculo', 'Álgebra', 'Física', 'Química', 'Programación', 'Estadística',
+                 'Bases de Datos', 'Redes', 'Anatomía', 'Derecho Civil', 'Contabilidad',
+                 'Economía', 'Dibujo', 'Psicología General', 'Ética', 'Inglés']
+TITLES = ['Pregrado', 'Especialización', 'Maestría', 'Doctorado']
+SCHEDULES = ['Lunes 7-9', 'Martes 9-11', 'Miércoles 11-13', 'Jueves 14-16', 'Viernes 16-18']
+GROUPS = 'ABCDEFGH'
+
+
+def _name(rng):
+    return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+
+def _insert(collection, docs, batch_size):
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+
+
+def plan_enrollments(rng, subject_credits, slots, students, enrollments, max_credits=MAX_CREDITS):
+    """Reparte las matrículas respetando cupos, créditos y una por par.
+
+    Recorre a los estudiantes en ronda y a cada uno le busca una materia al
+    azar con cupo que no tenga y que no lo pase de `max_credits`. Devuelve
+    dos arreglos paralelos (estudiante, materia) y los créditos por estudiante.
+    """
+    credits = array('i', [0]) * students
+    taken = [None] * students
+    student_idx, subject_idx = array('i'), array('i')
+    open_subjects = [i for i, free in enumerate(slots) if free > 0]
+    min_credits = min(subject_credits) if subject_credits else 0
+
+    # Estudiantes que todavía pueden sumar al menos la materia más liviana
+    active = list(range(students))
+    while len(student_idx) < enrollments and active and open_subjects:
+        before = len(student_idx)
+        still_active = []
+        for student in active:
+            if len(student_idx) >= enrollments or not open_subjects:
+                break
+            for _ in range(8):
+                pos = rng.randrange(len(open_subjects))
+                subject = open_subjects[pos]
+                if credits[student] + subject_credits[subject] > max_credits:
+                    continue
+                if taken[student] is not None and subject in taken[student]:
+                    continue
+                if taken[student] is None:
+                    taken[student] = set()
+                taken[student].add(subject)
+                credits[student] += subject_credits[subject]
+                slots[subject] -= 1
+                if slots[subject] == 0:
+                    open_subjects[pos] = open_subjects[-1]
+                    open_subjects.pop()
+                student_idx.append(student)
+                subject_idx.append(subject)
+                break
+            if credits[student] + min_credits <= max_credits:
+                still_active.append(student)
+        if len(student_idx) == before:
+            # Una ronda completa sin matrículas nuevas: no caben más
+            break
+        active = still_active
+    return student_idx, subject_idx, credits
+
+
+def seed_database(db, careers, teachers=100, subjects=200, students=2000, enrollments=8000,
+                  batch_size=5000, seed=42, drop=False, progress=None):
+    """Inserta datos sintéticos reproducibles y devuelve cuántos de cada tipo quedaron.
+
+    Los correos, códigos y (materia, grupo, carrera) son únicos, las
+    matrículas no pasan de MAX_CREDITS por estudiante ni del cupo de cada
+    materia, y `available_slots`/`enrolled_credits` quedan consistentes.
+    """
+    rng = random.Random(seed)
+    progress = progress or (lambda message: None)
+    if drop:
+        for name in ('teachers', 'subjects', 'students', 'enrollments'):
+            db[name].delete_many({})
+
+    # Las claves únicas llevan la semilla: otra semilla no choca con datos ya sembrados
+    tag = f'{seed:x}'
+    now = datetime.now()
+
+    teacher_ids = [ObjectId() for _ in range(teachers)]
+    subject_ids = [ObjectId() for _ in range(subjects)]
+    student_ids = [ObjectId() for _ in range(students)]
+
+    subject_credits = [rng.randint(2, 4) for _ in range(subjects)]
+    # Cupos suficientes para las matrículas pedidas, con holgura
+    average = -(-enrollments // subjects) if subjects else 0
+    total_slots = [rng.randint(max(average, 5), max(average, 5) * 3 // 2 + 1)
+                   for _ in range(subjects)]
+    slots = list(total_slots)
+    # Cada materia con un profesor; el profesor guarda también sus materias
+    subject_teacher = [rng.randrange(teachers) if teachers else None for _ in range(subjects)]
+    teacher_subjects = [[] for _ in range(teachers)]
+    for i, teacher in enumerate(subject_teacher):
+        if teacher is not None:
+            teacher_subjects[teacher].append(subject_ids[i])
+
+    progress('Planning enrollments...')
+    student_idx, subject_idx, credits = plan_enrollments(
+        rng, subject_credits, slots, students, enrollments
+    )
+
+    progress(f'Inserting {teachers} teachers...')
+    _insert(db['teachers'], (with_search_keys('teachers', {
+        '_id': teacher_ids[i],
+        'name': _name(rng),
+        'age': rng.randint(25, 70),
+        'email': f'teacher{i}.{tag}@seed.example',
+        'subject_ids': teacher_subjects[i],
+        'titles': rng.sample(TITLES, rng.randint(1, 3)),
+        'photo': None,
+        'created_at': now - timedelta(days=rng.randint(0, 365)),
+        'updated_at': now
+    }) for i in range(teachers)), batch_size)
+
+    progress(f'Inserting {subjects} subjects...')
+    careers_count = len(careers)
+    _insert(db['subjects'], (with_search_keys('subjects', {
+        '_id': subject_ids[i],
+        'name': f'{SUBJECT_NAMES[i % len(SUBJECT_NAMES)]} {i // (len(GROUPS) * careers_count)} {tag}',
+        'schedule': rng.choice(SCHEDULES),
+        'credits': subject_credits[i],
+        'group': GROUPS[i % len(GROUPS)],
+        'career': careers[(i // len(GROUPS)) % careers_count],
+        'total_slots': total_slots[i],
+        'available_slots': slots[i],
+        'teacher_id': teacher_ids[subject_teacher[i]] if teachers else None,
+        'created_at': now - timedelta(days=rng.randint(0, 365)),
+        'updated_at': now
+    }) for i in range(subjects)), batch_size)
+
+    progress(f'Inserting {students} students...')
+    _insert(db['students'], (with_search_keys('students', {
+        '_id': student_ids[i],
+        'name': _name(rng),
+        'student_code': f'S{tag}{i:07d}',
+        'email': f'student{i}.{tag}@seed.example',
+        'photo': None,
+        'enrolled_credits': credits[i],
+        'created_at': now - timedelta(days=rng.randint(0, 365)),
+        'updated_at': now
+    }) for i in range(students)), batch_size)
+
+    progress(f'Inserting {len(student_idx)} enrollments...')
+    _insert(db['enrollments'], ({
+        'student_id': student_ids[student_idx[i]],
+        'subject_id': subject_ids[subject_idx[i]],
+        'credits': subject_credits[subject_idx[i]],
+        'enrollment_date': now - timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+    } for i in range(len(student_idx))), batch_size)
+
+    return {
+        'teachers': teachers,
+        'subjects': subjects,
+        'students': students,
+        'enrollments': len(student_idx)
+    }
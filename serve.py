@@ -0,0 +1,274 @@
+"""Servidor de producción: N procesos worker con un pool de hilos cada uno.
+
+    python serve.py --workers 4 --threads 8 --bind 0.0.0.0:8000
+
+El proceso maestro abre el socket y hace fork de los workers; cada worker
+importa app.py y llama a create_app() *después* del fork, así que el cliente
+de MongoDB, sus hilos de monitoreo y los pools de hilos son propios de cada
+worker. El maestro nunca importa la aplicación.
+
+Señales del maestro: SIGTERM/SIGINT detienen todo esperando los requests en
+curso; SIGHUP levanta workers nuevos (con el código actual) y luego retira
+los viejos. Con --max-requests cada worker se recicla tras atender esa
+cantidad de requests.
+"""
+import argparse
+import atexit
+import importlib
+import os
+import random
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+# Un worker que termina con error antes de BOOT_SECONDS cuenta como fallo de
+# arranque: se espera cada vez más antes de reemplazarlo y, tras
+# MAX_BOOT_FAILURES seguidos, el maestro se detiene
+BOOT_SECONDS = 10
+MAX_BOOT_FAILURES = 10
+MAX_BACKOFF = 30
+
+
+class RequestHandler(WSGIRequestHandler):
+    # HTTP/1.0: la conexión se cierra con cada respuesta y un cliente inactivo
+    # no retiene uno de los hilos del pool
+    protocol_version = 'HTTP/1.0'
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Servidor WSGI de werkzeug que atiende cada conexión en un pool fijo de hilos.
+
+    Con todos los hilos ocupados deja de aceptar conexiones, y el kernel se
+    las entrega a otro worker que esté libre.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads=4, max_requests=0, fd=None):
+        super().__init__(host, port, app, handler=RequestHandler, fd=fd)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='request')
+        self.free = threading.BoundedSemaphore(threads)
+        self.max_requests = max_requests
+        self.handled = 0
+        self.stopping = False
+        # handle_request vuelve cada segundo para revisar si hay que parar
+        self.timeout = 1
+
+    def process_request(self, request, client_address):
+        self.handled += 1
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.free.release()
+
+    def serve(self, parent_pid=None):
+        while not self.stopping:
+            if self.max_requests and self.handled >= self.max_requests:
+                break
+            if parent_pid is not None and os.getppid() != parent_pid:
+                break  # El maestro murió
+            # Sin hilos libres no se acepta la siguiente conexión
+            if not self.free.acquire(timeout=1):
+                continue
+            try:
+                before = self.handled
+                self.handle_request()
+            finally:
+                if self.handled == before:
+                    self.free.release()  # Timeout sin conexión nueva
+        # Termina los requests en curso antes de salir
+        self.pool.shutdown(wait=True)
+        self.server_close()
+
+
+def load_app(spec):
+    """Importa la aplicación WSGI de 'modulo:app' o 'modulo:create_app()'.
+
+    Como en gunicorn, el objeto sólo se llama si el nombre termina en '()';
+    sin nombre se usa 'create_app()'.
+    """
+    module_name, _, attr = spec.partition(':')
+    attr = attr or 'create_app()'
+    factory = attr.endswith('()')
+    target = getattr(importlib.import_module(module_name), attr[:-2] if factory else attr)
+    return target() if factory else target
+
+
+def run_worker(args, listener, parent_pid):
+    # Ya en el proceso hijo: recién aquí se importa la app y se conecta a Mongo
+    # Ctrl+C y SIGHUP llegan a todo el grupo; sólo el maestro los atiende
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    app = load_app(args.app)
+    jitter = random.randint(0, args.max_requests_jitter) if args.max_requests else 0
+    server = PooledWSGIServer(args.host, args.port, app, threads=args.threads,
+                              max_requests=args.max_requests + jitter, fd=listener.fileno())
+
+    def stop(signum, frame):
+        server.stopping = True
+    signal.signal(signal.SIGTERM, stop)
+    server.serve(parent_pid)
+
+
+class Arbiter:
+    """Mantiene `workers` procesos vivos y los reemplaza cuando terminan."""
+
+    def __init__(self, args):
+        self.args = args
+        self.workers = {}  # pid -> generación
+        self.started = {}  # pid -> momento del fork
+        self.retiring = set()  # pids a los que el maestro pidió salir
+        self.generation = 0
+        self.running = True
+        self.failures = 0
+        self.next_spawn = 0
+        self.listener = socket.create_server((args.host, args.port), backlog=args.backlog)
+        self.listener.set_inheritable(True)
+
+    def spawn(self):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = self.generation
+            self.started[pid] = time.monotonic()
+            return
+        code = 0
+        try:
+            run_worker(self.args, self.listener, os.getppid())
+        except Exception:
+            import traceback
+            traceback.print_exc()
+            code = 1
+        finally:
+            # Los atexit del worker (p. ej. escribir el registro de eventos) y
+            # salida sin volver al código del maestro
+            atexit._run_exitfuncs()
+            os._exit(code)
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            self.workers.pop(pid, None)
+            lifetime = time.monotonic() - self.started.pop(pid, 0)
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+            elif os.waitstatus_to_exitcode(status) != 0 and lifetime < BOOT_SECONDS:
+                self.failures += 1
+                delay = min(0.5 * 2 ** self.failures, MAX_BACKOFF)
+                self.next_spawn = time.monotonic() + delay
+                print(f'Worker {pid} failed at startup ({self.failures} in a row); '
+                      f'retrying in {delay:.1f}s', file=sys.stderr, flush=True)
+            elif lifetime >= BOOT_SECONDS:
+                self.failures = 0
+
+    def kill_generation(self, generation, sig=signal.SIGTERM):
+        for pid, worker_generation in list(self.workers.items()):
+            if worker_generation <= generation:
+                self.retiring.add(pid)
+                try:
+                    os.kill(pid, sig)
+                except ProcessLookupError:
+                    self.workers.pop(pid, None)
+                    self.retiring.discard(pid)
+
+    def reload(self):
+        # Primero los workers nuevos, luego se retiran los viejos sin cortar requests
+        old = self.generation
+        self.generation += 1
+        for _ in range(self.args.workers):
+            self.spawn()
+        self.kill_generation(old)
+
+    def stop(self):
+        self.running = False
+        self.kill_generation(self.generation)
+        deadline = time.monotonic() + self.args.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        self.kill_generation(self.generation, signal.SIGKILL)
+        self.reap()
+
+    def run(self):
+        pending = []
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(sig, lambda signum, frame: pending.append(signum))
+        print(f'Listening on http://{self.args.host}:{self.args.port} '
+              f'({self.args.workers} workers x {self.args.threads} threads)', flush=True)
+
+        while self.running:
+            self.reap()
+            while pending:
+                signum = pending.pop(0)
+                if signum == signal.SIGHUP:
+                    print('Reloading workers', flush=True)
+                    self.reload()
+                else:
+                    self.stop()
+                    return 0
+            if self.failures >= MAX_BOOT_FAILURES:
+                print(f'Workers failed to start {self.failures} times in a row; exiting',
+                      file=sys.stderr, flush=True)
+                self.stop()
+                return 1
+            # Reemplaza los que salieron (max-requests, errores)
+            current = sum(1 for g in self.workers.values() if g == self.generation)
+            if current < self.args.workers and time.monotonic() >= self.next_spawn:
+                for _ in range(self.args.workers - current):
+                    self.spawn()
+            time.sleep(0.2)
+        return 0
+
+
+def parse_args(argv=None):
+    host, _, port = os.getenv('BIND', f"0.0.0.0:{os.getenv('PORT', 8000)}").rpartition(':')
+    parser = argparse.ArgumentParser(description='Servidor de producción de la aplicación')
+    parser.add_argument('--app', default=os.getenv('WSGI_APP', 'app:create_app()'),
+                        help="módulo:objeto WSGI, o módulo:fábrica() (por defecto app:create_app())")
+    parser.add_argument('--host', default=host or '0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(port))
+    parser.add_argument('-w', '--workers', type=int,
+                        default=int(os.getenv('WEB_WORKERS', os.cpu_count() or 1)))
+    parser.add_argument('-t', '--threads', type=int, default=int(os.getenv('WEB_THREADS', 4)))
+    parser.add_argument('--max-requests', type=int, default=int(os.getenv('MAX_REQUESTS', 0)),
+                        help='reciclar cada worker tras N requests (0 = nunca)')
+    parser.add_argument('--max-requests-jitter', type=int,
+                        default=int(os.getenv('MAX_REQUESTS_JITTER', 0)),
+                        help='variación al azar para que no se reciclen todos juntos')
+    parser.add_argument('--graceful-timeout', type=int,
+                        default=int(os.getenv('GRACEFUL_TIMEOUT', 30)))
+    parser.add_argument('--backlog', type=int, default=int(os.getenv('BACKLOG', 2048)))
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not hasattr(os, 'fork'):
+        # Windows: sin fork, un solo proceso con el pool de hilos
+        print('os.fork is not available; running a single worker', file=sys.stderr)
+        server = PooledWSGIServer(args.host, args.port, load_app(args.app), threads=args.threads)
+        print(f'Listening on http://{args.host}:{server.port} ({args.threads} threads)', flush=True)
+        try:
+            server.serve()
+        except KeyboardInterrupt:
+            server.stopping = True
+        return
+    sys.exit(Arbiter(args).run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+from cache import TTLCache, subscribe
+from fanout import fan_out
+
+DASHBOARD_COLLECTIONS = ('teachers', 'students', 'subjects', 'enrollments')
+RECENT_LIMIT = 5
+
+
+class DashboardSnapshot:
+    """Estadísticas y listas recientes del dashboard guardadas en memoria.
+
+    Cada sección (conteo o lista reciente de una colección) vence a los `ttl`
+    segundos o cuando una ruta de escritura avisa que la colección cambió.
+    Si el aviso trae `delta`, el conteo se ajusta sin volver a consultar.
+    """
+
+    def __init__(self, db, ttl=30, exact_counts=True):
+        self.db = db
+        self.exact_counts = exact_counts
+        self.cache = TTLCache(ttl)
+        subscribe(self.on_change)
+
+    def on_change(self, collection, delta=None):
+        if collection not in DASHBOARD_COLLECTIONS:
+            return
+        self.cache.delete(f'recent:{collection}')
+        if delta is None or not self.cache.update(f'count:{collection}', lambda n: max(n + delta, 0)):
+            self.cache.delete(f'count:{collection}')
+
+    def invalidate(self):
+        self.cache.clear()
+
+    def get(self):
+        sections = {f'count:{name}': lambda name=name: self._count(name)
+                    for name in DASHBOARD_COLLECTIONS}
+        sections.update({
+            'recent:teachers': self._recent_teachers,
+            'recent:students': lambda: self._recent('students'),
+            'recent:subjects': lambda: self._recent('subjects')
+        })
+        values = {key: self.cache.get(key) for key in sections}
+        
+        # Las secciones vencidas se consultan en paralelo
+        missing = {key: sections[key] for key, value in values.items() if value is None}
+        if missing:
+            for key, value in fan_out(missing).items():
+                self.cache.set(key, value)
+                values[key] = value
+        
+        return {
+            'stats': {name: values[f'count:{name}'] for name in DASHBOARD_COLLECTIONS},
+            'recent_teachers': values['recent:teachers'],
+            'recent_students': values['recent:students'],
+            'recent_subjects': values['recent:subjects']
+        }
+
+    def _count(self, name):
+        if self.exact_counts:
+            return self.db[name].count_documents({})
+        # Usa los metadatos de la colección en lugar de recorrerla
+        return self.db[name].estimated_document_count()
+
+    def _recent(self, name):
+        return list(self.db[name].find().sort('_id', -1).limit(RECENT_LIMIT))
+
+    def _recent_teachers(self):
+        # Ordenar y limitar antes del $lookup para unir sólo 5 profesores
+        return list(self.db['teachers'].aggregate([
+            {'$sort': {'_id': -1}},
+            {'$limit': RECENT_LIMIT},
+            {
+                '$lookup': {
+                    'from': 'subjects',
+                    'localField': 'subject_ids',
+                    'foreignField': '_id',
+                    'as': 'subjects'
+                }
+            },
+            {
+                '$addFields': {
+                    'subject_count': {'$size': '$subjects'}
+                }
+            },
+            {
+                '$project': {
+                    'name': 1,
+                    'email': 1,
+                    'created_at': 1,
+                    'subject_count': 1
+                }
+            }
+        ]))
@@ -59,4 +59,172 @@ document.querySelectorAll('form[data-confirm]').forEach(form => {
             e.preventDefault();
         }
     });
-});
\ No newline at end of file
+});
+// Búsqueda con autocompletado en la barra de navegación
+document.addEventListener('DOMContentLoaded', function() {
+    const input = document.getElementById('globalSearch');
+    const menu = document.getElementById('globalSearchResults');
+    if (!input || !menu) return;
+    
+    const titles = {students: 'Estudiantes', teachers: 'Profesores', subjects: 'Materias'};
+    let timer = null;
+    let controller = null;
+    
+    function escapeHtml(text) {
+        const div = document.createElement('div');
+        div.textContent = text;
+        return div.innerHTML;
+    }
+    
+    function render(results) {
+        let html = '';
+        Object.entries(results).forEach(([kind, items]) => {
+            if (!items.length) return;
+            html += `<h6 class="dropdown-header">${titles[kind] || kind}</h6>`;
+            items.forEach(item => {
+                html += `<a class="dropdown-item" href="${item.url}">` +
+                        `${escapeHtml(item.name)} <small class="text-muted">${escapeHtml(item.detail)}</small>` +
+                        (item.fuzzy ? ' <i class="bi bi-question-circle text-muted" title="Coincidencia aproximada"></i>' : '') +
+                        '</a>';
+            });
+        });
+        menu.innerHTML = html || '<span class="dropdown-item-text text-muted">Sin resultados</span>';
+        menu.classList.add('show');
+    }
+    
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        const query = input.value.trim();
+        if (query.length < 2) {
+            menu.classList.remove('show');
+            return;
+        }
+        // Espera a que se deje de escribir y cancela la búsqueda anterior
+        timer = setTimeout(() => {
+            if (controller) controller.abort();
+            controller = new AbortController();
+            fetch(`${input.dataset.searchUrl}?q=${encodeURIComponent(query)}`, {signal: controller.signal})
+                .then(response => response.json())
+                .then(data => render(data.results))
+                .catch(error => {
+                    if (error.name !== 'AbortError') menu.classList.remove('show');
+                });
+        }, 200);
+    });
+    
+    input.addEventListener('keydown', function(e) {
+        if (e.key === 'Enter') {
+            const first = menu.querySelector('a.dropdown-item');
+            if (first) window.location.href = first.href;
+            e.preventDefault();
+        } else if (e.key === 'Escape') {
+            menu.classList.remove('show');
+        }
+    });
+    
+    document.addEventListener('click', function(e) {
+        if (!menu.contains(e.target) && e.target !== input) menu.classList.remove('show');
+    });
+});
+
+// Selectores de materias y profesores con búsqueda incremental (macros/picker.html)
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('[data-picker]').forEach(picker => {
+        const name = picker.dataset.name;
+        const multiple = picker.dataset.multiple === 'true';
+        const selected = picker.querySelector('[data-picker-selected]');
+        const empty = picker.querySelector('[data-picker-empty]');
+        const search = picker.querySelector('[data-picker-search]');
+        const results = picker.querySelector('[data-picker-results]');
+        let timer = null;
+        let controller = null;
+        
+        function isSelected(id) {
+            return selected.querySelector(`[data-id="${id}"]`) !== null;
+        }
+        
+        function select(item) {
+            if (isSelected(item.id)) return;
+            if (!multiple) selected.innerHTML = '';
+            const badge = document.createElement('span');
+            badge.className = 'badge bg-primary me-1 mb-1';
+            badge.dataset.id = item.id;
+            badge.textContent = item.label + ' ';
+            const input = document.createElement('input');
+            input.type = 'hidden';
+            input.name = name;
+            input.value = item.id;
+            const remove = document.createElement('button');
+            remove.type = 'button';
+            remove.className = 'btn-close btn-close-white ms-1';
+            remove.setAttribute('aria-label', 'Quitar');
+            remove.dataset.pickerRemove = '';
+            badge.append(input, remove);
+            selected.append(badge);
+            if (empty) empty.disabled = true;
+        }
+        
+        function load(after) {
+            if (controller) controller.abort();
+            controller = new AbortController();
+            const params = new URLSearchParams({q: search.value.trim()});
+            if (after) params.set('after', after);
+            fetch(`${picker.dataset.url}?${params}`, {signal: controller.signal})
+                .then(response => response.json())
+                .then(data => {
+                    if (!after) results.innerHTML = '';
+                    const more = results.querySelector('[data-picker-more]');
+                    if (more) more.remove();
+                    data.items.forEach(item => {
+                        const option = document.createElement('button');
+                        option.type = 'button';
+                        option.className = 'dropdown-item' + (isSelected(item.id) ? ' active' : '');
+                        option.textContent = item.label;
+                        option.addEventListener('click', () => {
+                            select(item);
+                            option.classList.add('active');
+                            if (!multiple) results.classList.remove('show');
+                        });
+                        results.append(option);
+                    });
+                    if (data.next_cursor) {
+                        const next = document.createElement('button');
+                        next.type = 'button';
+                        next.className = 'dropdown-item text-primary';
+                        next.dataset.pickerMore = '';
+                        next.textContent = 'Cargar más...';
+                        next.addEventListener('click', () => load(data.next_cursor));
+                        results.append(next);
+                    }
+                    if (!results.children.length) {
+                        results.innerHTML = '<span class="dropdown-item-text text-muted">Sin resultados</span>';
+                    }
+                    results.classList.add('show');
+                })
+                .catch(error => {
+                    if (error.name !== 'AbortError') results.classList.remove('show');
+                });
+        }
+        
+        search.addEventListener('focus', () => load());
+        search.addEventListener('input', () => {
+            clearTimeout(timer);
+            timer = setTimeout(() => load(), 200);
+        });
+        search.addEventListener('keydown', e => {
+            // Enter no debe enviar el formulario mientras se busca
+            if (e.key === 'Enter') e.preventDefault();
+            if (e.key === 'Escape') results.classList.remove('show');
+        });
+        
+        selected.addEventListener('click', e => {
+            if (!e.target.matches('[data-picker-remove]')) return;
+            e.target.closest('[data-id]').remove();
+            if (empty && !selected.children.length) empty.disabled = false;
+        });
+        
+        document.addEventListener('click', e => {
+            if (!picker.contains(e.target)) results.classList.remove('show');
+        });
+    });
+});
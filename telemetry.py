@@ -0,0 +1,198 @@
+import logging
+import os
+import random
+import threading
+from datetime import datetime, timedelta
+from pymongo.errors import CollectionInvalid, PyMongoError
+from fanout import fan_out
+
+logger = logging.getLogger(__name__)
+
+SAMPLED_COLLECTIONS = ('teachers', 'students', 'subjects', 'enrollments')
+DB_STATS_FIELDS = ('db', 'collections', 'objects', 'dataSize', 'storageSize', 'indexSize')
+COLLECTION_STATS_FIELDS = ('count', 'size', 'avgObjSize', 'storageSize', 'totalIndexSize')
+OPCOUNTERS = ('insert', 'query', 'update', 'delete', 'getmore', 'command')
+CHART_POINTS = 120
+
+
+def _pick(document, fields):
+    # Las colecciones vacías no traen avgObjSize, etc.
+    return {field: document.get(field, 0) for field in fields}
+
+
+class DatabaseSampler:
+    """Toma muestras periódicas de las estadísticas de la base en segundo plano.
+
+    Cada `interval` segundos un hilo consulta en paralelo dbstats, collstats,
+    currentOp y serverStatus, y guarda el resultado en una colección capped
+    (la serie de tiempo queda acotada a `max_samples`). Con varios procesos
+    sólo se guarda una muestra por intervalo: si otro proceso ya la tomó, se
+    reutiliza. El mismo hilo refresca `status` (el db_status de las plantillas).
+    """
+
+    def __init__(self, client, db, collection='db_samples', interval=60,
+                 max_samples=2880, max_bytes=8 * 1024 * 1024, status=None):
+        self.client = client
+        self.db = db
+        self.collection = db[collection]
+        self.interval = interval
+        self.max_age = interval or 60
+        self.max_samples = max_samples
+        self.max_bytes = max_bytes
+        self.status = status if status is not None else {}
+        self._latest = None
+        self._ready = False
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def _ensure_collection(self):
+        if self._ready:
+            return
+        try:
+            self.db.create_collection(self.collection.name, capped=True,
+                                      size=self.max_bytes, max=self.max_samples)
+        except CollectionInvalid:
+            pass  # Ya existe
+        self._ready = True
+
+    def _server_status(self):
+        # Requiere el rol clusterMonitor; sin permisos la muestra va sin opcounters
+        try:
+            return self.client.admin.command('serverStatus')
+        except PyMongoError:
+            return None
+
+    def collect(self):
+        """Consulta las estadísticas en paralelo y devuelve la muestra (sin guardarla)."""
+        queries = {
+            'active_ops': lambda: len(self.client.admin.command('currentOp', active=True)['inprog']),
+            'db_stats': lambda: self.db.command('dbstats'),
+            'server_status': self._server_status
+        }
+        for name in SAMPLED_COLLECTIONS:
+            queries[name] = lambda name=name: self.db.command('collstats', name)
+        results = fan_out(queries)
+
+        server_status = results['server_status'] or {}
+        return {
+            'taken_at': datetime.now(),
+            'db_stats': _pick(results['db_stats'], DB_STATS_FIELDS),
+            'collections': {name: _pick(results[name], COLLECTION_STATS_FIELDS)
+                            for name in SAMPLED_COLLECTIONS},
+            'active_ops': results['active_ops'],
+            'opcounters': server_status.get('opcounters'),
+            'connections': server_status.get('connections')
+        }
+
+    def sample(self):
+        """Toma una muestra, la guarda y la deja como la más reciente."""
+        sample = self.collect()
+        self._ensure_collection()
+        self.collection.insert_one(sample)
+        self._latest = sample
+        return sample
+
+    def latest(self):
+        """La muestra más reciente si no tiene más de un intervalo; si no, None."""
+        limit = datetime.now() - timedelta(seconds=self.max_age)
+        sample = self._latest
+        if sample is None or sample['taken_at'] < limit:
+            sample = self.collection.find_one(sort=[('$natural', -1)])
+            if sample is not None:
+                self._latest = sample
+        if sample is None or sample['taken_at'] < limit:
+            return None
+        return sample
+
+    def history(self, hours=24, points=CHART_POINTS):
+        """Muestras de las últimas `hours` horas, reducidas a unos `points` puntos."""
+        samples = list(self.collection.find(
+            {'taken_at': {'$gte': datetime.now() - timedelta(hours=hours)}},
+            {'taken_at': 1, 'collections': 1, 'opcounters': 1, 'active_ops': 1}
+        ).sort('$natural', 1))
+        step = max(len(samples) // points, 1)
+        reduced = samples[::step]
+        if samples and reduced[-1] is not samples[-1]:
+            reduced.append(samples[-1])
+        return reduced
+
+    def refresh_status(self):
+        try:
+            self.client.admin.command('ping')
+            if not self.status.get('connected') or 'server_info' not in self.status:
+                self.status['server_info'] = self.client.server_info()
+            self.status.pop('error', None)
+            self.status['connected'] = True
+        except PyMongoError as e:
+            self.status['connected'] = False
+            self.status['error'] = str(e)
+        self.status['last_check'] = datetime.now()
+
+    def tick(self):
+        self.refresh_status()
+        # Otro proceso pudo haber tomado la muestra de este intervalo
+        if self.status['connected'] and self.latest() is None:
+            self.sample()
+
+    def _run(self):
+        # El desfase inicial evita que todos los workers muestreen a la vez
+        delay = random.uniform(0, min(self.interval, 5))
+        while not self._stop.wait(delay):
+            try:
+                self.tick()
+            except Exception:
+                logger.exception('Database sampling failed')
+            delay = self.interval
+
+    def ensure_started(self):
+        # Se llama en cada request; después de un fork el hilo no existe en el hijo
+        if not self.interval:
+            return
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._stop.clear()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='db-sampler', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+def growth_series(samples):
+    """Documentos por colección en cada muestra, listo para Chart.js."""
+    return {
+        'labels': [sample['taken_at'].strftime('%d/%m %H:%M') for sample in samples],
+        'datasets': {name: [sample['collections'].get(name, {}).get('count', 0)
+                            for sample in samples]
+                     for name in SAMPLED_COLLECTIONS}
+    }
+
+
+def operation_rates(samples):
+    """Operaciones por segundo entre muestras consecutivas, a partir de opcounters.
+
+    Los contadores son acumulados desde que arrancó el servidor; si bajan (el
+    servidor se reinició) ese tramo se omite.
+    """
+    labels, datasets = [], {op: [] for op in OPCOUNTERS}
+    previous = None
+    for sample in samples:
+        counters = sample.get('opcounters')
+        if not counters:
+            previous = None
+            continue
+        if previous is not None:
+            seconds = (sample['taken_at'] - previous['taken_at']).total_seconds()
+            deltas = {op: counters.get(op, 0) - previous['opcounters'].get(op, 0)
+                      for op in OPCOUNTERS}
+            if seconds > 0 and all(delta >= 0 for delta in deltas.values()):
+                labels.append(sample['taken_at'].strftime('%d/%m %H:%M'))
+                for op in OPCOUNTERS:
+                    datasets[op].append(round(deltas[op] / seconds, 2))
+        previous = sample
+    return {'labels': labels, 'datasets': datasets}
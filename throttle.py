@@ -0,0 +1,43 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenBucket:
+    """Límite de intentos por clave (usuario, IP) con el algoritmo token bucket.
+
+    Cada clave empieza con `burst` fichas y recupera `rate` fichas por
+    segundo; cada intento gasta una. Se guardan como mucho `max_keys` claves
+    (las menos recientes se olvidan, que equivale a tener el bucket lleno).
+    """
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _refill(self, key, now):
+        tokens, updated = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        return tokens
+
+    def consume(self, key):
+        """Gasta una ficha; devuelve 0 si se permite o los segundos a esperar."""
+        now = time.monotonic()
+        with self._lock:
+            tokens = self._refill(key, now)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
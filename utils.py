@@ -1,11 +1,11 @@
+import io
 import os
-from werkzeug.utils import secure_filename
-from PIL import Image, ImageDraw, ImageFont
-import random
-import string
-from io import BytesIO
-import base64
-from datetime import datetime
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from flask import current_app
+from cache import notify_change
+from PIL import Image, ImageDraw, ImageFont, ImageOps
 
 def allowed_file(filename, extensions=None):
     if extensions is None:
@@ -13,66 +13,217 @@ def allowed_file(filename, extensions=None):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in extensions
 
+# Variantes cuadradas de cada foto subida: `thumb` para las listas (50px en
+# pantalla, 2x para pantallas de alta densidad) y `profile` para las fichas
+PHOTO_SIZES = {'thumb': 100, 'profile': 400}
+PHOTO_FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+MAX_PHOTO_SIDE = 1600
+
+_image_pool = None
+
+
+def photo_variant_name(photo, size, fmt):
+    return f"{photo.rsplit('.', 1)[0]}_{size}.{fmt}"
+
+
+def _image_executor():
+    global _image_pool
+    if _image_pool is None:
+        _image_pool = ThreadPoolExecutor(
+            max_workers=int(os.getenv('IMAGE_WORKERS', 2)),
+            thread_name_prefix='photo-variants'
+        )
+    return _image_pool
+
+
+def _atomic_save(img, filepath, format, **options):
+    tmp_path = f"{filepath}.{os.getpid()}.tmp"
+    img.save(tmp_path, format=format, **options)
+    os.replace(tmp_path, filepath)
+
+
 def save_uploaded_file(file, upload_folder=None):
+    """Guarda una foto subida sin metadatos EXIF y encola sus variantes.
+
+    El nombre sale del hash del contenido, así que subir la misma imagen dos
+    veces reutiliza el archivo y sus variantes. Las miniaturas se generan en
+    un pool de hilos para no bloquear el request.
+    """
     if upload_folder is None:
         upload_folder = current_app.config['UPLOAD_FOLDER']
     
     if not os.path.exists(upload_folder):
         os.makedirs(upload_folder)
     
-    # Generar un nombre de archivo seguro y único
-    filename = secure_filename(file.filename)
-    unique_filename = f"{datetime.now().timestamp()}_{filename}"
+    data = file.read()
+    extension = file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else 'png'
+    if extension == 'jpeg':
+        extension = 'jpg'
+    filename = f"{hashlib.sha256(data).hexdigest()[:32]}.{extension}"
     
-    filepath = os.path.join(upload_folder, unique_filename)
-    file.save(filepath)
+    filepath = os.path.join(upload_folder, filename)
+    if not os.path.exists(filepath):
+        try:
+            img = Image.open(io.BytesIO(data))
+            format = img.format
+            # Aplicar la orientación del EXIF antes de descartarlo
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((MAX_PHOTO_SIDE, MAX_PHOTO_SIDE))
+        except Exception:
+            raise ValueError('The uploaded file is not a valid image')
+        if format == 'JPEG' and img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        # Al guardar sin pasar exif= la imagen queda sin metadatos
+        _atomic_save(img, filepath, format)
     
-    return unique_filename
+    if not os.path.exists(os.path.join(upload_folder, photo_variant_name(filename, 'profile', 'jpg'))):
+        _image_executor().submit(generate_photo_variants, filename, upload_folder)
+    return filename
 
-def generate_avatar(name, size=200):
-    # Create a simple avatar with initials
-    bg_color = (
-        random.randint(100, 200),
-        random.randint(100, 200),
-        random.randint(100, 200)
-    )
+
+def generate_photo_variants(photo, upload_folder):
+    with Image.open(os.path.join(upload_folder, photo)) as source:
+        img = source.convert('RGBA')
+    # Fondo blanco para las imágenes con transparencia
+    background = Image.new('RGB', img.size, (255, 255, 255))
+    background.paste(img, mask=img.split()[3])
     
+    for size, pixels in PHOTO_SIZES.items():
+        variant = ImageOps.fit(background, (pixels, pixels), Image.LANCZOS)
+        # El JPEG se escribe al final: su existencia indica que la variante está lista
+        _atomic_save(variant, os.path.join(upload_folder, photo_variant_name(photo, size, 'webp')),
+                     'WEBP', quality=80, method=4)
+        _atomic_save(variant, os.path.join(upload_folder, photo_variant_name(photo, size, 'jpg')),
+                     'JPEG', quality=85, optimize=True, progressive=True)
+    # Las páginas cacheadas que usaban el original pasan a usar las miniaturas
+    notify_change('photos')
+
+
+def delete_photo(photo, upload_folder):
+    paths = [photo] + [
+        photo_variant_name(photo, size, fmt) for size in PHOTO_SIZES for fmt in PHOTO_FORMATS
+    ]
+    for path in paths:
+        path = os.path.join(upload_folder, path)
+        if os.path.exists(path):
+            os.remove(path)
+
+# Paleta fija: el color sale del nombre, así que los avatares se repiten
+# y se pueden reutilizar en lugar de generar un archivo por persona
+AVATAR_COLORS = [
+    (231, 76, 60), (230, 126, 34), (241, 196, 15), (46, 204, 113),
+    (26, 188, 156), (52, 152, 219), (155, 89, 182), (52, 73, 94),
+    (22, 160, 133), (39, 174, 96), (41, 128, 185), (142, 68, 173)
+]
+AVATAR_FOLDER = os.path.join('static', 'avatars')
+
+_font = None
+_font_size = None
+_avatar_pool = None
+
+
+def _get_font(size):
+    # La fuente se carga una sola vez por proceso
+    global _font, _font_size
+    if _font is None or _font_size != size:
+        try:
+            _font = ImageFont.truetype("arial.ttf", size)
+        except OSError:
+            _font = ImageFont.load_default()
+        _font_size = size
+    return _font
+
+
+def avatar_key(name, size=200):
     # Get initials
     initials = ''.join([part[0].upper() for part in name.split()[:2]])
     if not initials:
         initials = 'AV'
     
+    digest = hashlib.sha1(name.strip().lower().encode('utf-8')).digest()
+    bg_color = AVATAR_COLORS[digest[0] % len(AVATAR_COLORS)]
+    
+    key = hashlib.sha1(f'{initials}|{bg_color}|{size}'.encode('utf-8')).hexdigest()[:16]
+    return f"avatar_{key}.png", initials, bg_color
+
+
+def render_avatar(filename, initials, bg_color, size=200, folder=AVATAR_FOLDER):
+    filepath = os.path.join(folder, filename)
+    if os.path.exists(filepath):
+        return filename
+    
     # Create image
     img = Image.new('RGB', (size, size), bg_color)
     draw = ImageDraw.Draw(img)
-    
-    try:
-        font = ImageFont.truetype("arial.ttf", size//2)
-    except:
-        font = ImageFont.load_default()
+    font = _get_font(size // 2)
     
     # Calculate text position
-    text_width, text_height = draw.textsize(initials, font=font)
-    position = ((size - text_width) // 2, (size - text_height) // 2)
+    left, top, right, bottom = draw.textbbox((0, 0), initials, font=font)
+    position = ((size - (right - left)) // 2 - left, (size - (bottom - top)) // 2 - top)
     
     # Draw text
     draw.text(position, initials, fill=(255, 255, 255), font=font)
     
-    # Save to bytes
-    buffered = BytesIO()
-    img.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
+    if not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
     
-    # Generate filename
-    random_str = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
-    filename = f"avatar_{random_str}.png"
-    
-    # Save to file if needed
-    filepath = os.path.join('static', 'avatars', filename)
-    if not os.path.exists(os.path.dirname(filepath)):
-        os.makedirs(os.path.dirname(filepath))
+    # Escribir a un temporal y renombrar para que dos procesos no dejen
+    # un archivo a medias
+    tmp_path = f"{filepath}.{os.getpid()}.tmp"
+    img.save(tmp_path, format="PNG")
+    os.replace(tmp_path, filepath)
+    return filename
+
+
+def generate_avatar(name, size=200):
+    filename, initials, bg_color = avatar_key(name, size)
+    return render_avatar(filename, initials, bg_color, size)
+
+
+def _init_avatar_worker(size):
+    _get_font(size // 2)
+
+
+def _avatar_pool_executor(size):
+    global _avatar_pool
+    workers = int(os.getenv('AVATAR_WORKERS', os.cpu_count() or 1))
+    if workers <= 1:
+        return None
+    if _avatar_pool is None:
+        # spawn evita heredar hilos y conexiones de Mongo del proceso web
+        _avatar_pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_avatar_worker,
+            initargs=(size,)
+        )
+    return _avatar_pool
+
+
+def generate_avatars(names, size=200):
+    """Genera los avatares de varios nombres en paralelo.
+
+    Cada avatar se identifica por un hash de sus iniciales y color, así que
+    los repetidos o ya existentes en disco no se vuelven a dibujar.
+    Devuelve los nombres de archivo en el mismo orden que `names`.
+    """
+    keys = [avatar_key(name, size) for name in names]
+    missing = {
+        filename: (initials, bg_color)
+        for filename, initials, bg_color in keys
+        if not os.path.exists(os.path.join(AVATAR_FOLDER, filename))
+    }
     
-    with open(filepath, 'wb') as f:
-        f.write(buffered.getvalue())
+    pool = _avatar_pool_executor(size) if len(missing) > 1 else None
+    if pool is None:
+        for filename, (initials, bg_color) in missing.items():
+            render_avatar(filename, initials, bg_color, size)
+    else:
+        futures = [
+            pool.submit(render_avatar, filename, initials, bg_color, size)
+            for filename, (initials, bg_color) in missing.items()
+        ]
+        for future in futures:
+            future.result()
     
-    return filename
\ No newline at end of file
+    return [filename for filename, _, _ in keys]